@@ -5,21 +5,39 @@ from flask_mail import Mail
 from flask_cors import CORS
 
 from app.instance.config import app_config
+from app.mail_queue import MailQueue
+from app.metrics import metrics
 from app.models.event import Event
+from app.passwords import password_hasher
+from app.replicas import replica_router
+from app.response_cache import response_cache
+from app.search import search_index
 
 mail = Mail()
+mail_queue = MailQueue(mail)
 
 
 def create_app(config_name):
     app = Flask(__name__, instance_relative_config=True)
     CORS(app)
     app.config.from_object(app_config[config_name])
+    # First so that its after_request handler runs last and times the others too
+    metrics.init_app(app)
     db.init_app(app)
     mail.init_app(app)
+    mail_queue.init_app(app)
+    search_index.init_app(app)
+    password_hasher.init_app(app)
+    token_cache.init_app(app)
+    revocation_set.init_app(app)
+    response_cache.init_app(app)
+    replica_router.init_app(app)
     app.register_blueprint(auth_blueprint, url_prefix='/api/auth')
     app.register_blueprint(event_blueprint, url_prefix='/api')
     return app
 
 
 from app.auth import auth as auth_blueprint
+from app.auth.revocation import revocation_set
+from app.auth.token_cache import token_cache
 from app.events import event as event_blueprint
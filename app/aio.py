@@ -0,0 +1,275 @@
+"""
+Asyncio variant of the read only event endpoints, served as an ASGI application: uvicorn asgi:app
+The listing, search, single event and attendee endpoints answer exactly as the flask views do but wait for
+Postgres through an asyncpg pool of their own, so one process keeps thousands of requests in flight instead of one per
+thread. Queries are built from the same models, pagination and serializers as the views and compiled for asyncpg.
+Streaming exports, conditional requests and the response cache stay with the WSGI application
+"""
+import asyncio
+import re
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import parse_qsl
+
+import asyncpg
+import jwt
+from sqlalchemy.dialects import postgresql
+from werkzeug.datastructures import MultiDict
+
+from app.auth.revocation import revocation_set
+from app.auth.token_cache import token_cache
+from app.events.pagination import (decode_cursor, decode_id_cursor, dated_page_query, id_keyset_query,
+                                   id_keyset_result, keyset_result, undated_page_query)
+from app.events.serializers import encode_json, event_rows, serialize_events, serialize_event
+from app.events.views import MAX_PAGE_SIZE, page_window
+from app.init_db import db
+from app.instance.config import BaseConfig
+from app.models.event import Event, EventCounter
+from app.models.user import User
+from app.search import search_index
+
+DIALECT = postgresql.dialect(paramstyle='numeric')
+NUMERIC_PARAMETER = re.compile(r'(?<!:):(\d+)')
+# The /page=<page>&limit=<limit> suffixes of the flask routes
+PAGE_ROUTE = r'(?:/page=(?P<page>\d+)(?:&limit=(?P<limit>\d+))?)?$'
+
+
+@lru_cache(maxsize=64)
+def row_type(keys):
+    return namedtuple('Row', keys)
+
+
+class Request(object):
+    """ What the handlers need from an ASGI http scope """
+
+    def __init__(self, scope):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+
+
+class Database(object):
+    """ asyncpg pool running SQLAlchemy queries """
+
+    def __init__(self, uri, min_size, max_size, statement_cache_size=100):
+        self.uri = uri
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_cache_size = statement_cache_size
+        self.pool = None
+
+    async def connect(self):
+        # asyncpg takes libpq urls, not SQLAlchemy's postgresql+driver:// ones
+        self.pool = await asyncpg.create_pool(re.sub(r'^postgresql\+\w+://', 'postgresql://', self.uri),
+                                              min_size=self.min_size, max_size=self.max_size,
+                                              statement_cache_size=self.statement_cache_size)
+
+    async def close(self):
+        await self.pool.close()
+
+    @staticmethod
+    def compile(query):
+        """
+        Turn a query or select into asyncpg's SQL with $n parameters and their values
+        :param query:
+        :return:
+        """
+        statement = getattr(query, 'statement', query)
+        compiled = statement.compile(dialect=DIALECT)
+        params = compiled.construct_params()
+        return NUMERIC_PARAMETER.sub(r'$\1', compiled.string), [params[name] for name in compiled.positiontup]
+
+    async def fetch(self, query):
+        """ Rows of the query as named tuples, like those of Query.all() """
+        sql, params = self.compile(query)
+        records = await self.pool.fetch(sql, *params)
+        if not records:
+            return []
+        row = row_type(tuple(records[0].keys()))
+        return [row(*record.values()) for record in records]
+
+    async def first(self, query):
+        rows = await self.fetch(query.limit(1))
+        return rows[0] if rows else None
+
+    async def scalar(self, query):
+        sql, params = self.compile(query)
+        return await self.pool.fetchval(sql, *params)
+
+
+class EventsASGI(object):
+    """ ASGI application of the read only event endpoints """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        config = flask_app.config
+        # asyncpg caches prepared statements per connection, which pgbouncer in transaction mode could hand to
+        # another backend between transactions
+        pgbouncer = config.get('SQLALCHEMY_POOL_MODE', 'queue') == 'pgbouncer'
+        self.db = Database(config['SQLALCHEMY_DATABASE_URI'], config.get('ASYNC_POOL_MIN_SIZE', 2),
+                           config.get('ASYNC_POOL_MAX_SIZE', 20), statement_cache_size=0 if pgbouncer else 100)
+        self.app_context = None
+        self.routes = [
+            ('GET', re.compile(r'/api/events' + PAGE_ROUTE), self.get_all_events),
+            ('POST', re.compile(r'/api/search' + PAGE_ROUTE), self.combined_search),
+            ('GET', re.compile(r'/api/event/(?P<event_id>\d+)$'), self.get_user_specific_event),
+            ('GET', re.compile(r'/api/event/(?P<event_id>\d+)/rsvp$'), self.get_attendees),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        request = Request(scope)
+        status, payload = await self.dispatch(request)
+        body = (encode_json(payload) + '\n').encode()
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # The handlers all run on the loop's thread, they share one application context
+                self.app_context = self.flask_app.app_context()
+                self.app_context.push()
+                await self.db.connect()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.db.close()
+                self.app_context.pop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def dispatch(self, request):
+        for method, pattern, handler in self.routes:
+            match = pattern.match(request.path)
+            if match:
+                if request.method != method:
+                    return 405, {'message': 'The method is not allowed for the requested URL.'}
+                kwargs = {key: int(value) for key, value in match.groupdict().items() if value is not None}
+                return await handler(request, **kwargs)
+        return 404, {'message': 'The requested URL was not found on the server.'}
+
+    async def run_sync(self, func, *args):
+        """ Run blocking code in a thread with an application context of its own, which removes its session """
+        def call():
+            with self.flask_app.app_context():
+                return func(*args)
+        return await asyncio.get_event_loop().run_in_executor(None, call)
+
+    async def authenticate(self, request):
+        """
+        The asyncio counterpart of token_required
+        :param request:
+        :return: the user id or None, and the error response when there is no valid token
+        """
+        header = request.headers.get('authorization')
+        token = header.replace('Bearer ', '') if header else None
+        if not token:
+            return None, (401, {'message': 'Token is missing'})
+        if revocation_set.refresh_due():
+            await self.run_sync(revocation_set.refresh)
+        if revocation_set.is_revoked(token):
+            return None, (401, {'message': 'You are logged out. Please login again to continue'})
+        cached = token_cache.get(token)
+        if cached is not None:
+            return cached[1]['id'], None
+        try:
+            data = jwt.decode(token, BaseConfig.SECRET_KEY)
+        except jwt.InvalidTokenError:
+            return None, (401, {'message': 'Token is invalid'})
+        if isinstance(data, str) or 'id' not in data:
+            return None, (401, {'message': 'Token is invalid'})
+        row = await self.db.first(db.session.query(User.id, User.username, User.email, User.is_admin).filter_by(
+            id=data['id']))
+        if row is None:
+            return None, (401, {'message': 'Token is invalid'})
+        token_cache.put(token, data, User.from_snapshot(row._asdict()))
+        return row.id, None
+
+    async def paginated_events(self, request, query, limit, page):
+        """ paginated_events of the views """
+        page, limit = page_window(request.args, page, limit)
+        if 'cursor' not in request.args:
+            return await self.db.fetch(query.order_by(Event.id).offset((page - 1) * limit).limit(limit)), None
+        token = request.args['cursor']
+        cursor = decode_cursor(token) if token else None
+        rows = []
+        if cursor is None or cursor[0] is not None:
+            rows = await self.db.fetch(dated_page_query(query, cursor, limit))
+        if len(rows) <= limit:
+            rows += await self.db.fetch(undated_page_query(query, cursor, limit - len(rows)))
+        return keyset_result(rows, limit)
+
+    async def get_all_events(self, request, limit=6, page=1):
+        try:
+            rows, next_cursor = await self.paginated_events(request, event_rows(Event.query), limit, page)
+        except ValueError as e:
+            return 400, {'message': str(e)}
+        if rows:
+            return 200, {'events': serialize_events(rows), 'next_cursor': next_cursor}
+        return 404, {'Message': 'No Events Found'}
+
+    async def combined_search(self, request, limit=9, page=1):
+        q = request.args.get('q')
+        if q:
+            try:
+                event_ids, total = await self.run_sync(search_index.search, q, page, limit)
+            except ValueError as e:
+                return 400, {'message': str(e)}
+            rows = []
+            if event_ids:
+                found = {row.id: row for row in await self.db.fetch(
+                    event_rows(Event.query.filter(Event.id.in_(event_ids))))}
+                rows = [found[event_id] for event_id in event_ids if event_id in found]
+            if rows:
+                return 200, {'events': serialize_events(rows), 'total': total}
+            return 404, {'message': 'No such event Found'}
+        if request.args.get('stream'):
+            return 400, {'message': 'Streams are only served by the WSGI application'}
+        try:
+            rows, next_cursor = await self.paginated_events(request, event_rows(Event.query), limit, page)
+        except ValueError as e:
+            return 400, {'message': str(e)}
+        if rows:
+            return 200, {'events': serialize_events(rows), 'next_cursor': next_cursor}
+        return 404, {'message': 'No Events Found'}
+
+    async def get_user_specific_event(self, request, event_id):
+        user_id, error = await self.authenticate(request)
+        if error:
+            return error
+        row = await self.db.first(event_rows(Event.query.filter_by(id=event_id).filter_by(owner=user_id)))
+        if row:
+            return 200, {'event': serialize_event(row)}
+        total = await self.db.scalar(db.session.query(EventCounter.total).filter_by(
+            scope=EventCounter.owner_scope(user_id)))
+        if total:
+            return 404, {'warning': 'There is no such event'}
+        return 200, {'Info': 'No Events Found'}
+
+    async def get_attendees(self, request, event_id):
+        """ The GET of rsvp_event, the attendees of one of the user's events paged by user id """
+        user_id, error = await self.authenticate(request)
+        if error:
+            return error
+        event_found = await self.db.first(db.session.query(Event.rsvp_count).filter_by(id=event_id).filter_by(
+            owner=user_id))
+        if not event_found:
+            return 404, {'Warning': 'The event you are to view a reservations for does not exist'}
+        if request.args.get('stream'):
+            return 400, {'message': 'Streams are only served by the WSGI application'}
+        try:
+            limit = max(1, min(request.args.get('limit', MAX_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+            token = request.args.get('cursor')
+            query = id_keyset_query(User.attendees(event_id), User.rsvps.c.user_id,
+                                    decode_id_cursor(token) if token else None, limit)
+            rows, next_cursor = id_keyset_result(await self.db.fetch(query), User.rsvps.c.user_id, limit)
+        except ValueError as e:
+            return 400, {'message': str(e)}
+        reservations = [{'username': row.username, 'email': row.email} for row in rows]
+        return 200, {'Attendants': reservations, 'next_cursor': next_cursor, 'rsvp_count': event_found.rsvp_count}
@@ -0,0 +1,91 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app.init_db import db
+from app.models.user import BlacklistToken, token_digest
+
+# Rows are re-read from slightly below the highest id seen because ids are handed out before the inserting
+# transactions commit, so a concurrent logout can become visible with an id lower than one already loaded
+REFRESH_OVERLAP = 100
+
+
+class RevocationSet(object):
+    """
+    In memory set of the digests of revoked tokens so that the common "not revoked" answer never touches the
+    database. Each process loads the set on first use and then only fetches the rows added since, at most every
+    REVOCATION_REFRESH_INTERVAL seconds. Rows older than the longest token lifetime are pruned every
+    REVOCATION_PRUNE_INTERVAL seconds since the tokens they revoke have expired by then
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['revocation_set'] = {
+            'digests': set(),
+            'last_id': None,
+            'refreshed_at': 0,
+            'pruned_at': time.monotonic(),
+            'lock': threading.Lock(),
+        }
+
+    @property
+    def _state(self):
+        return current_app.extensions['revocation_set']
+
+    def refresh_due(self):
+        return time.monotonic() - self._state['refreshed_at'] >= current_app.config.get('REVOCATION_REFRESH_INTERVAL', 5)
+
+    def is_revoked(self, token):
+        if self.refresh_due():
+            self.refresh()
+        return token_digest(token) in self._state['digests']
+
+    def revoke(self, token):
+        """
+        Blacklist the token in the database and in this process straight away
+        :param token:
+        :return:
+        """
+        blacklist_token = BlacklistToken(token=token)
+        db.session.add(blacklist_token)
+        db.session.commit()
+        state = self._state
+        # Under the lock so that a reload running meanwhile cannot swap in a set without it
+        with state['lock']:
+            state['digests'].add(blacklist_token.token_hash)
+
+    def refresh(self):
+        """
+        Load the digests blacklisted since the last refresh. The first call and the calls that prune load all of them
+        into a new set which replaces the old one once it is complete, is_revoked reads the set without the lock
+        """
+        state = self._state
+        with state['lock']:
+            reload = state['last_id'] is None
+            if time.monotonic() - state['pruned_at'] >= current_app.config.get('REVOCATION_PRUNE_INTERVAL', 3600):
+                self.prune()
+                reload = True
+            digests, last_id = (set(), None) if reload else (state['digests'], state['last_id'])
+            query = db.session.query(BlacklistToken.id, BlacklistToken.token_hash)
+            if last_id is not None:
+                query = query.filter(BlacklistToken.id > last_id - REFRESH_OVERLAP)
+            for row_id, token_hash in query:
+                digests.add(token_hash)
+                last_id = max(row_id, last_id or 0)
+            state['digests'], state['last_id'] = digests, last_id
+            state['refreshed_at'] = time.monotonic()
+
+    def prune(self):
+        """ Delete the rows of tokens that have expired, the caller reloads the set without them """
+        lifetime = timedelta(hours=current_app.config.get('JWT_LIFETIME_HOURS', 720))
+        BlacklistToken.prune(datetime.utcnow() - lifetime)
+        db.session.commit()
+        self._state['pruned_at'] = time.monotonic()
+
+
+revocation_set = RevocationSet()
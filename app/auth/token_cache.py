@@ -0,0 +1,73 @@
+import threading
+import time
+
+from flask import current_app
+
+from app.cache import TTLCache
+from app.models.user import token_digest
+
+
+class TokenCache(object):
+    """
+    Remembers tokens that have already been verified in this process together with the decoded claims and a
+    snapshot of their user, so that repeated requests skip jwt.decode and the user query.
+    An entry never outlives the token's exp claim nor TOKEN_CACHE_TTL seconds. Revoked tokens are caught by the
+    revocation set which token_required consults before this cache
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['token_cache'] = {
+            'entries': TTLCache(maxsize=app.config.get('TOKEN_CACHE_SIZE', 1024),
+                                ttl=app.config.get('TOKEN_CACHE_TTL', 60)),
+            # Bumping a user's generation invalidates every cached token of that user at once
+            'generations': {},
+            'lock': threading.Lock(),
+        }
+
+    @property
+    def _store(self):
+        return current_app.extensions['token_cache']
+
+    def get(self, token):
+        """
+        Return the cached (claims, user snapshot) of a token or None when it has to be verified again
+        :param token:
+        :return:
+        """
+        store = self._store
+        entry = store['entries'].get(token_digest(token))
+        if entry is None:
+            return None
+        claims, snapshot, generation = entry
+        if store['generations'].get(snapshot['id'], 0) != generation:
+            return None
+        return claims, snapshot
+
+    def put(self, token, claims, user):
+        """
+        Cache a verified token until its exp claim at the latest
+        :param token:
+        :param claims:
+        :param user:
+        :return:
+        """
+        store = self._store
+        ttl = claims.get('exp', 0) - time.time()
+        generation = store['generations'].get(user.id, 0)
+        store['entries'].set(token_digest(token), (claims, user.snapshot(), generation), ttl=ttl)
+
+    def invalidate(self, token):
+        self._store['entries'].delete(token_digest(token))
+
+    def invalidate_user(self, user_id):
+        """ Drop every cached token of the user, for instance after the password has been changed """
+        store = self._store
+        with store['lock']:
+            store['generations'][user_id] = store['generations'].get(user_id, 0) + 1
+
+
+token_cache = TokenCache()
@@ -1,20 +1,23 @@
 import datetime
-import re
-import socket
+import logging
 from functools import wraps
-from threading import Thread
 
 import os
-from flask import request, jsonify, abort, render_template, make_response, current_app
+from flask import request, jsonify, render_template, make_response, current_app
 import jwt
 from flask_mail import Message
-from werkzeug.security import generate_password_hash
 
-from app import mail, db
-from app.models.user import User, BlacklistToken
+from app import mail_queue, db
+from app.models.user import User
 from . import auth
+from app.auth.revocation import revocation_set
+from app.auth.token_cache import token_cache
 from app.models.user_accounts import UserAccounts
+from app.passwords import PasswordHashingBusy
 from app.instance.config import BaseConfig
+from app.validation import REGISTRATION_SCHEMA, RESET_PASSWORD_SCHEMA, CHANGE_PASSWORD_SCHEMA, validation_error
+
+logger = logging.getLogger(__name__)
 
 # User accounts object
 user_accounts = UserAccounts()
@@ -27,71 +30,35 @@ def index():
     return render_template('documentation.html')
 
 
-def password_validation(data):
-    print("the pass data is ", data)
-    if len(data['password'].strip()) < 5 or not re.search("[a-z]", data['password'].strip()) or not \
-            re.search("[0-9]", data['password'].strip()) or not re.search("[A-Z]", data['password'].strip()) \
-            or not re.search("[$#@]", data['password'].strip()):
-        return "Invalid Password.The password must contain at least one lowercase character,one digit,one upper " \
-               "case character and one special character"
-    else:
-        return data['password']
-
-
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+@auth.app_errorhandler(PasswordHashingBusy)
+def password_hashing_busy(error):
+    """ Every password hashing slot is taken, ask the client to come back instead of queueing more work """
+    response = jsonify({'message': 'The service is busy, please try again shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
 
 
 def send_email(to, subject, template, **kwargs):
-    app = current_app._get_current_object()
+    """ Render the message and queue it for delivery, sending happens off the request thread """
     msg = Message(subject, sender=os.environ.get('MAIL_USERNAME'), recipients=[to])
     msg.body = render_template(template + '.txt', **kwargs)
     msg.html = render_template(template + '.html', **kwargs)
-    mail.send(msg)
-    thr = Thread(target=send_async_email, args=[app, msg])
-    thr.start()
-    return thr
+    return mail_queue.enqueue(msg)
 
 
 # Registration route
 # All fields must be filled
 @auth.route('/register', methods=['POST'])
 def register():
-    data = request.get_json()
-    username = data['username'].strip()
-    email = data['email'].strip()
-    password = data['password'].strip()
-
-    # Validate these fields against being empty
-    if username is None or email is None or password is None:
-        abort(400)
-
-    # Validate the length of these fields to be more than five characters
-    if len(username) < 5 or len(email) < 5 or len(password) < 5:
-        return jsonify({"message": "This fields must be more than 5 characters and not empty spaces"}), 400
-
-    # Validate the username against special characters and spaces
-    if not re.match("^[a-zA-Z0-9_ ]*$", username):
-        return jsonify({
-            "message": "Invalid username.The username can contain letters, digits and underscore but no special"
-                       " characters or space"}), 400
-
-    # Validate the email to be properly formatted
-    if not re.match(r"([\w.-]+)@([\w.-]+)(\.[\w.]+$)", email):
-        return jsonify({"message": "Please enter a valid email"})
-
-    # Validate the password to comprised of certain characters to make it more stronger and secure
-    if not re.search("[a-z]", password) or not re.search("[0-9]", password) or not re.search("[A-Z]",
-                                                                                             password) or not re.search(
-            "[$#@]", password):
-        return jsonify({
-            "message": "Invalid Password.The password must contain at least one lowercase character,one digit,"
-                       "one upper case character and one special character"}), 400
-    if user_accounts.get_specific_user(email):
+    data, errors = REGISTRATION_SCHEMA.validate(request.get_json())
+    if errors:
+        return validation_error(errors)
+
+    if user_accounts.get_specific_user(data['email']):
         return jsonify({"message": "User already exists with email address, choose another email address"}), 202
     else:
-        user_accounts.create_user(username=username, email=email, password=password)
+        user_accounts.create_user(username=data['username'], email=data['email'], password=data['password'])
         response = {'message': 'You have been registered successfully and can proceed to login'}
         return make_response(jsonify(response)), 201
 
@@ -110,8 +77,8 @@ def login():
         response.status_code = 401 
         return response
     if user.compare_hashed_password(auth['password']):
-        token = jwt.encode({'id': user.id, 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=720)},
-                           BaseConfig.SECRET_KEY)
+        lifetime = datetime.timedelta(hours=current_app.config['JWT_LIFETIME_HOURS'])
+        token = jwt.encode({'id': user.id, 'exp': datetime.datetime.utcnow() + lifetime}, BaseConfig.SECRET_KEY)
         return jsonify({'token': token.decode()}), 200
     else:
         response = jsonify({"message": 'Invalid Credentials'})
@@ -130,9 +97,17 @@ def token_required(f):
         if not token:
             return jsonify({'message': 'Token is missing'}), 401
         try:
+            if revocation_set.is_revoked(token):
+                return jsonify({"message": "You are logged out. Please login again to continue"}), 401
+            # A token verified recently by this process skips decoding and the user lookup
+            cached = token_cache.get(token)
+            if cached is not None:
+                return f(User.from_snapshot(cached[1]), *args, **kwargs)
             data = jwt.decode(token, BaseConfig.SECRET_KEY)
-            if not isinstance(data, str) and not BlacklistToken.check_blacklist(token):
+            if not isinstance(data, str):
                 current_user = User.query.filter_by(id=data['id']).first()
+                if current_user:
+                    token_cache.put(token, data, current_user)
                 return f(current_user, *args, **kwargs)
             return jsonify({"message": "You are logged out. Please login again to continue"}), 401
 
@@ -143,11 +118,11 @@ def token_required(f):
                 'Token Error': 'Token is invalid, You are using the Reset Password Token to perform the request',
                 'Key Error': 'Please check to see if you have entered all the attributes needed to perform this request'}), 500
         except jwt.ExpiredSignatureError:
-            print("An error occured, The token you are passing is expired")
+            logger.info('Refused an expired token')
             return jsonify({'message': 'Token is invalid'}), 401
 
         except jwt.InvalidTokenError:
-            print("An error occured, The token you are passing is invalid")
+            logger.info('Refused an invalid token')
             return jsonify({'message': 'Token is invalid'}), 401
     return decorated
 
@@ -162,13 +137,9 @@ def acquire_token():
     user = User.query.filter_by(email=data['email']).first()
     if user:
         token = user.generate_confirmation_token().decode('utf8')
-        try:
-            send_email(user.email, 'Confirm Your Account', 'auth/email/confirm', user=user, token=token)
-            response = {"message": "a confirmation email has been sent to {}".format(user.email)}
-            return make_response(jsonify(response)), 200
-        except socket.gaierror:
-            return jsonify({'Error': 'Sorry an error has been encountered while sending you a confirmation link.'
-                                     'Check your internet connection first it may be the reason'})
+        send_email(user.email, 'Confirm Your Account', 'auth/email/confirm', user=user, token=token)
+        response = {"message": "a confirmation email has been sent to {}".format(user.email)}
+        return make_response(jsonify(response)), 200
     return jsonify({"Warning": "There does not exist a user by that email address"}), 404
 
 
@@ -176,7 +147,7 @@ def acquire_token():
 def confirm(token):
     """This route contains the token that will be used to reset password"""
     res = User.confirm(token)
-    print("token is ", res)
+    logger.debug('Password reset confirmation for %s', res)
     if res == False:
         return jsonify({"Warning": res}), 403
     return jsonify({"message": "Extract the token below and go ahead to reset your password", "token": token}), 200
@@ -190,7 +161,6 @@ def reset_password():
         """
     
         data = request.get_json()
-        print("the incoming data is ", data)
         try:
             token = data['token']
         except KeyError:
@@ -199,12 +169,12 @@ def reset_password():
         if res == False:
             return jsonify({"message": res}), 403
         user = res
-        new_pass = password_validation(data)
-
-        if new_pass is not data['password']:
-            return jsonify({"message": new_pass}), 400
-        user.pw_hash = generate_password_hash(data["password"])
+        passwords, errors = RESET_PASSWORD_SCHEMA.validate(data)
+        if errors:
+            return validation_error(errors)
+        user.password = passwords['password']
         db.session.commit()
+        token_cache.invalidate_user(user.id)
         return jsonify({"message": "The password was reset successfully,Now you can proceed to login"}), 200
 
 
@@ -219,12 +189,14 @@ def change_password(current_user):
     """
     data = request.get_json()
     previous_password = data['previous_password']
-    new_pass = password_validation(data)
-    if new_pass is not data['new_pass']:
-        return jsonify({"message": new_pass}), 400
+    passwords, errors = CHANGE_PASSWORD_SCHEMA.validate(data)
+    if errors:
+        return validation_error(errors)
+    new_pass = passwords['new_pass']
 
     if current_user.compare_hashed_password(previous_password):
         current_user.change_password(new_pass)
+        token_cache.invalidate_user(current_user.id)
         response = jsonify({'success': 'The password has been updated successfully'})
         response.status_code = 200
         return response
@@ -239,13 +211,11 @@ def logout(current_user):
     token = request.headers.get('Authorization').replace('Bearer ','')
     if token:
         data = jwt.decode(token, BaseConfig.SECRET_KEY)
-        if not isinstance(data, str) and not BlacklistToken.check_blacklist(token):
-            # mark the token as blacklisted
-            blacklist_token = BlacklistToken(token=token)
+        if not isinstance(data, str) and not revocation_set.is_revoked(token):
             try:
-                # insert the token
-                db.session.add(blacklist_token)
-                db.session.commit()
+                # mark the token as blacklisted
+                revocation_set.revoke(token)
+                token_cache.invalidate(token)
                 return jsonify({'status': 'success', 'message': 'Successfully logged out.'}), 200
             except Exception as e:
                 return jsonify({'status': 'fail', 'message': e}), 200
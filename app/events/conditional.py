@@ -0,0 +1,58 @@
+"""
+Conditional GET for the event listings.
+Every change to the events table bumps its ChangeVersion in the same transaction, so the version alone tells whether
+a listing a client holds is still current. A request carrying the ETag it was last given is answered with 304 Not
+Modified from that one indexed lookup, the listing query is not run at all.
+Last-Modified is sent for information only. HTTP dates have whole seconds, so a change made later in the second a
+listing was served would carry the same date and If-Modified-Since could keep a client on the stale listing
+"""
+import hashlib
+from functools import wraps
+
+from flask import current_app, make_response, request
+from werkzeug.http import http_date
+
+from app.models.event import ChangeVersion
+
+
+def version_etag(version):
+    """
+    The ETag of a listing at the given version. Listings differ per user so the credentials are part of it, a client
+    sending another user's ETag never matches
+    :param version:
+    :return:
+    """
+    authorization = request.headers.get('Authorization')
+    if authorization:
+        return 'v{}-{}'.format(version, hashlib.sha256(authorization.encode()).hexdigest()[:16])
+    return 'v{}'.format(version)
+
+
+def conditional(scope):
+    """
+    Answer If-None-Match from the version of the scope before running the view.
+    The version is read before the view runs, a change committed while the view runs leaves the response with an
+    older version than its content so the client simply fetches it again next time
+    :param scope:
+    :return:
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            version, changed_at = ChangeVersion.current(scope)
+            etag = version_etag(version)
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if changed_at is not None:
+                response.headers['Last-Modified'] = http_date(changed_at)
+            response.vary.add('Authorization')
+            return response
+
+        return decorated
+
+    return decorator
@@ -0,0 +1,102 @@
+"""
+Exports of events and reservations as gzip compressed NDJSON or CSV.
+Rows are read in id order through a server side cursor and compressed as they are written, so an export takes the
+same memory whatever its size. Every record carries its keyset position, an interrupted export is resumed by asking
+for the rows after the last one received: the id of an event, or the event_id:user_id of a reservation
+"""
+import zlib
+
+from sqlalchemy import or_, tuple_
+
+from app.events.serializers import EVENT_COLUMNS
+from app.events.streaming import STREAM_BATCH_SIZE, csv_chunks, ndjson_chunks
+from app.init_db import db
+from app.models.event import Event
+from app.models.user import User
+
+EXPORT_KINDS = ('events', 'rsvps')
+EXPORT_FORMATS = ('ndjson', 'csv')
+EXPORT_COLUMNS = EVENT_COLUMNS + (Event.owner,)
+
+
+def parse_after(kind, after):
+    """
+    Parse the position an export resumes after
+    :param kind: events or rsvps
+    :param after: an event id, or event_id:user_id for reservations
+    :return: the id or the (event_id, user_id) pair, None to start from the beginning
+    :raises ValueError: when the position does not fit the kind of export
+    """
+    if after is None or after == '':
+        return None
+    if kind == 'events':
+        return int(after)
+    event_id, separator, user_id = after.partition(':')
+    if not separator:
+        raise ValueError('Reservation exports resume after an event_id:user_id pair')
+    return int(event_id), int(user_id)
+
+
+def event_record(row):
+    """ The export record of an event, dates are ISO-8601 so that an export can be imported again as it is """
+    record = {column.key: value for column, value in zip(EXPORT_COLUMNS, row)}
+    if record['date_hosted'] is not None:
+        record['date_hosted'] = record['date_hosted'].date().isoformat()
+    return record
+
+
+def rsvp_record(row):
+    return {'event_id': row.event_id, 'user_id': row.user_id, 'username': row.username, 'email': row.email}
+
+
+def export_query(kind, user_id=None, after=None):
+    """
+    The rows of an export in keyset order, as column tuples so that no entities are kept in the session
+    :param kind: events or rsvps
+    :param user_id: the user whose events and reservations, those made by the user and those made to the user's
+    events, are exported, None exports those of everyone
+    :param after: the position returned by parse_after
+    :return:
+    """
+    if kind == 'events':
+        query = db.session.query(*EXPORT_COLUMNS)
+        if user_id is not None:
+            query = query.filter(Event.owner == user_id)
+        if after is not None:
+            query = query.filter(Event.id > after)
+        return query.order_by(Event.id)
+
+    rsvps = User.rsvps
+    query = db.session.query(rsvps.c.event_id, rsvps.c.user_id, User.username, User.email).join(
+        User, User.id == rsvps.c.user_id)
+    if user_id is not None:
+        query = query.join(Event, Event.id == rsvps.c.event_id).filter(
+            or_(Event.owner == user_id, rsvps.c.user_id == user_id))
+    if after is not None:
+        query = query.filter(tuple_(rsvps.c.event_id, rsvps.c.user_id) > tuple_(*after))
+    return query.order_by(rsvps.c.event_id, rsvps.c.user_id)
+
+
+def gzip_chunks(chunks, level=6):
+    """ Compress text chunks into a gzip stream as they come, yielding whatever the compressor lets go of """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(kind, export_format, user_id=None, after=None):
+    """
+    The gzip compressed export, for a response or a file
+    :param kind: one of EXPORT_KINDS
+    :param export_format: one of EXPORT_FORMATS
+    :param user_id: see export_query
+    :param after: see export_query
+    :return: an iterator of bytes
+    """
+    to_dict = event_record if kind == 'events' else rsvp_record
+    records = (to_dict(row) for row in export_query(kind, user_id, after).yield_per(STREAM_BATCH_SIZE))
+    chunks = csv_chunks(records) if export_format == 'csv' else ndjson_chunks(records)
+    return gzip_chunks(chunks)
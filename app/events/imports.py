@@ -0,0 +1,101 @@
+import csv
+from datetime import date
+
+from flask import json
+
+# Number of valid rows inserted per statement and committed together while importing
+IMPORT_BATCH_SIZE = 500
+# Upper bound on the row errors listed in the response of one import, the rest are only counted
+MAX_IMPORT_ERRORS = 1000
+
+# What stops an upload from being read any further
+UNREADABLE = (UnicodeDecodeError, csv.Error)
+
+IMPORT_FORMATS = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+}
+
+
+def import_format(mimetype, filename=None, requested=None):
+    """
+    Tell the format of an upload from the format query argument, the file extension or the content type
+    :param mimetype:
+    :param filename:
+    :param requested:
+    :return: csv, ndjson or None
+    """
+    if requested:
+        return requested if requested in IMPORT_FORMATS.values() else None
+    if filename and '.' in filename:
+        extension = filename.rsplit('.', 1)[1].lower()
+        if extension in IMPORT_FORMATS.values():
+            return extension
+    return IMPORT_FORMATS.get(mimetype)
+
+
+def import_key(name, category, date_hosted):
+    """ What the unique index of an owner's events compares, the time of the stored dates is always midnight """
+    return name, category, date(date_hosted.year, date_hosted.month, date_hosted.day)
+
+
+def text_lines(stream):
+    """ Decode a binary stream line by line, dropping the byte order mark spreadsheets put in front of UTF-8 """
+    first = True
+    for line in stream:
+        line = line.decode('utf-8')
+        if first:
+            line = line.lstrip('\ufeff')
+            first = False
+        yield line
+
+
+def csv_records(lines):
+    """
+    Yield the line number and the record of every CSV row, named after the header line.
+    The capacity column is turned into a number so that both formats validate the same way
+    :param lines:
+    :return:
+    """
+    reader = csv.DictReader(lines)
+    for record in reader:
+        capacity = (record.get('capacity') or '').strip()
+        if not capacity:
+            record['capacity'] = None
+        elif capacity.isdigit():
+            record['capacity'] = int(capacity)
+        yield reader.line_num, record, None
+
+
+def ndjson_records(lines):
+    """
+    Yield the line number and the record of every line of JSON, or the error of a line that is not a JSON object.
+    Blank lines are skipped
+    :param lines:
+    :return:
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None, 'The line is not valid JSON'
+            continue
+        if not isinstance(record, dict):
+            yield number, None, 'Every line should be a JSON object'
+            continue
+        yield number, record, None
+
+
+def read_records(stream, import_format):
+    """
+    Read the records of an upload one at a time without holding the file in memory
+    :param stream: the binary request or file stream
+    :param import_format: csv or ndjson
+    :return: an iterator of (line, record, error) tuples
+    """
+    lines = text_lines(stream)
+    if import_format == 'csv':
+        return csv_records(lines)
+    return ndjson_records(lines)
@@ -0,0 +1,119 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+from app.models.event import Event
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def encode_cursor(*values):
+    """
+    Turn the sort key of the last row of a page into an opaque url safe token
+    :param values:
+    :return:
+    """
+    key = [value.strftime(DATE_FORMAT) if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(token):
+    """
+    Turn a token produced by encode_cursor back into the (date_hosted, id) sort key
+    Raises a ValueError when the token has been tampered with
+    :param token:
+    :return:
+    """
+    try:
+        date_hosted, event_id = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+        if date_hosted is not None:
+            date_hosted = datetime.strptime(date_hosted, DATE_FORMAT)
+        return date_hosted, int(event_id)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+
+def decode_id_cursor(token):
+    """
+    Turn a token produced by encode_cursor from a single id back into the id
+    Raises a ValueError when the token has been tampered with
+    :param token:
+    :return:
+    """
+    try:
+        row_id, = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+        return int(row_id)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+
+def keyset_page(query, cursor, limit):
+    """
+    Return one page of events ordered by (date_hosted, id) together with the cursor of the next page.
+    Every page seeks straight to its first row through the (date_hosted, id) index so the hundredth page costs
+    the same as the first. Events without a date are listed after the dated ones, ordered by id.
+    :param query: an events query with any owner filters already applied
+    :param cursor: a decoded (date_hosted, id) tuple or None for the first page
+    :param limit:
+    :return:
+    """
+    rows = []
+    if cursor is None or cursor[0] is not None:
+        rows = dated_page_query(query, cursor, limit).all()
+    if len(rows) <= limit:
+        rows += undated_page_query(query, cursor, limit - len(rows)).all()
+    return keyset_result(rows, limit)
+
+
+def dated_page_query(query, cursor, limit):
+    """ The first part of a keyset page, dated events after the cursor and one more to tell if a page follows """
+    dated = query.filter(Event.date_hosted.isnot(None))
+    if cursor is not None:
+        dated = dated.filter(tuple_(Event.date_hosted, Event.id) > tuple_(*cursor))
+    return dated.order_by(Event.date_hosted, Event.id).limit(limit + 1)
+
+
+def undated_page_query(query, cursor, limit):
+    """ The rest of a keyset page, undated events after the cursor when it points at one, or from the start """
+    undated = query.filter(Event.date_hosted.is_(None))
+    if cursor is not None and cursor[0] is None:
+        undated = undated.filter(Event.id > cursor[1])
+    return undated.order_by(Event.id).limit(limit + 1)
+
+
+def keyset_result(rows, limit):
+    """ Split the rows fetched for a keyset page into the page and the cursor of the next one """
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(items[-1].date_hosted, items[-1].id)
+    return items, next_cursor
+
+
+def id_keyset_page(query, column, cursor, limit):
+    """
+    Return one page of rows ordered by a unique integer column together with the cursor of the next page
+    :param query: a query of column tuples that includes the column
+    :param column: the column to order and seek by, an index should lead with whatever the query filters on
+    followed by this column
+    :param cursor: a decoded id or None for the first page
+    :param limit:
+    :return:
+    """
+    return id_keyset_result(id_keyset_query(query, column, cursor, limit).all(), column, limit)
+
+
+def id_keyset_query(query, column, cursor, limit):
+    if cursor is not None:
+        query = query.filter(column > cursor)
+    return query.order_by(column).limit(limit + 1)
+
+
+def id_keyset_result(rows, column, limit):
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(getattr(items[-1], column.key))
+    return items, next_cursor
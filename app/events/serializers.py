@@ -0,0 +1,83 @@
+"""
+Event responses built from column tuples rather than Event entities.
+The event endpoints select EVENT_COLUMNS only, turn every row into its response dict in one pass with the dates
+already formatted, and encode the result with ujson when it is installed and FAST_JSON is on
+"""
+from functools import lru_cache
+
+from flask import current_app, json, request
+from werkzeug.http import http_date
+
+from app.metrics import metrics
+from app.models.event import Event
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover - the standard encoder is used instead
+    ujson = None
+
+EVENT_COLUMNS = (Event.id, Event.name, Event.category, Event.location, Event.date_hosted, Event.description,
+                 Event.rsvp_count, Event.capacity)
+EVENT_FIELDS = tuple(column.key for column in EVENT_COLUMNS)
+DATE_HOSTED = EVENT_FIELDS.index('date_hosted')
+
+
+def event_rows(query):
+    """
+    Narrow an events query down to the columns of a response, filters and ordering are kept
+    :param query:
+    :return:
+    """
+    return query.with_entities(*EVENT_COLUMNS)
+
+
+@lru_cache(maxsize=4096)
+def format_date(value):
+    """ Format a date the way flask's JSON encoder does, events share few distinct dates so this is cached """
+    return http_date(value.timetuple())
+
+
+def serialize_event(row):
+    """
+    Turn a row of EVENT_COLUMNS into its response dict
+    :param row:
+    :return:
+    """
+    record = dict(zip(EVENT_FIELDS, row))
+    if row[DATE_HOSTED] is not None:
+        record['date_hosted'] = format_date(row[DATE_HOSTED])
+    return record
+
+
+def serialize_events(rows):
+    with metrics.serializing():
+        return [serialize_event(row) for row in rows]
+
+
+def encode_json(payload, indent=None):
+    """
+    Encode a payload of plain values with ujson when it is available, the way flask's json would
+    :param payload:
+    :param indent:
+    :return:
+    """
+    config = current_app.config
+    with metrics.serializing():
+        if ujson is not None and config.get('FAST_JSON', True):
+            return ujson.dumps(payload, ensure_ascii=config['JSON_AS_ASCII'], sort_keys=config['JSON_SORT_KEYS'],
+                               escape_forward_slashes=False, indent=indent or 0)
+        separators = (', ', ': ') if indent else (',', ':')
+        return json.dumps(payload, indent=indent, separators=separators)
+
+
+def json_response(payload, status=200):
+    """
+    jsonify for payloads of plain values, such as serialized events, encoded with ujson when it is available
+    :param payload:
+    :param status:
+    :return:
+    """
+    config = current_app.config
+    indent = 2 if config['JSONIFY_PRETTYPRINT_REGULAR'] and not request.is_xhr else None
+    return current_app.response_class((encode_json(payload, indent), '\n'), status=status,
+                                      mimetype=config['JSONIFY_MIMETYPE'])
@@ -0,0 +1,63 @@
+import csv
+import io
+
+from flask import Response, json, stream_with_context
+
+# Number of rows fetched from the server side cursor per round trip while streaming
+STREAM_BATCH_SIZE = 1000
+
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+    'csv': 'text/csv',
+}
+
+
+def ndjson_chunks(records):
+    """ Yield every record as one line of JSON """
+    for record in records:
+        yield json.dumps(record) + '\n'
+
+
+def json_array_chunks(records, key):
+    """ Yield a {key: [...]} document one record at a time """
+    yield '{"%s": [' % key
+    separator = ''
+    for record in records:
+        yield separator + json.dumps(record)
+        separator = ','
+    yield ']}'
+
+
+def csv_chunks(records):
+    """ Yield a header line named after the keys of the first record and then one line per record """
+    buffer = io.StringIO()
+    writer = None
+    for record in records:
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(record))
+            writer.writeheader()
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def stream_records(query, to_dict, stream_format, key):
+    """
+    Stream every row of the query in the requested format without holding the result set in memory.
+    The query is read through a server side cursor in batches of STREAM_BATCH_SIZE rows
+    :param query: a query of column tuples rather than entities so rows are not kept in the identity map
+    :param to_dict: turns a row into the record sent to the client
+    :param stream_format: one of STREAM_FORMATS
+    :param key: the name of the array when streaming a JSON document
+    :return:
+    """
+    records = (to_dict(row) for row in query.yield_per(STREAM_BATCH_SIZE))
+    if stream_format == 'ndjson':
+        chunks = ndjson_chunks(records)
+    elif stream_format == 'csv':
+        chunks = csv_chunks(records)
+    else:
+        chunks = json_array_chunks(records, key)
+    return Response(stream_with_context(chunks), mimetype=STREAM_FORMATS[stream_format])
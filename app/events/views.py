@@ -1,106 +1,63 @@
-import re
-from datetime import datetime
+from collections import OrderedDict
 
-from flask import request, jsonify
-from sqlalchemy import or_
+from flask import current_app, request, jsonify, stream_with_context
 from app.auth.views import token_required
 from app.events import event
-from app.models.event import Event
-import arrow
-
-def date_validation(date_hosted):
-    """check that the event date is not past"""
-    
-    new_date = arrow.get(date_hosted).format('MM-DD-YYYY')
-    try:
-        date = datetime.strptime(new_date, '%m-%d-%Y').date()
-
-    except ValueError as e:
-        print("e",e)
-        return "You have entered an incorrect date format, date should be MM-DD-YY format"
-    
-    # date = date_hosted
-    if date < date.today():
-        return "The event cannot have a past date as the date it is going to be hosted"
-    return date_hosted
-
-
-def update_date_validation(date_hosted):
-    """check that the event date is not past"""
-    if len(date_hosted) > 3:
-        try:
-            date = datetime.strptime(date_hosted, '%m-%d-%Y').date()
-
-        except ValueError:
-            return "You have entered an incorrect date format, date should be MM-DD-YY format"
-
-        if date < date.today():
-            return "The event cannot have a past date as the date it is going to be hosted"
-    return date_hosted
-
-
-def data_validation(data):
-    if len(data['name'].strip()) < 5 or not re.match("^[a-zA-Z0-9_ ]*$", data['name'].strip()):
-        return "The event name should only contain alphanumeric characters,an underscore and be at least 5 " \
-               "characters in length without any empty spaces and special characters"
-
-    elif len(data['location'].strip()) < 3 or not data['location'].strip().isalpha():
-        return "The event location should only contain alphabetic characters and be at least 3 characters in length" \
-               " excluding empty spaces"
-
-    elif len(data['category'].strip()) < 5 or not data['category'].strip().isalpha():
-        return "The event category should only contain alphabetic characters and be at least 5 characters in length " \
-               "excluding empty spaces"
-
-    else:
-        return data
-
-
-def update_data_validation(data):
-    if data['name'] != '':
-        if not re.match("^[a-zA-Z0-9_ ]*$", data['name']) or len(data['name']) < 5:
-            return "The event name should only contain alphanumeric characters,an underscore and be at least 5 " \
-                   "characters in length without any empty spaces and special characters"
-    if data['location'] != '':
-        if not data['location'].isalpha() and len(data['location']) < 3:
-            return "The event location should only contain alphabetic characters and be at least 3 characters in" \
-                   " length excluding empty spaces"
-
-    if data['category'] != '':
-        if not data['category'].isalpha() or len(data['category']) < 5:
-            return "The event category should only contain alphabetic characters and be at least 5 characters in " \
-                   "length excluding empty spaces"
-    return data
+from app.events.conditional import conditional
+from app.events.exports import EXPORT_FORMATS, EXPORT_KINDS, export_chunks, parse_after
+from app.events.imports import (IMPORT_BATCH_SIZE, MAX_IMPORT_ERRORS, UNREADABLE, import_format, import_key,
+                                read_records)
+from app.events.pagination import decode_cursor, decode_id_cursor, id_keyset_page, keyset_page
+from app.events.serializers import event_rows, json_response, serialize_event, serialize_events
+from app.events.streaming import STREAM_FORMATS, stream_records
+from app.init_db import db
+from app.models.event import ChangeVersion, Event, EventFull
+from app.models.user import User
+from app.replicas import replica_router
+from app.response_cache import LISTING, ORDERING, event_tag, response_cache
+from app.search import search_index
+from app.validation import EVENT_SCHEMA, EVENT_UPDATE_SCHEMA, validation_error
+
+# Upper bound on the page size a client can ask for in cursor mode
+MAX_PAGE_SIZE = 100
+# Upper bound on the reservations of one bulk RSVP request
+MAX_BULK_RSVPS = 1000
+# Upper bound on the events of one bulk update or delete request
+MAX_BULK_EVENTS = 1000
+
+
+def capacity_validation(capacity):
+    """
+    Check the optional capacity of an event
+    :param capacity:
+    :return: the capacity and None, or None and the error message
+    """
+    if capacity is None or (isinstance(capacity, int) and not isinstance(capacity, bool) and capacity > 0):
+        return capacity, None
+    return None, "The capacity should be a whole number of at least 1"
 
 
 @event.route('/events', methods=['POST'])
 @token_required
 def create_events(current_user):
-    data = request.get_json()
-    name = data['name']
-    category = data['category']
-    location = data['location']
-    date_hosted = data['date_hosted']
-    description = data['description']
-
-    validation_output = data_validation(data)
-    date_validation_output = date_validation(data['date_hosted'])
-
-    if validation_output is not data:
-        return jsonify({"Warning": validation_output}), 400
-
-    elif date_validation_output is not date_hosted:
-        return jsonify({"Warning": date_validation_output}), 400
+    payload = request.get_json() or {}
+    data, errors = EVENT_SCHEMA.validate(payload)
+    if errors:
+        return validation_error(errors, key='Warning')
+    capacity, capacity_error = capacity_validation(payload.get('capacity'))
+    if capacity_error:
+        return jsonify({"Warning": capacity_error}), 400
 
     try:
-        event_found = current_user.create_event(name=name, category=category, location=location,
-                                                date_hosted=date_hosted,
-                                                description=description)
+        event_found = current_user.create_event(name=data['name'], category=data['category'],
+                                                location=data['location'], date_hosted=data['date_hosted'],
+                                                description=data['description'], capacity=capacity)
 
         response = jsonify({"Success": "Event created successfully",
                             "event": {"name": event_found.name, "id":event_found.id,"category": event_found.category,
                                       "location": event_found.location, "date_hosted": event_found.date_hosted,
-                                      "description": event_found.description}})
+                                      "description": event_found.description,
+                                      "rsvp_count": event_found.rsvp_count, "capacity": event_found.capacity}})
 
         response.status_code = 201  # Created
         return response
@@ -108,37 +65,138 @@ def create_events(current_user):
         return jsonify({"Warning": 'The event already exists'})  # Update an Event
 
 
+@event.route('/events/import', methods=['POST'])
+@token_required
+def import_events(current_user):
+    """
+    Create many events from a CSV or NDJSON upload, sent as the request body or as the file field of a form.
+    Rows are validated like the body of POST /api/events while the upload is read and the valid ones are inserted
+    IMPORT_BATCH_SIZE at a time, one commit per batch. Rejected rows are reported with their line number, invalid ones
+    with their errors and duplicates of the user's events or of earlier rows as existing events
+    :param current_user:
+    :return:
+    """
+    upload = request.files.get('file')
+    if upload:
+        stream, file_format = upload.stream, import_format(upload.mimetype, upload.filename,
+                                                           request.args.get('format'))
+    else:
+        stream, file_format = request.stream, import_format(request.mimetype, requested=request.args.get('format'))
+    if file_format is None:
+        return jsonify({'message': 'Please upload the events as CSV or NDJSON'}), 400
+
+    batch_size = current_app.config.get('IMPORT_BATCH_SIZE', IMPORT_BATCH_SIZE)
+    report = {'created': 0, 'duplicates': 0, 'invalid': 0, 'errors': []}
+    # The rows waiting to be inserted by their import_key, repeats within a batch are told apart here and repeats
+    # of rows of earlier batches by the unique index
+    batch = OrderedDict()
+
+    def reject(line, outcome, message, errors=None):
+        report[outcome] += 1
+        if len(report['errors']) < MAX_IMPORT_ERRORS:
+            error = {'line': line, 'message': message}
+            if errors:
+                error['errors'] = errors
+            report['errors'].append(error)
+
+    def insert_batch():
+        created = {import_key(row.name, row.category, row.date_hosted)
+                   for row in current_user.import_events([values for line, values in batch.values()])}
+        report['created'] += len(created)
+        for key, (line, values) in batch.items():
+            if key not in created:
+                reject(line, 'duplicates', 'The event already exists')
+        batch.clear()
+
+    line = rows = 0
+    try:
+        for line, record, error in read_records(stream, file_format):
+            rows += 1
+            if error:
+                reject(line, 'invalid', error)
+                continue
+            data, errors = EVENT_SCHEMA.validate(record)
+            if errors:
+                reject(line, 'invalid', next(iter(errors.values())), errors)
+                continue
+            capacity, capacity_error = capacity_validation(record.get('capacity'))
+            if capacity_error:
+                reject(line, 'invalid', capacity_error)
+                continue
+            date_hosted = data['date_hosted']
+            key = import_key(data['name'], data['category'], date_hosted)
+            if key in batch:
+                reject(line, 'duplicates', 'The event already exists')
+                continue
+            batch[key] = line, {'name': data['name'], 'category': data['category'], 'location': data['location'],
+                                'date_hosted': date_hosted, 'description': data['description'],
+                                'capacity': capacity}
+            if len(batch) >= batch_size:
+                insert_batch()
+    except UNREADABLE:
+        rows += 1
+        reject(line + 1, 'invalid', 'The upload cannot be read from this line on, it should be UTF-8 ' + file_format)
+    if not rows:
+        return jsonify({'message': 'The upload does not contain any events'}), 400
+    insert_batch()
+    # Duplicates are only known once their batch is inserted
+    report['errors'].sort(key=lambda error: error['line'])
+    return jsonify(report), 200
+
+
+@event.route('/events/export', methods=['GET'])
+@token_required
+def export_events(current_user):
+    """
+    Download the user's events, or with ?kind=rsvps the reservations made by the user and to the user's events, as
+    gzip compressed NDJSON or CSV (?format=csv). Administrators export those of every user with ?scope=all.
+    An interrupted download resumes with ?after= the id, or the event_id:user_id, of the last record received
+    :param current_user:
+    :return:
+    """
+    kind = request.args.get('kind', 'events')
+    export_format = request.args.get('format', 'ndjson')
+    if kind not in EXPORT_KINDS or export_format not in EXPORT_FORMATS:
+        return jsonify({'message': 'The kind should be one of {} and the format one of {}'.format(
+            ', '.join(EXPORT_KINDS), ', '.join(EXPORT_FORMATS))}), 400
+    scope = request.args.get('scope', 'own')
+    if scope == 'all' and not current_user.is_admin:
+        return jsonify({'message': 'Only administrators can export the events of every user'}), 403
+    try:
+        after = parse_after(kind, request.args.get('after'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    chunks = export_chunks(kind, export_format, None if scope == 'all' else current_user.id, after)
+    response = current_app.response_class(stream_with_context(chunks), mimetype='application/gzip')
+    response.headers['Content-Disposition'] = 'attachment; filename={}.{}.gz'.format(kind, export_format)
+    return response
+
+
 @event.route('/events/<string:event_id>', methods=['PUT'])
 @token_required
 def update_events(current_user, event_id):
-    data = request.get_json()
-    print("the data is ", data, event_id)
-    name = data['name']
-    category = data['category']
-    location = data['location']
-    date_hosted = data['date_hosted']
-    description = data['description']
-    if name != '' or category != '' or location != '' or date_hosted != '' or description != '':
-        validation_output = update_data_validation(data)
-        date_validation_output = date_validation(data['date_hosted'])
-
-        if validation_output is not data:
-            return jsonify({"message": validation_output}), 400
-
-        elif date_validation_output is not date_hosted:
-            return jsonify({"message": date_validation_output}), 400
+    payload = request.get_json() or {}
+    data, errors = EVENT_UPDATE_SCHEMA.validate(payload)
+    if errors:
+        return validation_error(errors)
+    capacity, capacity_error = capacity_validation(payload.get('capacity'))
+    if capacity_error:
+        return jsonify({"message": capacity_error}), 400
 
     try:
-        event_found = current_user.update_event(event_id, name=name, category=category, location=location,
-                                                date_hosted=date_hosted,
-                                                description=description)
+        # An empty date keeps the stored one like the other fields
+        event_found = current_user.update_event(event_id, name=data['name'], category=data['category'],
+                                                location=data['location'], date_hosted=data['date_hosted'] or None,
+                                                description=data['description'], capacity=capacity)
         if isinstance(event_found, str):
-            return jsonify({'Warning': "You cannot update an event to duplicate an existing event"})
+            return jsonify({'Warning': event_found})
         else:
             return jsonify({'success': 'The event has been updated successfully',
                             "event": {"name": event_found.name, "category": event_found.category,
                                       "location": event_found.location, "date_hosted": event_found.date_hosted,
-                                      "description": event_found.description}}), 200
+                                      "description": event_found.description,
+                                      "rsvp_count": event_found.rsvp_count, "capacity": event_found.capacity}}), 200
 
     except AttributeError:
         response = jsonify({'warning': 'The event does not exist'})
@@ -161,23 +219,124 @@ def delete_events(current_user, event_id):
         return response
 
 
+def requested_event_ids(payload):
+    """
+    The distinct event ids of a bulk request body, in the order they were sent
+    :param payload:
+    :return: the ids and None, or None and the error response
+    """
+    event_ids = payload.get('ids')
+    if not isinstance(event_ids, list) or not event_ids:
+        return None, (jsonify({'message': 'Please send the ids of the events as a list'}), 400)
+    if len(event_ids) > MAX_BULK_EVENTS:
+        return None, (jsonify({'message': 'At most {} events can be changed at once'.format(MAX_BULK_EVENTS)}), 400)
+    try:
+        return list(OrderedDict.fromkeys(int(event_id) for event_id in event_ids)), None
+    except (TypeError, ValueError):
+        return None, (jsonify({'message': 'The ids of the events should be numbers'}), 400)
+
+
+def bulk_outcome(event_ids, statuses, done):
+    results = [{'id': event_id, 'status': statuses[event_id]} for event_id in event_ids]
+    return jsonify({done: sum(1 for result in results if result['status'] == done), 'events': results}), 200
+
+
+@event.route('/events', methods=['PATCH'])
+@token_required
+def bulk_update_events(current_user):
+    """
+    Apply the same changes to many events in one statement, to reschedule a season at once.
+    The body is {"ids": [1, 2, ...]} with the fields of PUT /api/events/<id> to change, empty fields keep their value.
+    Every event gets its own status: updated, duplicate, below_reservations, forbidden or event_not_found
+    :param current_user:
+    :return:
+    """
+    payload = request.get_json() or {}
+    event_ids, error = requested_event_ids(payload)
+    if error:
+        return error
+    data, errors = EVENT_UPDATE_SCHEMA.validate(payload)
+    if errors:
+        return validation_error(errors)
+    date_hosted = data['date_hosted'] or None
+    capacity, capacity_error = capacity_validation(payload.get('capacity'))
+    if capacity_error:
+        return jsonify({"message": capacity_error}), 400
+    if not (any(data[key] for key in ('name', 'category', 'location', 'description')) or date_hosted or capacity):
+        return jsonify({'message': 'Please send at least one field to change'}), 400
+
+    statuses = current_user.update_events(event_ids, name=data['name'], category=data['category'],
+                                          location=data['location'], date_hosted=date_hosted,
+                                          description=data['description'], capacity=capacity)
+    return bulk_outcome(event_ids, statuses, 'updated')
+
+
+@event.route('/events', methods=['DELETE'])
+@token_required
+def bulk_delete_events(current_user):
+    """
+    Delete many events and their reservations in one statement. The body is {"ids": [1, 2, ...]}.
+    Every event gets its own status: deleted, forbidden or event_not_found
+    :param current_user:
+    :return:
+    """
+    event_ids, error = requested_event_ids(request.get_json() or {})
+    if error:
+        return error
+    return bulk_outcome(event_ids, current_user.delete_events(event_ids), 'deleted')
+
+
 # Retrieves an individual event
 @event.route('/event/<event_id>', methods=['GET'])
 @token_required
+@replica_router.replica_reads
+@conditional(ChangeVersion.EVENTS)
 def get_user_specific_event(current_user, event_id):
+    row = event_rows(Event.query.filter_by(id=event_id).filter_by(owner=current_user.id)).first()
+    if row:
+        return json_response({"event": serialize_event(row)})
+
+    # Only a miss needs the event counter, to tell an unknown event apart from a user with no events at all
     if current_user.get_number_of_events() > 0:
-        try:
-            event_found = current_user.get_specific_event(event_id)
-            return jsonify(
-                {"event": {"name": event_found.name, "category": event_found.category, "location": event_found.location,
-                           "date_hosted": event_found.date_hosted,
-                           "description": event_found.description}})
-        except AttributeError:
-            response = jsonify({'warning': 'There is no such event'})
-            response.status_code = 404  # Not found
-            return response
-    else:
-        return jsonify({'Info': "No Events Found"})
+        response = jsonify({'warning': 'There is no such event'})
+        response.status_code = 404  # Not found
+        return response
+    return jsonify({'Info': "No Events Found"})
+
+
+def page_window(args, page, limit):
+    """
+    The page and the limit of a listing, kept in range like paginate used to: pages start at 1 and limits go from 1
+    to MAX_PAGE_SIZE. With a cursor ?limit= takes the place of the limit of the route
+    :param args: the query string
+    :param page:
+    :param limit:
+    :return: the page and the limit
+    """
+    if 'cursor' in args:
+        limit = args.get('limit', limit, type=int)
+    return max(page, 1), max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def paginated_events(query, limit, page):
+    """
+    Return a page of events and the cursor of the next page.
+    Passing ?cursor= (empty for the first page) switches to keyset pagination by (date_hosted, id) otherwise the
+    classic page/limit offsets are used and no cursor is returned
+    :param query:
+    :param limit:
+    :param page:
+    :return:
+    """
+    page, limit = page_window(request.args, page, limit)
+    if 'cursor' not in request.args:
+        response_cache.tag(LISTING)
+        return query.order_by(Event.id).offset((page - 1) * limit).limit(limit).all(), None
+
+    response_cache.tag(LISTING, ORDERING)
+    token = request.args['cursor']
+    cursor = decode_cursor(token) if token else None
+    return keyset_page(query, cursor, limit)
 
 
 # Route to display all individual events
@@ -185,42 +344,35 @@ def get_user_specific_event(current_user, event_id):
 @event.route('/my_events/page=<int:page>', methods=['GET'])
 @event.route('/my_events/page=<int:page>&limit=<int:limit>', methods=['GET'])
 @token_required
+@conditional(ChangeVersion.EVENTS)
 def get_an_individuals_all_events(current_user, limit=6, page=1):
-    if current_user.get_number_of_events() > 0:
-        event_found = Event.query.filter_by(owner=current_user.id).paginate(page, per_page=limit, error_out=False).items
-        output = []
-        if event_found:
-            for s_event in event_found:
-                event_data = {'name': s_event.name, "id":s_event.id, 'category': s_event.category, 'location': s_event.location,
-                              'date_hosted':
-                                  s_event.date_hosted, 'description': s_event.description}
-                output.append(event_data)
-            return jsonify({'events': output})
-        return jsonify({'events': []}), 200
-    return jsonify({'events': []}), 200
+    try:
+        rows, next_cursor = paginated_events(event_rows(Event.query.filter_by(owner=current_user.id)), limit, page)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    return json_response({'events': serialize_events(rows), 'next_cursor': next_cursor})
 
 
 # Route to display all events
 @event.route('/events', methods=['GET'])
 @event.route('/events/page=<int:page>', methods=['GET'])
 @event.route('/events/page=<int:page>&limit=<int:limit>', methods=['GET'])
+@replica_router.replica_reads
+@conditional(ChangeVersion.EVENTS)
+@response_cache.cached
 def get_all_events(limit=6, page=1):
-    if Event.query.count() > 0:
-        event_found = Event.query.paginate(page, per_page=limit, error_out=False).items
-        output = []
-        if event_found:
-            for s_event in event_found:
-                event_data = {'id':s_event.id, 'name': s_event.name, 'category': s_event.category, 'location': s_event.location,
-                              'date_hosted':
-                                  s_event.date_hosted, 'description': s_event.description}
-                output.append(event_data)
-            return jsonify({'events': output})
-        return jsonify({'Message': 'No Events Found'}), 404
+    try:
+        rows, next_cursor = paginated_events(event_rows(Event.query), limit, page)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    if rows:
+        response_cache.tag(*(event_tag(row.id) for row in rows))
+        return json_response({'events': serialize_events(rows), 'next_cursor': next_cursor})
     return jsonify({'Message': 'No Events Found'}), 404
 
 
 # Route to rsvp to an event
-@event.route('/event/<event_id>/rsvp', methods=['GET', 'POST'])
+@event.route('/event/<event_id>/rsvp', methods=['GET', 'POST', 'DELETE'])
 @token_required
 def rsvp_event(current_user, event_id):
     if request.method == 'POST':
@@ -233,44 +385,117 @@ def rsvp_event(current_user, event_id):
                 return jsonify({
                     'warning': 'You cannot make a reservation twice and you cannot make a '
                                'reservation to your own event'}), 403  # forbidden
+            except EventFull:
+                return jsonify({'warning': 'The event is fully booked'}), 409  # conflict
         return jsonify({'warning': 'The event you are trying to make a reservation to does not exist'}), 404
+    if request.method == 'DELETE':
+        event_found = Event.query.filter_by(id=event_id).first_or_404()
+        if event_found.cancel_rsvp(current_user):
+            return jsonify({'success': 'Your reservation has been cancelled'}), 200
+        return jsonify({'warning': 'You have not made a reservation to this event'}), 404
     if request.method == 'GET':
-        event_found = Event.query.filter_by(id=event_id).filter_by(owner=current_user.id).first()
+        # Only the owner sees who attends, paged by user id or streamed in full with ?stream=csv|ndjson|json
+        event_found = db.session.query(Event.rsvp_count).filter_by(id=event_id).filter_by(
+            owner=current_user.id).first()
         if event_found:
-            event_rsvps = event_found.rsvps.all()
-            if event_rsvps:
-                reservations = []
-                for user in event_rsvps:
-                    user_data = {'username': user.username, 'email': user.email}
-                    reservations.append(user_data)
-                return jsonify({'Attendants': reservations})
-            return jsonify({'Attendants': []})
+            attendees = User.attendees(event_id)
+            stream_format = request.args.get('stream')
+            if stream_format:
+                if stream_format not in STREAM_FORMATS:
+                    return jsonify({'message': 'The stream format should be one of {}'.format(
+                        ', '.join(sorted(STREAM_FORMATS)))}), 400
+                return stream_records(attendees.order_by(User.rsvps.c.user_id),
+                                      lambda row: {'username': row.username, 'email': row.email}, stream_format,
+                                      'Attendants')
+            try:
+                limit = max(1, min(request.args.get('limit', MAX_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+                token = request.args.get('cursor')
+                rows, next_cursor = id_keyset_page(attendees, User.rsvps.c.user_id,
+                                                   decode_id_cursor(token) if token else None, limit)
+            except ValueError as e:
+                return jsonify({'message': str(e)}), 400
+            reservations = [{'username': row.username, 'email': row.email} for row in rows]
+            return jsonify({'Attendants': reservations, 'next_cursor': next_cursor,
+                            'rsvp_count': event_found.rsvp_count})
         return jsonify({'Warning': 'The event you are to view a reservations for does not exist'}), 404
 
+
+@event.route('/events/rsvps', methods=['POST'])
+@token_required
+def bulk_rsvp(current_user):
+    """
+    Make many reservations for the current user in one request and one insert, for ticket drops.
+    The body is {"reservations": [{"event_id": 1}, ...]}, nobody can reserve places for other users.
+    Every reservation gets its own status: reserved, already_reserved, full or event_not_found
+    :param current_user:
+    :return:
+    """
+    reservations = (request.get_json() or {}).get('reservations')
+    if not isinstance(reservations, list) or not reservations:
+        return jsonify({'message': 'Please send the reservations to make as a list'}), 400
+    if len(reservations) > MAX_BULK_RSVPS:
+        return jsonify({'message': 'At most {} reservations can be made at once'.format(MAX_BULK_RSVPS)}), 400
+    try:
+        if any('user_id' in reservation for reservation in reservations):
+            return jsonify({'message': 'Reservations are made for the current user only, leave out user_id'}), 400
+        event_ids = list(OrderedDict.fromkeys(int(reservation['event_id']) for reservation in reservations))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'message': 'Every reservation needs an event_id'}), 400
+
+    found = {row[0] for row in db.session.query(Event.id).filter(Event.id.in_(event_ids))}
+    pairs = [(current_user.id, event_id) for event_id in event_ids if event_id in found]
+    statuses = dict.fromkeys(((current_user.id, event_id) for event_id in event_ids if event_id not in found),
+                             'event_not_found')
+    statuses.update(Event.reserve(pairs))
+    if 'reserved' in statuses.values():
+        ChangeVersion.bump(ChangeVersion.EVENTS)
+    db.session.commit()
+    response_cache.invalidate(*{event_tag(pair[1]) for pair, status in statuses.items() if status == 'reserved'})
+
+    results = [{'event_id': event_id, 'status': statuses[current_user.id, event_id]} for event_id in event_ids]
+    reserved = sum(1 for result in results if result['status'] == 'reserved')
+    return jsonify({'reserved': reserved, 'reservations': results}), 200
+
+
 # Route for searching events
 @event.route('/search', methods=['POST'])
 @event.route('/search/page=<int:page>&limit=<int:limit>', methods=['POST'])
 @event.route('/search/page=<int:page>', methods=['POST'])
 # @token_required
+@replica_router.replica_reads
+@response_cache.cached
 def combined_search(limit=9, page=1):
     q = request.args.get('q')
     if q and len(q)>0:
-        events = Event.query.filter(or_(Event.name.ilike('%{}%'.format(q)),Event.category.ilike('%{}%'.format(q)),Event.location.ilike('%{}%'.format(q)))).all()
-        events_list = []
-        if events:
-            for s_event in events:
-                event_data = {'name': s_event.name, 'category': s_event.category, 'location': s_event.location,
-                            'date_hosted': s_event.date_hosted, 'description': s_event.description}
-                events_list.append(event_data)
-            return jsonify({'events': events_list}), 200
+        response_cache.tag(ORDERING)
+        try:
+            event_ids, total = search_index.search(q, page=page, limit=limit)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        rows = []
+        if event_ids:
+            # Fetch the page by primary key and put it back in ranking order
+            found = {row.id: row for row in event_rows(Event.query.filter(Event.id.in_(event_ids)))}
+            rows = [found[event_id] for event_id in event_ids if event_id in found]
+        if rows:
+            response_cache.tag(*(event_tag(row.id) for row in rows))
+            return json_response({'events': serialize_events(rows), 'total': total})
         return jsonify({'message': 'No such event Found'}), 404
     else:
-        events = Event.query.all()
-        events_list = []
-        if events:
-            for s_event in events:
-                event_data = {'name': s_event.name, 'category': s_event.category, 'location': s_event.location,
-                            'date_hosted': s_event.date_hosted, 'description': s_event.description}
-                events_list.append(event_data)
-            return jsonify({'events': events_list}), 200
-        return jsonify({'message':"Something went terribly wrong"}), 400
+        stream_format = request.args.get('stream')
+        if stream_format:
+            # Export mode, every event is streamed so memory stays flat whatever the size of the table
+            if stream_format not in STREAM_FORMATS:
+                return jsonify({'message': 'The stream format should be one of {}'.format(
+                    ', '.join(sorted(STREAM_FORMATS)))}), 400
+            return stream_records(event_rows(Event.query).order_by(Event.id), serialize_event, stream_format,
+                                  'events')
+
+        try:
+            rows, next_cursor = paginated_events(event_rows(Event.query), limit, page)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        if rows:
+            response_cache.tag(*(event_tag(row.id) for row in rows))
+            return json_response({'events': serialize_events(rows), 'next_cursor': next_cursor})
+        return jsonify({'message': 'No Events Found'}), 404
@@ -1,3 +1,60 @@
-from flask_sqlalchemy import SQLAlchemy
+from flask import g, has_app_context
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql.dml import UpdateBase
 
-db = SQLAlchemy()
+from app.pool import InstrumentedQueuePool
+
+POOL_OPTIONS = ('pool_size', 'pool_timeout', 'pool_recycle', 'max_overflow')
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session running the queries of views marked with replica_reads on the replica chosen for the request, see
+    app/replicas.py. Flushes and UPDATE, INSERT and DELETE statements always go to the primary
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = g.get('db_replica') if has_app_context() else None
+        if replica is not None and not self._flushing and not isinstance(clause, UpdateBase):
+            return replica
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """
+    Flask-SQLAlchemy with the connection pool configured per config class.
+    SQLALCHEMY_POOL_MODE 'queue' keeps an InstrumentedQueuePool of SQLALCHEMY_POOL_SIZE connections in each process,
+    'pgbouncer' opens a connection per checkout and leaves pooling to pgbouncer in transaction mode
+    """
+
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, info, options):
+        SQLAlchemy.apply_driver_hacks(self, app, info, options)
+        if 'poolclass' in options:
+            # SQLite in memory or without a pool size, as chosen by Flask-SQLAlchemy
+            return
+        if app.config.get('SQLALCHEMY_POOL_MODE', 'queue') == 'pgbouncer':
+            # Connections only live for a checkout so there is nothing to size, recycle or ping. psycopg2 never
+            # prepares statements on the server, which pgbouncer could hand to another backend between transactions
+            for option in POOL_OPTIONS:
+                options.pop(option, None)
+            options['poolclass'] = NullPool
+        else:
+            options['poolclass'] = InstrumentedQueuePool
+            options['pre_ping'] = app.config.get('SQLALCHEMY_POOL_PRE_PING', True)
+
+    def pool_metrics(self, app=None):
+        """
+        The metrics of the engine's pool, see InstrumentedQueuePool.metrics, or None when it does not keep one
+        :param app:
+        :return:
+        """
+        pool = self.get_engine(app).pool
+        return pool.metrics() if isinstance(pool, InstrumentedQueuePool) else None
+
+
+db = PooledSQLAlchemy()
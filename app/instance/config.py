@@ -9,6 +9,25 @@ class BaseConfig(object):
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False
+    # Connection pool of each process, see app/init_db.py. 'pgbouncer' keeps no pool and leaves it to pgbouncer
+    SQLALCHEMY_POOL_MODE = os.getenv('SQLALCHEMY_POOL_MODE', 'queue')
+    SQLALCHEMY_POOL_SIZE = int(os.getenv('SQLALCHEMY_POOL_SIZE', 5))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.getenv('SQLALCHEMY_MAX_OVERFLOW', 10))
+    # Seconds to wait for a connection when all are checked out before giving up
+    SQLALCHEMY_POOL_TIMEOUT = 10
+    # Replace connections older than this, before the server or a firewall drops them
+    SQLALCHEMY_POOL_RECYCLE = 1800
+    # Test connections as they are checked out so the ones broken by a database restart get replaced
+    SQLALCHEMY_POOL_PRE_PING = True
+    # Read replicas for the read only views, see app/replicas.py. Comma separated urls, none reads from the primary
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if uri]
+    # 'round_robin' or 'least_loaded'
+    REPLICA_POLICY = os.getenv('REPLICA_POLICY', 'round_robin')
+    # Seconds a client reads from the primary after changing something
+    REPLICA_READ_YOUR_WRITES = 5
+    # asyncpg pool of each process serving asgi.py, see app/aio.py
+    ASYNC_POOL_MIN_SIZE = 2
+    ASYNC_POOL_MAX_SIZE = int(os.getenv('ASYNC_POOL_MAX_SIZE', 20))
     MAIL_SERVER = 'smtp.googlemail.com'
     MAIL_PORT = 465
     MAIL_USE_TLS = False
@@ -16,6 +35,46 @@ class BaseConfig(object):
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = 'felowambiri@gmail.com'
+    # Outbound mail queue, see app/mail_queue.py
+    MAIL_QUEUE_SIZE = 1000
+    MAIL_QUEUE_WORKERS = 1
+    MAIL_BATCH_SIZE = 20
+    MAIL_SEND_RETRIES = 3
+    MAIL_RETRY_BACKOFF = 1
+    MAIL_CONNECTION_IDLE = 30
+    MAIL_SPOOL_DIR = os.getenv('MAIL_SPOOL_DIR', 'mail_spool')
+    # Lifetime of the tokens handed out at login, blacklisted tokens are pruned once this has elapsed
+    JWT_LIFETIME_HOURS = 720
+    # How often each process picks up tokens revoked by the others and prunes expired ones, in seconds
+    REVOCATION_REFRESH_INTERVAL = 5
+    REVOCATION_PRUNE_INTERVAL = 3600
+    # Verified tokens are remembered per process for at most TOKEN_CACHE_TTL seconds
+    TOKEN_CACHE_SIZE = 1024
+    TOKEN_CACHE_TTL = 60
+    # Directory holding the whoosh search index
+    SEARCH_INDEX_DIR = os.getenv('SEARCH_INDEX_DIR', 'search_index')
+    # Password hashing, see app/passwords.py. Stored hashes made with other parameters are replaced at login
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:50000')
+    PASSWORD_SALT_LENGTH = 16
+    # Processes hashing passwords off the request workers, 0 hashes on the worker itself. At most
+    # PASSWORD_HASH_QUEUE more requests wait for them, others get a 503 after PASSWORD_HASH_TIMEOUT seconds
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE = 8
+    PASSWORD_HASH_TIMEOUT = 5
+    # Encode event listings with ujson when it is installed, see app/events/serializers.py
+    FAST_JSON = True
+    # Cache of the public event listing and search responses, see app/response_cache.py. 'memory' caches in each
+    # process, 'redis' shares the cache at RESPONSE_CACHE_REDIS_URL between processes and None turns it off. With
+    # several gunicorn workers only 'redis' lets a write reach the responses cached by the other workers at once
+    RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')
+    RESPONSE_CACHE_REDIS_URL = os.getenv('RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    RESPONSE_CACHE_SIZE = 1024
+    RESPONSE_CACHE_TTL = 10
+    # Request latency, SQL statement and serialization metrics, see app/metrics.py. They are served on METRICS_PATH
+    # and with METRICS_SERVER_TIMING also sent back on every response
+    METRICS_ENABLED = True
+    METRICS_PATH = '/metrics'
+    METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', '').lower() in ('1', 'true', 'yes')
 
 
 class TestingConfig(BaseConfig):
@@ -24,6 +83,12 @@ class TestingConfig(BaseConfig):
     TESTING = True
     PRESERVE_CONTEXT_ON_EXCEPTION = False
     SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DATABASE_URI')
+    # Keep the search index in memory so every test starts from an empty one
+    SEARCH_INDEX_DIR = None
+    # Cheap hashes on the test process itself keep the suite fast
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    PASSWORD_HASH_WORKERS = 0
+    SQLALCHEMY_POOL_SIZE = 2
 
 
 class DevelopmentConfig(BaseConfig):
@@ -36,6 +101,10 @@ class ProductionConfig(BaseConfig):
     DEBUG = False
     TESTING = False
     SQLALCHEMY_ECHO = False
+    # Indenting every response only helps someone reading it by hand
+    JSONIFY_PRETTYPRINT_REGULAR = False
+    SQLALCHEMY_POOL_SIZE = int(os.getenv('SQLALCHEMY_POOL_SIZE', 10))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.getenv('SQLALCHEMY_MAX_OVERFLOW', 20))
 
 
 app_config = {
@@ -0,0 +1,179 @@
+"""
+Outbound mail queue so that requests return as soon as a message is enqueued instead of waiting on SMTP
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import smtplib
+import socket
+import threading
+import time
+import uuid
+
+from flask import current_app
+from flask_mail import sanitize_address, sanitize_addresses
+
+logger = logging.getLogger(__name__)
+
+# Errors after which the connection is dropped and the message retried
+SEND_ERRORS = (smtplib.SMTPException, socket.error)
+
+
+class MailQueue(object):
+    """
+    Bounded queue of outgoing messages drained by a small pool of worker threads.
+    Each worker keeps one SMTP connection open and sends up to MAIL_BATCH_SIZE queued messages over it before
+    checking for more; the connection is closed after MAIL_CONNECTION_IDLE seconds without mail.
+    A failed send is retried MAIL_SEND_RETRIES times with exponential backoff and then written to MAIL_SPOOL_DIR,
+    as is any message arriving while the queue is full. `python manage.py flush_mail_spool` resends the spool
+    """
+
+    def __init__(self, mail, app=None):
+        self.mail = mail
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Workers are started on the first enqueue so that forked server processes each get their own
+        app.extensions['mail_queue'] = {
+            'queue': queue.Queue(maxsize=app.config.get('MAIL_QUEUE_SIZE', 1000)),
+            'workers': [],
+            'lock': threading.Lock(),
+        }
+
+    @staticmethod
+    def _state(app):
+        return app.extensions['mail_queue']
+
+    def enqueue(self, msg):
+        """
+        Hand the message over to the workers, spooling it to disk when the queue is full
+        :param msg:
+        :return: True when the message was queued, False when it was spooled
+        """
+        app = current_app._get_current_object()
+        state = self._state(app)
+        self._start_workers(app, state)
+        try:
+            state['queue'].put_nowait(msg)
+            return True
+        except queue.Full:
+            self.spool(app, msg)
+            return False
+
+    def join(self):
+        """ Block until every queued message has been sent or spooled """
+        self._state(current_app._get_current_object())['queue'].join()
+
+    def _start_workers(self, app, state):
+        with state['lock']:
+            if state['workers']:
+                return
+            for _ in range(app.config.get('MAIL_QUEUE_WORKERS', 1)):
+                worker = threading.Thread(target=self._work, args=(app, state['queue']), daemon=True)
+                worker.start()
+                state['workers'].append(worker)
+            atexit.register(self._spool_pending, app, state['queue'])
+
+    def _work(self, app, messages):
+        batch_size = app.config.get('MAIL_BATCH_SIZE', 20)
+        idle = app.config.get('MAIL_CONNECTION_IDLE', 30)
+        with app.app_context():
+            connection = None
+            while True:
+                try:
+                    batch = [messages.get(timeout=idle if connection else None)]
+                except queue.Empty:
+                    connection = self._close(connection)
+                    continue
+                while len(batch) < batch_size:
+                    try:
+                        batch.append(messages.get_nowait())
+                    except queue.Empty:
+                        break
+                for msg in batch:
+                    try:
+                        connection = self._send(app, connection, msg)
+                    except Exception:
+                        # A malformed message must not take the worker down with it
+                        logger.exception('Dropping mail to %s', msg.recipients)
+                    finally:
+                        messages.task_done()
+
+    def _send(self, app, connection, msg):
+        """
+        Send one message over the open connection, reconnecting and backing off between attempts
+        :return: the connection to reuse for the next message
+        """
+        retries = app.config.get('MAIL_SEND_RETRIES', 3)
+        backoff = app.config.get('MAIL_RETRY_BACKOFF', 1)
+        for attempt in range(retries + 1):
+            try:
+                if connection is None:
+                    connection = self.mail.connect().__enter__()
+                connection.send(msg)
+                return connection
+            except SEND_ERRORS as e:
+                logger.warning('Sending mail to %s failed on attempt %d: %s', msg.recipients, attempt + 1, e)
+                connection = self._close(connection)
+                if attempt < retries:
+                    time.sleep(backoff * 2 ** attempt)
+        self.spool(app, msg)
+        return connection
+
+    @staticmethod
+    def _close(connection):
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except SEND_ERRORS:
+                pass
+        return None
+
+    @staticmethod
+    def spool(app, msg):
+        """ Write the message to the spool directory to be resent later """
+        spool_dir = app.config.get('MAIL_SPOOL_DIR', 'mail_spool')
+        if not os.path.exists(spool_dir):
+            os.makedirs(spool_dir)
+        envelope = {'sender': sanitize_address(msg.sender), 'recipients': list(sanitize_addresses(msg.send_to)),
+                    'message': msg.as_string()}
+        path = os.path.join(spool_dir, '{}-{}.json'.format(int(time.time()), uuid.uuid4().hex))
+        with open(path, 'w') as spool_file:
+            json.dump(envelope, spool_file)
+        logger.error('Mail to %s was spooled to %s', msg.recipients, path)
+
+    def _spool_pending(self, app, messages):
+        while True:
+            try:
+                self.spool(app, messages.get_nowait())
+            except queue.Empty:
+                return
+
+    def flush_spool(self):
+        """
+        Resend every spooled message over a single connection, messages that fail again stay in the spool
+        :return: the number of messages sent
+        """
+        spool_dir = current_app.config.get('MAIL_SPOOL_DIR', 'mail_spool')
+        if not os.path.isdir(spool_dir):
+            return 0
+        sent = 0
+        with self.mail.connect() as connection:
+            if connection.host is None:
+                # Sending is suppressed, leave the spool for a configuration that really sends mail
+                return 0
+            for name in sorted(os.listdir(spool_dir)):
+                path = os.path.join(spool_dir, name)
+                with open(path) as spool_file:
+                    envelope = json.load(spool_file)
+                try:
+                    connection.host.sendmail(envelope['sender'], envelope['recipients'], envelope['message'])
+                except SEND_ERRORS as e:
+                    logger.warning('Resending %s failed: %s', path, e)
+                    continue
+                os.remove(path)
+                sent += 1
+        return sent
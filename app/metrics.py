@@ -0,0 +1,185 @@
+"""
+Request level instrumentation.
+Every request records its latency, the number of SQL statements it ran and their time, and the time spent turning
+responses into JSON, per endpoint. Statements are counted by SQLAlchemy engine events, so the token_required lookup
+and the queries on replicas count towards the request as well. The totals are served in the Prometheus text format
+on METRICS_PATH and, with METRICS_SERVER_TIMING, sent back on every response as a Server-Timing header.
+Each process keeps its own metrics, under gunicorn every worker answers the scrapes it happens to receive
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.init_db import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram(object):
+    """ Cumulative bucket counts, sum and count of observations per tuple of label values """
+
+    def __init__(self, name, documentation, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            # Counts per bucket, made cumulative when exposed
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def exposition(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} histogram'.format(self.name)]
+        with self.lock:
+            series = sorted((labels, (list(counts), total, count))
+                            for labels, (counts, total, count) in self.series.items())
+        for label_values, (counts, total, count) in series:
+            labels = ','.join('{}="{}"'.format(name, escape(value))
+                              for name, value in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(self.name, labels, bound, cumulative))
+            lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(self.name, labels, count))
+            lines.append('{}_sum{{{}}} {}'.format(self.name, labels, repr(total)))
+            lines.append('{}_count{{{}}} {}'.format(self.name, labels, count))
+        return lines
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['metrics_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('metrics_started', None)
+    if started is not None and has_request_context() and 'metrics_started' in g:
+        g.metrics_queries += 1
+        g.metrics_query_seconds += time.perf_counter() - started
+
+
+class Metrics(object):
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        METRICS_ENABLED turns the instrumentation on, METRICS_PATH is where the metrics are served (None serves them
+        nowhere) and METRICS_SERVER_TIMING adds the Server-Timing header
+        :param app:
+        :return:
+        """
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+        app.extensions['metrics'] = {
+            'latency': Histogram('http_request_duration_seconds', 'Time spent answering requests',
+                                 ('endpoint', 'method', 'status')),
+            'queries': Histogram('db_queries_per_request', 'SQL statements run per request', ('endpoint',),
+                                 QUERY_COUNT_BUCKETS),
+            'query_time': Histogram('db_query_duration_seconds', 'Time spent in SQL statements per request',
+                                    ('endpoint',)),
+            'serialization': Histogram('response_serialization_seconds', 'Time spent encoding responses per request',
+                                       ('endpoint',)),
+        }
+        # Engine events are global, every engine of every app reports to the request it runs in
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.json_encoder = timed_encoder(app.json_encoder)
+        if app.config.get('METRICS_PATH', '/metrics'):
+            app.add_url_rule(app.config.get('METRICS_PATH', '/metrics'), 'metrics', self.metrics_view)
+
+    @staticmethod
+    def _start():
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_query_seconds = 0.0
+        g.metrics_serialization_seconds = 0.0
+        g.metrics_serializing = 0
+
+    def _finish(self, response):
+        if 'metrics_started' not in g:
+            return response
+        elapsed = time.perf_counter() - g.metrics_started
+        histograms = current_app.extensions['metrics']
+        endpoint = request.endpoint or 'unmatched'
+        histograms['latency'].observe((endpoint, request.method, str(response.status_code)), elapsed)
+        histograms['queries'].observe((endpoint,), g.metrics_queries)
+        histograms['query_time'].observe((endpoint,), g.metrics_query_seconds)
+        histograms['serialization'].observe((endpoint,), g.metrics_serialization_seconds)
+        if current_app.config.get('METRICS_SERVER_TIMING', False):
+            response.headers['Server-Timing'] = 'db;dur={:.2f};desc="{} queries", serialize;dur={:.2f}, ' \
+                                                'app;dur={:.2f}'.format(g.metrics_query_seconds * 1000,
+                                                                        g.metrics_queries,
+                                                                        g.metrics_serialization_seconds * 1000,
+                                                                        elapsed * 1000)
+        return response
+
+    @contextmanager
+    def serializing(self):
+        """ Count the time spent in the block as serialization time of the request, nested blocks count once """
+        if not has_request_context() or 'metrics_started' not in g:
+            yield
+            return
+        g.metrics_serializing += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            g.metrics_serializing -= 1
+            if not g.metrics_serializing:
+                g.metrics_serialization_seconds += time.perf_counter() - started
+
+    def exposition(self):
+        """ The metrics of this process in the Prometheus text format, with those of the connection pool """
+        lines = []
+        for histogram in current_app.extensions['metrics'].values():
+            lines.extend(histogram.exposition())
+        pool = db.pool_metrics()
+        if pool is not None:
+            for key, value in sorted(pool.items()):
+                kind = 'counter' if key in ('checkouts', 'wait_seconds', 'timeouts', 'reconnects') else 'gauge'
+                lines.append('# TYPE db_pool_{} {}'.format(key, kind))
+                lines.append('db_pool_{} {}'.format(key, value))
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return current_app.response_class(self.exposition(), mimetype=None, content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def timed_encoder(encoder_class):
+    """ The app's JSON encoder counting the time jsonify spends encoding as serialization time """
+
+    class TimedJSONEncoder(encoder_class):
+        def encode(self, o):
+            with metrics.serializing():
+                return encoder_class.encode(self, o)
+
+    return TimedJSONEncoder
+
+
+metrics = Metrics()
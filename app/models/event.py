@@ -1,4 +1,68 @@
+from datetime import datetime
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+
 from app.init_db import db
+from app.response_cache import event_tag, response_cache
+
+# Reserves places for (user, event) pairs, keeps events.rsvp_count in step and refuses the pairs that would take an
+# event past its capacity, all in one statement. Locking the event rows serializes reservations to the same event
+# so the count each statement reads is the current one. A pair asked for twice takes one place
+RESERVE_SQL = text('''
+    WITH requested AS (
+        SELECT r.user_id, r.event_id, row_number() OVER (PARTITION BY r.event_id ORDER BY r.ord) AS place
+        FROM (SELECT DISTINCT ON (user_id, event_id) user_id, event_id, ord
+              FROM unnest(CAST(:user_ids AS integer[]), CAST(:event_ids AS integer[])) WITH ORDINALITY
+                  AS pairs (user_id, event_id, ord)
+              ORDER BY user_id, event_id, ord) AS r
+        WHERE NOT EXISTS (SELECT 1 FROM rsvps WHERE rsvps.user_id = r.user_id AND rsvps.event_id = r.event_id)
+    ), locked AS (
+        SELECT id, capacity, rsvp_count FROM events WHERE id IN (SELECT event_id FROM requested) FOR UPDATE
+    ), inserted AS (
+        INSERT INTO rsvps (user_id, event_id)
+        SELECT requested.user_id, requested.event_id FROM requested JOIN locked ON locked.id = requested.event_id
+        WHERE locked.capacity IS NULL OR requested.place <= locked.capacity - locked.rsvp_count
+        ON CONFLICT DO NOTHING
+        RETURNING user_id, event_id
+    ), counted AS (
+        UPDATE events SET rsvp_count = events.rsvp_count + added.total, updated_at = timezone('utc', now())
+        FROM (SELECT event_id, count(*) AS total FROM inserted GROUP BY event_id) AS added
+        WHERE events.id = added.event_id
+    )
+    SELECT requested.user_id, requested.event_id, inserted.user_id IS NOT NULL AS reserved
+    FROM requested LEFT JOIN inserted USING (user_id, event_id)
+''')
+
+# Which of the pairs have a reservation, as seen by a new statement
+RESERVED_SQL = text('''
+    SELECT user_id, event_id FROM rsvps
+    WHERE (user_id, event_id) IN (SELECT * FROM unnest(CAST(:user_ids AS integer[]), CAST(:event_ids AS integer[])))
+''')
+
+# Cancels a reservation and gives its place back in one statement
+CANCEL_SQL = text('''
+    WITH removed AS (
+        DELETE FROM rsvps WHERE user_id = :user_id AND event_id = :event_id RETURNING event_id
+    )
+    UPDATE events SET rsvp_count = rsvp_count - 1, updated_at = timezone('utc', now())
+    WHERE id IN (SELECT event_id FROM removed) RETURNING id
+''')
+
+# Deletes those of the events that belong to the owner together with their reservations in one statement. The
+# events are locked first so that no reservation can be made to them in between
+DELETE_EVENTS_SQL = text('''
+    WITH doomed AS (
+        SELECT id FROM events WHERE id = ANY(CAST(:event_ids AS integer[])) AND owner = :owner FOR UPDATE
+    ), removed_rsvps AS (
+        DELETE FROM rsvps WHERE event_id IN (SELECT id FROM doomed)
+    )
+    DELETE FROM events WHERE id IN (SELECT id FROM doomed) RETURNING id
+''')
+
+
+class EventFull(Exception):
+    """ Raised when a reservation is made to an event that has reached its capacity """
 
 
 class Event(db.Model):
@@ -9,6 +73,15 @@ class Event(db.Model):
 
     #   Create an Events table
     __tablename__ = 'events'
+    __table_args__ = (
+        # Keyset pagination seeks on these indexes instead of scanning past an offset
+        db.Index('ix_events_date_hosted_id', 'date_hosted', 'id'),
+        db.Index('ix_events_owner_date_hosted_id', 'owner', 'date_hosted', 'id'),
+        # An owner cannot have two events with the same name and category on the same date
+        db.Index('uq_events_owner_name_category_date_hosted', 'owner', 'name', 'category', 'date_hosted',
+                 unique=True),
+        db.CheckConstraint('capacity IS NULL OR rsvp_count <= capacity', name='ck_events_rsvp_count_within_capacity'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), nullable=False)
     category = db.Column(db.String(64), nullable=False)
@@ -16,27 +89,168 @@ class Event(db.Model):
     date_hosted = db.Column(db.DateTime)
     description = db.Column(db.String(180), nullable=True)
     owner = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # Number of reservations, maintained by the statements that add and remove them
+    rsvp_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Most reservations the event takes, no limit when empty
+    capacity = db.Column(db.Integer, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=func.timezone('utc', func.now()))
     user = db.relationship('User', back_populates='events')
 
-    def __init__(self, name, category, location, owner, date_hosted, description):
+    def __init__(self, name, category, location, owner, date_hosted, description, capacity=None):
         self.name = name
         self.category = category
         self.location = location
         self.owner = owner
         self.date_hosted = date_hosted
         self.description = description
+        self.capacity = capacity
 
     def check_reservation(self, user):
         return self.rsvps.filter_by(id=user.id).first()
 
     def make_rsvp(self, user):
-        if self.check_reservation(user) is None:
-            self.rsvps.append(user)
-            db.session.add(user)
-            db.session.commit()
-        else:
+        """
+        Reserve a place for the user with a single statement, the primary key of rsvps turns a second reservation
+        into a no-op even when both arrive at the same time
+        :param user:
+        :return:
+        """
+        status = Event.reserve([(user.id, self.id)])[user.id, self.id]
+        if status == 'reserved':
+            ChangeVersion.bump(ChangeVersion.EVENTS)
+        if status == 'already_reserved':
             raise AttributeError(
                 "You cannot make a reservation twice and you cannot make a reservation to your own event")
+        if status == 'full':
+            raise EventFull()
+        db.session.commit()
+        response_cache.invalidate(event_tag(self.id))
+
+    def cancel_rsvp(self, user):
+        """
+        Remove the user's reservation and give the place back
+        :param user:
+        :return: whether the user had a reservation
+        """
+        cancelled = db.session.execute(CANCEL_SQL, {'user_id': user.id, 'event_id': self.id}).first() is not None
+        if cancelled:
+            ChangeVersion.bump(ChangeVersion.EVENTS)
+        db.session.commit()
+        if cancelled:
+            response_cache.invalidate(event_tag(self.id))
+        return cancelled
+
+    @staticmethod
+    def reserve(pairs):
+        """
+        Make many reservations in one statement, see RESERVE_SQL.
+        The caller checks that the users and events exist and commits
+        :param pairs: (user_id, event_id) tuples
+        :return: a dict from each pair to reserved, already_reserved or full
+        """
+        statuses = dict.fromkeys(pairs, 'already_reserved')
+        if pairs:
+            rows = db.session.execute(RESERVE_SQL, {'user_ids': [pair[0] for pair in pairs],
+                                                    'event_ids': [pair[1] for pair in pairs]})
+            refused = []
+            for user_id, event_id, reserved in rows:
+                if reserved:
+                    statuses[user_id, event_id] = 'reserved'
+                else:
+                    refused.append((user_id, event_id))
+            if refused:
+                # A reservation of the same pair committed by a concurrent request after RESERVE_SQL started is
+                # hidden from its NOT EXISTS and only turns the insert into a no-op, a new statement sees it
+                taken = {tuple(row) for row in db.session.execute(RESERVED_SQL, {
+                    'user_ids': [pair[0] for pair in refused], 'event_ids': [pair[1] for pair in refused]})}
+                statuses.update((pair, 'already_reserved' if pair in taken else 'full') for pair in refused)
+        return statuses
+
+
+class EventCounter(db.Model):
+    """
+    Keeps running totals of events per owner, so that an owner's total never needs a COUNT(*) over events
+    The counters are adjusted in the same transaction as the events they count
+    """
+
+    __tablename__ = 'event_counters'
+
+    scope = db.Column(db.String(32), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def owner_scope(owner_id):
+        return 'owner:{}'.format(owner_id)
+
+    @staticmethod
+    def adjust(owner_id, delta):
+        """
+        Add delta to the owner's counter in a single upsert.
+        The session is flushed first so that the event rows are always locked before the counter
+        :param owner_id:
+        :param delta:
+        :return:
+        """
+        db.session.flush()
+        table = EventCounter.__table__
+        stmt = insert(table).values(scope=EventCounter.owner_scope(owner_id), total=delta)
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.scope],
+                                          set_={'total': table.c.total + stmt.excluded.total})
+        db.session.execute(stmt)
+
+    @staticmethod
+    def get_total(scope):
+        """ Return the counter for the given scope, a missing counter means nothing has been created yet """
+        return db.session.query(EventCounter.total).filter_by(scope=scope).scalar() or 0
+
+    @staticmethod
+    def get_overall_total():
+        """ Return the sum of the owners' counters, asked for too rarely to keep a counter every write updates """
+        return db.session.query(func.sum(EventCounter.total)).scalar() or 0
+
+
+class ChangeVersion(db.Model):
+    """
+    A version number per table that every change to the table bumps in the transaction making the change, so that
+    readers can tell whether anything changed since they last looked from a single indexed lookup.
+    The version is spread over SLOTS rows and each connection bumps its own, concurrent writers do not queue up on one
+    row. The sum of the slots grows with every change whatever order they commit in
+    """
+
+    __tablename__ = 'change_versions'
+    EVENTS = 'events'
+    SLOTS = 16
+
+    scope = db.Column(db.String(32), primary_key=True)
+    slot = db.Column(db.Integer, primary_key=True, default=0, server_default='0')
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @staticmethod
+    def bump(scope):
+        """
+        Move the scope to its next version.
+        Call it last before committing, once the changed rows are flushed, so that the slot is always locked after
+        the rows and only until the commit
+        :param scope:
+        :return:
+        """
+        table = ChangeVersion.__table__
+        # now() is the start of the transaction, a transaction committing later could carry an earlier time
+        stmt = insert(table).values(scope=scope, slot=func.pg_backend_pid() % ChangeVersion.SLOTS, version=1,
+                                    changed_at=func.timezone('utc', func.clock_timestamp()))
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.scope, table.c.slot],
+                                          set_={'version': table.c.version + 1,
+                                                'changed_at': stmt.excluded.changed_at})
+        db.session.execute(stmt)
+
+    @staticmethod
+    def current(scope):
+        """ Return the (version, changed_at) of the scope, (0, None) when it has never changed """
+        version, changed_at = db.session.query(func.sum(ChangeVersion.version),
+                                               func.max(ChangeVersion.changed_at)).filter_by(scope=scope).one()
+        return (int(version), changed_at) if version is not None else (0, None)
 
 
 # Return a printable representation of Event class object
@@ -1,13 +1,22 @@
+import hashlib
+import logging
 from datetime import date, datetime
 
 from flask import current_app
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 from sqlalchemy import cast, Date
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import make_transient_to_detached
 from sqlalchemy import or_
 
 from app.init_db import db
-from app.models.event import Event
+from app.models.event import DELETE_EVENTS_SQL, ChangeVersion, Event, EventCounter
+from app.passwords import password_hasher
+from app.response_cache import LISTING, ORDERING, event_tag, response_cache
+from app.search import search_index
+
+logger = logging.getLogger(__name__)
 
 
 class User(db.Model):
@@ -17,7 +26,9 @@ class User(db.Model):
     """
     rsvps = db.Table('rsvps',
                      db.Column('user_id', db.ForeignKey('users.id'), primary_key=True),
-                     db.Column('event_id', db.ForeignKey('events.id'), primary_key=True)
+                     db.Column('event_id', db.ForeignKey('events.id'), primary_key=True),
+                     # The primary key leads with the user, attendee listings need the event first
+                     db.Index('ix_rsvps_event_id_user_id', 'event_id', 'user_id')
                      )
 
     # Create a User table
@@ -25,7 +36,9 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), index=True, nullable=False)
     email = db.Column(db.String(64), index=True, unique=True, nullable=False)
-    pw_hash = db.Column(db.String(100))
+    pw_hash = db.Column(db.String(255))
+    # Administrators may export the events of every user
+    is_admin = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     events = db.relationship('Event', back_populates='user')
     ind_rsvps = db.relationship('Event', secondary=rsvps, backref=db.backref('rsvps', lazy='dynamic'))
 
@@ -44,12 +57,49 @@ class User(db.Model):
     def password(self, password):
         """ Set password to a hashed password """
 
-        self.pw_hash = generate_password_hash(password)
+        self.pw_hash = password_hasher.hash(password)
 
     def compare_hashed_password(self, password):
-        """ To verify if the hashed password matches the actual password """
+        """
+        To verify if the hashed password matches the actual password.
+        A hash made with other parameters than the configured ones is replaced once the password is known to match
+        """
+        if not password_hasher.verify(self.pw_hash, password):
+            return False
+        if password_hasher.needs_rehash(self.pw_hash):
+            self.password = password
+            db.session.commit()
+        return True
+
+    def snapshot(self):
+        """ Return the lightweight, cacheable identity of the user """
+        return {'id': self.id, 'username': self.username, 'email': self.email, 'is_admin': self.is_admin}
 
-        return check_password_hash(self.pw_hash, password)
+    @staticmethod
+    def from_snapshot(snapshot):
+        """
+        Rebuild a session bound user from a snapshot without querying the database.
+        Attributes left out of the snapshot such as the password hash are loaded when first accessed
+        :param snapshot:
+        :return:
+        """
+        user = User.__mapper__.class_manager.new_instance()
+        for key, value in snapshot.items():
+            setattr(user, key, value)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    @staticmethod
+    def attendees(event_id):
+        """
+        Query of the user_id, username and email of every user attending the event, as column tuples so that
+        neither whole users nor their password hashes are loaded
+        :param event_id:
+        :return:
+        """
+        rsvps = User.rsvps
+        return db.session.query(rsvps.c.user_id, User.username, User.email).join(
+            User, User.id == rsvps.c.user_id).filter(rsvps.c.event_id == event_id)
 
     def generate_confirmation_token(self, expiration=3600):
         s = Serializer(current_app.config['SECRET_KEY'], expiration)
@@ -61,32 +111,65 @@ class User(db.Model):
         try:
             data = s.loads(token)
         except Exception as e:
-            print(e)
+            logger.info('Refused a confirmation token: %s', e)
             return False
         user = User.query.filter_by(id=data.get('confirm')).first()
         return user
 
-    def create_event(self, name, category, location, date_hosted, description):
+    def create_event(self, name, category, location, date_hosted, description, capacity=None):
         """
-        Method creates an event by first checking its existence and raising an integrity error if in existence
+        Method creates an event unless the user already has one with the same name, category and date.
+        The unique index on those columns decides in the same statement as the insert so concurrent requests
+        cannot create duplicates
         :param date_hosted:
         :param name:
         :param category:
         :param location:
         :param description:
-        :return:
+        :param capacity:
+        :return: the event or None when it already exists
         """
+        event = Event(name=name, category=category, location=location, owner=self.id, date_hosted=date_hosted,
+                      description=description, capacity=capacity)
+        table = Event.__table__
+        stmt = insert(table).values(name=name, category=category, location=location, owner=self.id,
+                                    date_hosted=date_hosted, description=description, capacity=capacity)
+        event.id = db.session.execute(stmt.on_conflict_do_nothing().returning(table.c.id)).scalar()
+        if event.id is None:
+            return None
+        make_transient_to_detached(event)
+        db.session.add(event)
+        EventCounter.adjust(self.id, 1)
+        ChangeVersion.bump(ChangeVersion.EVENTS)
+        db.session.commit()
+        search_index.add(event)
+        response_cache.invalidate(LISTING, ORDERING)
+        return event
 
-        event = Event.query.filter_by(name=name).filter_by(category=category).filter_by(owner=self.id).filter_by(
-            date_hosted=date_hosted).first()
-        if not event:
-            event = Event(name=name, category=category, location=location, owner=self.id, date_hosted=date_hosted,
-                          description=description, )
-            db.session.add(event)
-            db.session.commit()
-            return event
+    def import_events(self, events):
+        """
+        Create many events with one multi-row insert and commit them together. Events the user already has are
+        skipped by the unique index in the same statement as in create_event
+        :param events: dicts of the name, category, location, date_hosted, description and capacity of each event
+        :return: the id, name, category, location and date_hosted of the events created
+        """
+        if not events:
+            return []
+        table = Event.__table__
+        stmt = insert(table).values([dict(event, owner=self.id) for event in events])
+        created = db.session.execute(stmt.on_conflict_do_nothing().returning(
+            table.c.id, table.c.name, table.c.category, table.c.location, table.c.date_hosted)).fetchall()
+        if created:
+            EventCounter.adjust(self.id, len(created))
+            ChangeVersion.bump(ChangeVersion.EVENTS)
+        db.session.commit()
+        if created:
+            search_index.add(*created)
+            response_cache.invalidate(LISTING, ORDERING)
+        return created
 
-    def update_event(self, event_id=None, name=None, category=None, location=None, date_hosted=None, description=None):
+    def update_event(self, event_id=None, name=None, category=None, location=None, date_hosted=None, description=None,
+                     capacity=None):
         """
         Method updates an event and if the field is empty it populates that field with previously stored info
         :param event_id:
@@ -95,7 +178,8 @@ class User(db.Model):
         :param category:
         :param location:
         :param description:
-        :return:
+        :param capacity:
+        :return: the event, or the reason it could not be updated
         """
         event = Event.query.filter_by(id=event_id).filter_by(owner=self.id).first()
         if event:
@@ -108,22 +192,29 @@ class User(db.Model):
             if location.strip():
                 event.location = location
 
-            if date_hosted.strip():
+            if date_hosted:
                 event.date_hosted = date_hosted
 
             if description.strip():
                 event.description = description
 
-            u_event = Event.query.filter_by(name=event.name).filter_by(category=event.category).filter_by(
-                owner=self.id).filter_by(
-                date_hosted=event.date_hosted).first()
+            if capacity is not None:
+                event.capacity = capacity
 
-            if u_event.id != event.id:
-                return "You cannot update an event to duplicate an existing event"
-            else:
+            try:
+                db.session.flush()
+                ChangeVersion.bump(ChangeVersion.EVENTS)
                 db.session.commit()
-                return event
-        print('The event does not exist')
+            except IntegrityError as e:
+                db.session.rollback()
+                if getattr(e.orig.diag, 'constraint_name', None) == 'ck_events_rsvp_count_within_capacity':
+                    return "The capacity cannot be lower than the number of reservations already made"
+                # Otherwise the unique index refused a duplicate of another of the user's events
+                return "You cannot update an event to duplicate an existing event"
+            search_index.add(event)
+            response_cache.invalidate(ORDERING, event_tag(event.id))
+            return event
+        logger.debug('Event %s of user %s does not exist', event_id, self.id)
 
     def delete_event(self, event_id):
         """
@@ -133,11 +224,105 @@ class User(db.Model):
         """
         event = Event.query.filter_by(id=event_id).filter_by(owner=self.id).first()
         if event:
+            deleted_id = event.id
             db.session.delete(event)
+            EventCounter.adjust(self.id, -1)
+            ChangeVersion.bump(ChangeVersion.EVENTS)
             db.session.commit()
+            search_index.remove(deleted_id)
+            response_cache.invalidate(LISTING, ORDERING, event_tag(deleted_id))
         else:
             raise AttributeError
 
+    def _refusals(self, event_ids, capacity=None):
+        """
+        Tell why a bulk statement left events out: event_not_found, forbidden for the events of other users or
+        below_reservations when the new capacity is lower than the reservations already made
+        :param event_ids:
+        :param capacity:
+        :return: a dict from event id to its status
+        """
+        statuses = dict.fromkeys(event_ids, 'event_not_found')
+        for event_id, owner, rsvp_count in db.session.query(Event.id, Event.owner, Event.rsvp_count).filter(
+                Event.id.in_(event_ids)):
+            if owner != self.id:
+                statuses[event_id] = 'forbidden'
+            elif capacity is not None and rsvp_count > capacity:
+                statuses[event_id] = 'below_reservations'
+        return statuses
+
+    def update_events(self, event_ids, name='', category='', location='', date_hosted=None, description='',
+                      capacity=None):
+        """
+        Apply the same changes to many of the user's events with one UPDATE, empty fields are left as they are.
+        When the changes would make events duplicates of each other or of other events of the user, the events are
+        updated one by one instead so that only the duplicates are refused
+        :param event_ids:
+        :param name:
+        :param category:
+        :param location:
+        :param date_hosted:
+        :param description:
+        :param capacity:
+        :return: a dict from each event id to updated, duplicate, below_reservations, forbidden or event_not_found
+        """
+        table = Event.__table__
+        changes = {key: value for key, value in (('name', name), ('category', category), ('location', location),
+                                                 ('description', description)) if value.strip()}
+        if date_hosted:
+            changes['date_hosted'] = date_hosted
+        if capacity is not None:
+            changes['capacity'] = capacity
+        condition = table.c.owner == self.id
+        if capacity is not None:
+            condition &= table.c.rsvp_count <= capacity
+        stmt = table.update().values(changes).returning(table.c.id, table.c.name, table.c.category, table.c.location)
+
+        try:
+            with db.session.begin_nested():
+                updated = db.session.execute(stmt.where(condition & table.c.id.in_(event_ids))).fetchall()
+            statuses = {}
+        except IntegrityError:
+            updated, statuses = [], {}
+            for event_id in event_ids:
+                try:
+                    with db.session.begin_nested():
+                        updated += db.session.execute(stmt.where(condition & (table.c.id == event_id))).fetchall()
+                except IntegrityError:
+                    statuses[event_id] = 'duplicate'
+        statuses.update((row.id, 'updated') for row in updated)
+        left_out = [event_id for event_id in event_ids if event_id not in statuses]
+        if left_out:
+            statuses.update(self._refusals(left_out, capacity))
+        if updated:
+            ChangeVersion.bump(ChangeVersion.EVENTS)
+        db.session.commit()
+        if updated:
+            search_index.add(*updated)
+            response_cache.invalidate(ORDERING, *(event_tag(row.id) for row in updated))
+        return statuses
+
+    def delete_events(self, event_ids):
+        """
+        Delete many of the user's events and their reservations in one statement, see DELETE_EVENTS_SQL
+        :param event_ids:
+        :return: a dict from each event id to deleted, forbidden or event_not_found
+        """
+        deleted = [row.id for row in db.session.execute(DELETE_EVENTS_SQL, {'event_ids': list(event_ids),
+                                                                             'owner': self.id})]
+        statuses = dict.fromkeys(deleted, 'deleted')
+        left_out = [event_id for event_id in event_ids if event_id not in statuses]
+        if left_out:
+            statuses.update(self._refusals(left_out))
+        if deleted:
+            EventCounter.adjust(self.id, -len(deleted))
+            ChangeVersion.bump(ChangeVersion.EVENTS)
+        db.session.commit()
+        if deleted:
+            search_index.remove(*deleted)
+            response_cache.invalidate(LISTING, ORDERING, *(event_tag(event_id) for event_id in deleted))
+        return statuses
+
     def get_specific_event(self, event_id):
         """
         This method returns a specific event when given the events name
@@ -148,15 +333,15 @@ class User(db.Model):
             event = Event.query.filter_by(id=event_id).filter_by(owner=self.id).first()
             return event
         except AttributeError:
-            print('The event you are trying to retrieve does not exist')
+            logger.debug('Event %s of user %s does not exist', event_id, self.id)
             return False
 
     def get_number_of_events(self):
         """
-        This method queries and returns the total number of events a person has created
+        This method returns the total number of events a person has created from their event counter
         :return:
         """
-        return Event.query.filter_by(owner=self.id).count()
+        return EventCounter.get_total(EventCounter.owner_scope(self.id))
 
     # @staticmethod
     # def search_event_by_name(name):
@@ -180,8 +365,7 @@ class User(db.Model):
         :param new_pass:
         :return:
         """
-        pass_hash = generate_password_hash(new_pass)
-        self.pw_hash = pass_hash
+        self.password = new_pass
         db.session.add(self)
         db.session.commit()
 
@@ -189,26 +373,41 @@ class User(db.Model):
         return '<User %r>' % self.username
 
 
+def token_digest(token):
+    """ Fixed size SHA-256 digest of a token, raw tokens are never stored """
+    return hashlib.sha256(str(token).encode()).hexdigest()
+
+
 class BlacklistToken(db.Model):
-    """ Token Model for storing blacklisted tokens """
+    """ Token Model for storing the digests of revoked tokens """
 
     __tablename__ = 'blacklist_tokens'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    token = db.Column(db.String(500), unique=True, nullable=False)
-    blacklisted_on = db.Column(db.DateTime, nullable=False, default=datetime.utcnow())
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    blacklisted_on = db.Column(db.DateTime, nullable=False, index=True, default=datetime.utcnow)
 
     def __init__(self, token):
-        self.token = token
+        self.token_hash = token_digest(token)
 
     @staticmethod
     def check_blacklist(token):
         # check if auth token is blacklisted
-        res = BlacklistToken.query.filter_by(token=str(token)).first()
+        res = BlacklistToken.query.filter_by(token_hash=token_digest(token)).first()
         if res:
             return True
         else:
             return False
 
+    @staticmethod
+    def prune(older_than):
+        """
+        Delete the rows of tokens blacklisted before the given time, they have expired by now anyway
+        :param older_than:
+        :return:
+        """
+        return BlacklistToken.query.filter(BlacklistToken.blacklisted_on < older_than).delete(
+            synchronize_session=False)
+
     def __repr__(self):
-        return '<id: token: {}'.format(self.token)
+        return '<id: token_hash: {}'.format(self.token_hash)
@@ -1,10 +1,14 @@
+import logging
+
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
 
 from app.init_db import db
-from app.models.event import Event
+from app.models.event import EventCounter
 from app.models.user import User
 
+logger = logging.getLogger(__name__)
+
 
 class UserAccounts:
     """ Creates and manages individual user accounts """
@@ -26,7 +30,7 @@ class UserAccounts:
             return user
         except IntegrityError:
             db.session.rollback()
-            print('There exists user with that email address.Please choose another email')
+            logger.info('A user with the email %s already exists', email)
 
     @staticmethod
     def get_specific_user(email):
@@ -53,12 +57,12 @@ class UserAccounts:
             db.session.delete(user)
             db.session.commit()
         except NoResultFound:
-            print("The user you are trying to delete does not exist")
+            logger.info('There is no user with the email %s to delete', email)
 
     @staticmethod
     def get_number_of_all_users_events():
         """
-        This method queries the database and returns the total number of all the events present in the database
+        This method returns the total number of all the events present in the database from the owners' counters
         :return:
         """
-        return Event.query.count()
+        return EventCounter.get_overall_total()
@@ -0,0 +1,99 @@
+"""
+Password hashing with a configurable cost, optionally run in a bounded pool of processes so that a burst of logins
+cannot take every request worker's CPU away from the other endpoints
+"""
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class PasswordHashingBusy(Exception):
+    """ Raised when every slot of the hashing pool stays taken for PASSWORD_HASH_TIMEOUT seconds """
+
+
+def normalized_method(method):
+    """
+    The method prefix werkzeug writes into a hash generated with the given method, pbkdf2 gets its iterations
+    :param method:
+    :return:
+    """
+    if method.startswith('pbkdf2:') and method.count(':') == 1:
+        return '{}:{}'.format(method, DEFAULT_PBKDF2_ITERATIONS)
+    return method
+
+
+class PasswordHasher(object):
+    """
+    Hashes and verifies passwords with PASSWORD_HASH_METHOD and PASSWORD_SALT_LENGTH.
+    With PASSWORD_HASH_WORKERS above 0 the work runs in that many processes and at most PASSWORD_HASH_QUEUE more
+    calls wait for them, further calls give up with PasswordHashingBusy after PASSWORD_HASH_TIMEOUT seconds.
+    Hashes made with other parameters still verify and needs_rehash tells when to replace them
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        workers = app.config.get('PASSWORD_HASH_WORKERS', 0)
+        slots = workers + app.config.get('PASSWORD_HASH_QUEUE', 0)
+        # The pool is started on first use so that forked server processes each get their own
+        app.extensions['password_hasher'] = {
+            'executor': None,
+            'slots': threading.BoundedSemaphore(slots) if workers else None,
+            'lock': threading.Lock(),
+        }
+
+    @staticmethod
+    def _state():
+        return current_app.extensions['password_hasher']
+
+    def _executor(self, state):
+        with state['lock']:
+            if state['executor'] is None:
+                state['executor'] = ProcessPoolExecutor(max_workers=current_app.config['PASSWORD_HASH_WORKERS'])
+            return state['executor']
+
+    def _run(self, func, *args):
+        state = self._state()
+        if state['slots'] is None:
+            return func(*args)
+        if not state['slots'].acquire(timeout=current_app.config.get('PASSWORD_HASH_TIMEOUT', 5)):
+            raise PasswordHashingBusy()
+        try:
+            return self._executor(state).submit(func, *args).result()
+        finally:
+            state['slots'].release()
+
+    def hash(self, password):
+        """
+        Hash the password with the configured parameters
+        :param password:
+        :return:
+        """
+        config = current_app.config
+        return self._run(generate_password_hash, password, config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256'),
+                         config.get('PASSWORD_SALT_LENGTH', 8))
+
+    def verify(self, pw_hash, password):
+        """
+        Check the password against a hash made with any parameters
+        :param pw_hash:
+        :param password:
+        :return:
+        """
+        return self._run(check_password_hash, pw_hash, password)
+
+    @staticmethod
+    def needs_rehash(pw_hash):
+        """ Whether the hash was made with other parameters than the configured ones """
+        config = current_app.config
+        method, _, rest = pw_hash.partition('$')
+        salt = rest.partition('$')[0]
+        return method != normalized_method(config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')) or \
+            len(salt) != config.get('PASSWORD_SALT_LENGTH', 8)
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,107 @@
+"""
+Connection pooling for the database engine.
+InstrumentedQueuePool is SQLAlchemy's QueuePool counting how long requests wait for a connection and optionally
+pinging every connection it hands out, so that connections killed by a Postgres restart are replaced instead of
+failing the request that gets them. Behind a server side pooler such as pgbouncer the application keeps no pool of
+its own, see PooledSQLAlchemy in app/init_db.py
+"""
+import threading
+import time
+
+from sqlalchemy import exc, event
+from sqlalchemy.pool import QueuePool
+
+
+def ping_connection(dbapi_connection, connection_record, connection_proxy):
+    """
+    Checkout listener testing the connection with a round trip, a dead one makes the pool connect again
+    (pool_pre_ping only exists from SQLAlchemy 1.2 on)
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    except Exception:
+        connection_record.record_info['pool_ping_failed'] = True
+        raise exc.DisconnectionError()
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+
+class PoolStats(object):
+    """ Running totals of the waits for a connection and the connections replaced """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.reconnects = 0
+
+    def record_wait(self, seconds, timed_out=False):
+        with self.lock:
+            self.checkouts += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+            self.timeouts += timed_out
+
+    def record_reconnect(self):
+        with self.lock:
+            self.reconnects += 1
+
+
+class InstrumentedQueuePool(QueuePool):
+
+    def __init__(self, creator, pre_ping=False, stats=None, **kw):
+        QueuePool.__init__(self, creator, **kw)
+        self.pre_ping = pre_ping
+        self.stats = stats or PoolStats()
+        if pre_ping and not event.contains(self, 'checkout', ping_connection):
+            event.listen(self, 'checkout', ping_connection)
+            event.listen(self, 'connect', self._count_reconnect)
+
+    def _count_reconnect(self, dbapi_connection, connection_record):
+        # A record that failed its ping connects again with the same record
+        if connection_record.record_info.pop('pool_ping_failed', False):
+            self.stats.record_reconnect()
+
+    def _do_get(self):
+        started = time.monotonic()
+        try:
+            connection = QueuePool._do_get(self)
+        except exc.TimeoutError:
+            self.stats.record_wait(time.monotonic() - started, timed_out=True)
+            raise
+        self.stats.record_wait(time.monotonic() - started)
+        return connection
+
+    def recreate(self):
+        self.logger.info("Pool recreating")
+        return self.__class__(self._creator, pool_size=self._pool.maxsize, max_overflow=self._max_overflow,
+                              timeout=self._timeout, recycle=self._recycle, echo=self.echo,
+                              logging_name=self._orig_logging_name, use_threadlocal=self._use_threadlocal,
+                              reset_on_return=self._reset_on_return, _dispatch=self.dispatch,
+                              dialect=self._dialect, pre_ping=self.pre_ping, stats=self.stats)
+
+    def metrics(self):
+        """
+        The state of the pool: connections checked out and beyond pool_size right now, and the time spent waiting
+        for a connection, the waits that timed out and the dead connections replaced so far
+        :return:
+        """
+        stats = self.stats
+        with stats.lock:
+            return {
+                'size': self.size(),
+                'checked_out': self.checkedout(),
+                'checked_in': self.checkedin(),
+                'overflow': max(self.overflow(), 0),
+                'checkouts': stats.checkouts,
+                'wait_seconds': stats.wait_seconds,
+                'max_wait_seconds': stats.max_wait_seconds,
+                'timeouts': stats.timeouts,
+                'reconnects': stats.reconnects,
+            }
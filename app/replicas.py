@@ -0,0 +1,122 @@
+"""
+Read replica routing.
+Views decorated with replica_reads run their queries on one of the SQLALCHEMY_REPLICA_URIS engines, everything else
+including flushes and UPDATE/DELETE statements stays on the primary, see RoutingSession in app/init_db.py.
+A client that changed something is served from the primary for REPLICA_READ_YOUR_WRITES seconds afterwards so it
+never reads a replica that has not caught up with its own change yet. Clients are told apart by a digest of their
+Authorization header, which also covers the public listings as long as the client sends its token along
+"""
+import hashlib
+import itertools
+import threading
+from functools import wraps
+
+import sqlalchemy
+from flask import current_app, g, request
+from sqlalchemy.engine.url import make_url
+
+from app.cache import TTLCache
+from app.init_db import db
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def client_key():
+    authorization = request.headers.get('Authorization')
+    if authorization:
+        return hashlib.sha256(authorization.encode()).hexdigest()
+
+
+def checked_out(engine):
+    pool = engine.pool
+    return pool.checkedout() if hasattr(pool, 'checkedout') else 0
+
+
+class ReplicaRouter(object):
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        REPLICA_POLICY is 'round_robin' or 'least_loaded', the replica with the fewest connections checked out
+        :param app:
+        :return:
+        """
+        app.extensions['replica_router'] = {
+            'engines': None,
+            'turns': itertools.count(),
+            'writers': TTLCache(maxsize=app.config.get('REPLICA_WRITERS_SIZE', 10000),
+                                ttl=app.config.get('REPLICA_READ_YOUR_WRITES', 5)),
+            'lock': threading.Lock(),
+        }
+        app.after_request(self._remember_writer)
+
+    @property
+    def _state(self):
+        return current_app.extensions['replica_router']
+
+    def engines(self):
+        """
+        The replica engines, created on first use with the same pool options as the primary so that processes
+        forked after create_app do not share connections
+        :return:
+        """
+        state = self._state
+        if state['engines'] is None:
+            with state['lock']:
+                if state['engines'] is None:
+                    state['engines'] = [self._create_engine(uri)
+                                        for uri in current_app.config.get('SQLALCHEMY_REPLICA_URIS') or ()]
+        return state['engines']
+
+    def _create_engine(self, uri):
+        app = current_app._get_current_object()
+        info = make_url(uri)
+        options = {'convert_unicode': True}
+        db.apply_pool_defaults(app, options)
+        db.apply_driver_hacks(app, info, options)
+        return sqlalchemy.create_engine(info, **options)
+
+    def choose(self):
+        """
+        The replica engine the reads of this request go to, None when they have to go to the primary
+        :return:
+        """
+        engines = self.engines()
+        if not engines:
+            return None
+        state = self._state
+        key = client_key()
+        if key is not None and state['writers'].get(key):
+            return None
+        turn = next(state['turns']) % len(engines)
+        if current_app.config.get('REPLICA_POLICY', 'round_robin') == 'least_loaded':
+            # Starting from the next one in turn so that ties go round robin
+            return min(engines[turn:] + engines[:turn], key=checked_out)
+        return engines[turn]
+
+    def _remember_writer(self, response):
+        view = current_app.view_functions.get(request.endpoint)
+        if request.method not in READ_METHODS and not getattr(view, 'replica_reads', False):
+            key = client_key()
+            if key is not None:
+                self._state['writers'].set(key, True)
+        return response
+
+    def replica_reads(self, f):
+        """ Run the queries of a read only view on a replica """
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            g.db_replica = self.choose()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                g.pop('db_replica', None)
+
+        decorated.replica_reads = True
+        return decorated
+
+
+replica_router = ReplicaRouter()
@@ -0,0 +1,207 @@
+"""
+Shared cache of whole responses for the public, read heavy event listings.
+Entries are keyed by the method, path and query arguments of the request and carry the tags of what they show: the
+event listing as a whole and every event on the page. The User and Event methods that change events invalidate the
+tags they touch after committing, so a reservation only drops the pages showing that event.
+
+A tag is invalidated by giving it a fresh random token, an entry is served only while the tokens it was stored with
+are still current. Every invalidation also bumps a sequence number first and a response is only stored when the
+sequence did not move while it was being built, otherwise it could hold data read before a commit together with
+tokens read after it.
+
+The memory backend lives in each process, invalidations made by other processes only reach it once its entries
+expire after RESPONSE_CACHE_TTL seconds. The redis backend is shared by every process.
+"""
+import pickle
+import threading
+import uuid
+from functools import wraps
+
+from flask import current_app, g, make_response, request
+from werkzeug.urls import url_encode
+
+from app.cache import TTLCache
+
+try:
+    import redis
+except ImportError as e:  # pragma: no cover - only the memory backend is available
+    redis = None
+    redis_import_error = e
+
+# Tags of the event listings, pages ordered by id change when events are created or deleted while search results and
+# pages ordered by date also change when an event is updated
+LISTING = 'events'
+ORDERING = 'events:order'
+SEQUENCE = 'sequence'
+
+
+def event_tag(event_id):
+    return 'event:{}'.format(event_id)
+
+
+class CacheBackend(object):
+    """ What the response cache needs from a store, values are opaque python objects """
+
+    def get_many(self, keys):
+        """ Return the value of every key, None for missing or expired ones """
+        raise NotImplementedError
+
+    def set_many(self, mapping, ttl):
+        raise NotImplementedError
+
+    def incr(self, key):
+        """ Atomically increment a counter that never expires and return its new value """
+        raise NotImplementedError
+
+    def counter(self, key):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """ Backend local to the process, a size bounded LRU TTLCache """
+
+    def __init__(self, maxsize=1024, ttl=10):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        return [self.entries.get(key) for key in keys]
+
+    def set_many(self, mapping, ttl):
+        for key, value in mapping.items():
+            self.entries.set(key, value, ttl=ttl)
+
+    def incr(self, key):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+            return self.counters[key]
+
+    def counter(self, key):
+        return self.counters.get(key, 0)
+
+
+class RedisBackend(CacheBackend):
+    """
+    Backend on a redis client or anything offering its get, mget, set(px=) and incr commands.
+    Size and eviction are left to the server's maxmemory policy
+    """
+
+    def __init__(self, client, prefix='response_cache:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get_many(self, keys):
+        values = self.client.mget([self.prefix + key for key in keys])
+        return [None if value is None else pickle.loads(value) for value in values]
+
+    def set_many(self, mapping, ttl):
+        for key, value in mapping.items():
+            self.client.set(self.prefix + key, pickle.dumps(value), px=int(ttl * 1000))
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def counter(self, key):
+        return int(self.client.get(self.prefix + key) or 0)
+
+
+class ResponseCache(object):
+    """ Caches the 200 responses of the views it decorates, see the module docstring """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        RESPONSE_CACHE_BACKEND is 'memory', 'redis' (at RESPONSE_CACHE_REDIS_URL), a CacheBackend instance or None
+        to turn the cache off
+        :param app:
+        :return:
+        """
+        backend = app.config.get('RESPONSE_CACHE_BACKEND', 'memory')
+        if backend == 'memory':
+            backend = MemoryBackend(maxsize=app.config.get('RESPONSE_CACHE_SIZE', 1024),
+                                    ttl=app.config.get('RESPONSE_CACHE_TTL', 10))
+        elif backend == 'redis':
+            if redis is None:
+                raise RuntimeError('RESPONSE_CACHE_BACKEND is redis but the redis package cannot be imported, '
+                                   'install requirements.txt') from redis_import_error
+            backend = RedisBackend(redis.StrictRedis.from_url(app.config['RESPONSE_CACHE_REDIS_URL']))
+        app.extensions['response_cache'] = backend
+
+    @property
+    def backend(self):
+        return current_app.extensions['response_cache']
+
+    @staticmethod
+    def _key():
+        args = url_encode(sorted(request.args.items(multi=True)))
+        # jsonify indents for browsers but not for XMLHttpRequest
+        return 'response:{}:{}?{}:{}'.format(request.method, request.path, args, int(request.is_xhr))
+
+    @staticmethod
+    def tag(*tags):
+        """ Tag the response being built by a cached view with what it shows """
+        if 'response_cache_tags' in g:
+            g.response_cache_tags.update(tags)
+
+    def invalidate(self, *tags):
+        """
+        Drop every cached response carrying one of the tags, called after the change has been committed
+        :param tags:
+        :return:
+        """
+        backend = self.backend
+        if backend is None or not tags:
+            return
+        backend.incr(SEQUENCE)
+        backend.set_many({'tag:' + tag: uuid.uuid4().hex for tag in tags},
+                         ttl=current_app.config.get('RESPONSE_CACHE_TTL', 10))
+
+    def _lookup(self, backend, key):
+        entry, = backend.get_many([key])
+        if entry is None:
+            return None
+        tags = sorted(entry['tags'])
+        tokens = backend.get_many(['tag:' + tag for tag in tags])
+        if any(entry['tags'][tag] != token for tag, token in zip(tags, tokens)):
+            return None
+        return current_app.response_class(entry['body'], status=200, mimetype=entry['mimetype'])
+
+    def _store(self, backend, key, response, tags, sequence):
+        tags = sorted(tags)
+        ttl = current_app.config.get('RESPONSE_CACHE_TTL', 10)
+        tokens = dict(zip(tags, backend.get_many(['tag:' + tag for tag in tags])))
+        missing = {'tag:' + tag: uuid.uuid4().hex for tag, token in tokens.items() if token is None}
+        if missing:
+            backend.set_many(missing, ttl)
+            tokens.update((tag[len('tag:'):], token) for tag, token in missing.items())
+        if backend.counter(SEQUENCE) != sequence:
+            return
+        backend.set_many({key: {'tags': tokens, 'body': response.get_data(), 'mimetype': response.mimetype}}, ttl)
+
+    def cached(self, f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            backend = self.backend
+            if backend is None:
+                return f(*args, **kwargs)
+            key = self._key()
+            response = self._lookup(backend, key)
+            if response is not None:
+                return response
+
+            sequence = backend.counter(SEQUENCE)
+            g.response_cache_tags = set()
+            response = make_response(f(*args, **kwargs))
+            tags = g.pop('response_cache_tags')
+            if response.status_code == 200 and not response.is_streamed and tags:
+                self._store(backend, key, response, tags, sequence)
+            return response
+
+        return decorated
+
+
+response_cache = ResponseCache()
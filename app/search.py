@@ -0,0 +1,163 @@
+"""
+Full text search over events backed by a whoosh inverted index
+The index is kept in step with the events table by the User event methods and can be rebuilt with
+`python manage.py reindex`. An index that is empty when a process first uses it is filled from the events table, a
+fresh dyno or container starts without the index of the previous one
+"""
+import os
+import threading
+
+from flask import current_app
+from whoosh import query
+from whoosh.analysis import StandardAnalyzer
+from whoosh.fields import Schema, ID, TEXT
+from whoosh.filedb.filestore import FileStorage, RamStorage
+from whoosh.index import LockError
+from whoosh.writing import AsyncWriter, CLEAR
+
+from app.models.event import Event
+
+SEARCH_FIELDS = ('name', 'category', 'location')
+
+
+class EventIndex(object):
+    """ Tokenized inverted index over the searchable fields of an event """
+
+    analyzer = StandardAnalyzer()
+    schema = Schema(id=ID(stored=True, unique=True),
+                    name=TEXT(analyzer=analyzer, field_boost=2.0),
+                    category=TEXT(analyzer=analyzer),
+                    location=TEXT(analyzer=analyzer))
+
+    def __init__(self, app=None):
+        self.fill_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Open the index in SEARCH_INDEX_DIR creating it when missing.
+        Without a directory the index lives in memory which is only suitable for a single process such as the tests
+        :param app:
+        :return:
+        """
+        index_dir = app.config.get('SEARCH_INDEX_DIR')
+        if index_dir:
+            if not os.path.exists(index_dir):
+                os.makedirs(index_dir)
+            storage = FileStorage(index_dir)
+        else:
+            storage = RamStorage()
+        if storage.index_exists():
+            index = storage.open_index()
+        else:
+            index = storage.create_index(self.schema)
+        app.extensions['event_index'] = index
+        app.extensions['event_index_filled'] = False
+
+    @property
+    def index(self):
+        index = current_app.extensions['event_index']
+        if not current_app.extensions['event_index_filled']:
+            self._fill(index)
+        return index
+
+    def _fill(self, index):
+        """
+        Build an empty index from the events table, once per process. The tables may not exist yet when the app is
+        created so this waits for the first use of the index
+        :param index:
+        :return:
+        """
+        with self.fill_lock:
+            if current_app.extensions['event_index_filled']:
+                return
+            if index.doc_count() == 0:
+                try:
+                    self._rebuild(index, Event.query.order_by(Event.id).yield_per(1000))
+                except LockError:
+                    # Another process is writing the index, try again on the next use
+                    return
+            current_app.extensions['event_index_filled'] = True
+
+    def _writer(self):
+        # AsyncWriter retries in the background when another process holds the index lock
+        return AsyncWriter(self.index)
+
+    @staticmethod
+    def _document(event):
+        return {'id': str(event.id), 'name': event.name, 'category': event.category, 'location': event.location}
+
+    def add(self, *events):
+        """
+        Add or replace the documents of the given events
+        :param events:
+        :return:
+        """
+        writer = self._writer()
+        for event in events:
+            writer.update_document(**self._document(event))
+        writer.commit()
+
+    def remove(self, *event_ids):
+        """
+        Remove the documents of the given event ids
+        :param event_ids:
+        :return:
+        """
+        writer = self._writer()
+        for event_id in event_ids:
+            writer.delete_by_term('id', str(event_id))
+        writer.commit()
+
+    def rebuild(self, events):
+        """
+        Replace the whole index with the given events
+        :param events: any iterable of events, streamed so the table never has to fit in memory
+        :return:
+        """
+        self._rebuild(current_app.extensions['event_index'], events)
+        current_app.extensions['event_index_filled'] = True
+
+    def _rebuild(self, index, events):
+        writer = index.writer()
+        for event in events:
+            writer.add_document(**self._document(event))
+        writer.commit(mergetype=CLEAR)
+
+    def parse(self, text):
+        """
+        Turn the search text into a query where every word has to match a field either exactly or as a prefix.
+        Exact matches are scored by BM25F while prefix matches add a constant score so they rank lower
+        :param text:
+        :return:
+        """
+        words = [token.text for token in self.analyzer(text)]
+        if not words:
+            return None
+        return query.And([query.Or([q for field in SEARCH_FIELDS
+                                    for q in (query.Term(field, word), query.Prefix(field, word))])
+                          for word in words])
+
+    def search(self, text, page=1, limit=9):
+        """
+        Return the ids of the events matching the text for the requested page, best match first,
+        together with the total number of matches
+        :param text:
+        :param page:
+        :param limit:
+        :return:
+        """
+        if page < 1 or limit < 1:
+            raise ValueError('The page and the limit should be at least 1')
+        q = self.parse(text)
+        if q is None:
+            return [], 0
+        with self.index.searcher() as searcher:
+            results = searcher.search_page(q, page, pagelen=limit)
+            if page > results.pagecount:
+                return [], results.total
+            return [int(hit['id']) for hit in results], results.total
+
+
+search_index = EventIndex()
@@ -0,0 +1,188 @@
+"""
+Declarative request validation shared by the auth and events blueprints.
+A schema lists its fields and the checks each field has to pass. Patterns are compiled once at import, every
+value is stripped once and checked in a single pass, and the errors of all the fields are collected together
+"""
+import re
+from collections import OrderedDict
+from datetime import date
+from functools import lru_cache
+
+from flask import jsonify
+
+NAME_PATTERN = re.compile(r'^[a-zA-Z0-9_ ]*$')
+EMAIL_PATTERN = re.compile(r'([\w.-]+)@([\w.-]+)(\.[\w.]+$)')
+# The length and the characters of an event name share an error message so one match checks both
+EVENT_NAME_PATTERN = re.compile(r'[a-zA-Z0-9_ ]{5,}$')
+# A lowercase letter, a digit, an uppercase letter and a special character, anywhere in the password
+PASSWORD_PATTERN = re.compile(r'(?=.*[a-z])(?=.*[0-9])(?=.*[A-Z])(?=.*[$#@])', re.DOTALL)
+# ISO-8601 dates, a time and offset after the date are accepted and ignored
+ISO_DATE_PATTERN = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?'
+                              r'(?:Z|[+-]\d{2}:?\d{2})?)?$')
+# The M-D-YYYY dates clients have always sent
+LEGACY_DATE_PATTERN = re.compile(r'(\d{1,2})-(\d{1,2})-(\d{4})$')
+
+
+def min_length(length, message):
+    return (lambda value: len(value) >= length), message
+
+
+def max_length(length, message):
+    return (lambda value: len(value) <= length), message
+
+
+def matches(pattern, message):
+    return pattern.match, message
+
+
+def alphabetic(message):
+    return str.isalpha, message
+
+
+class Field(object):
+    """
+    A named value and the checks it has to pass. A check is a (test, message) pair, the message of the first test
+    the stripped value fails becomes the error of the field. A valid value is passed through convert when given
+    """
+
+    def __init__(self, name, *checks, optional=False, convert=None):
+        self.name = name
+        self.checks = checks
+        self.optional = optional
+        self.convert = convert
+
+
+class Schema(object):
+    """ An ordered collection of fields validated together """
+
+    def __init__(self, *fields):
+        self.fields = tuple((field.name, field.checks, field.optional, field.convert) for field in fields)
+
+    def validate(self, data):
+        """
+        Validate every field of the schema, in one loop since this runs on every write request
+        :param data: the request payload
+        :return: the stripped values and an ordered mapping of field name to error message, empty when valid
+        """
+        data = data or {}
+        cleaned = {}
+        errors = OrderedDict()
+        for name, checks, optional, convert in self.fields:
+            value = data.get(name)
+            if value is None and optional:
+                cleaned[name] = ''
+                continue
+            if not isinstance(value, str):
+                cleaned[name] = value
+                errors[name] = 'The {} field is required'.format(name)
+                continue
+            cleaned[name] = value = value.strip()
+            if value or not optional:
+                for test, message in checks:
+                    if not test(value):
+                        errors[name] = message
+                        break
+                else:
+                    if convert is not None:
+                        cleaned[name] = convert(value)
+        return cleaned, errors
+
+
+@lru_cache(maxsize=1024)
+def _parse_date(value):
+    match = ISO_DATE_PATTERN.match(value)
+    if match:
+        year, month, day = match.groups()
+    else:
+        match = LEGACY_DATE_PATTERN.match(value)
+        if not match:
+            raise ValueError('Unknown date format: {!r}'.format(value))
+        month, day, year = match.groups()
+    return date(int(year), int(month), int(day))
+
+
+def parse_date(value):
+    """
+    Parse an ISO-8601 (YYYY-MM-DD) or M-D-YYYY date in one go. Clients keep sending the same few dates so the
+    results are cached
+    :param value:
+    :return: the date
+    :raises ValueError: when the value is not a date in either format
+    """
+    if not isinstance(value, str):
+        raise ValueError('Dates are given as strings')
+    return _parse_date(value.strip())
+
+
+def is_date(value):
+    try:
+        parse_date(value)
+    except ValueError:
+        return False
+    return True
+
+
+def not_past(value):
+    return parse_date(value) >= date.today()
+
+
+def validation_error(errors, key='message'):
+    """
+    Respond with the first error under the key clients already read and with every error under 'errors'
+    :param errors:
+    :param key:
+    :return:
+    """
+    return jsonify({key: next(iter(errors.values())), 'errors': errors}), 400
+
+
+SHORT_FIELD = "This fields must be more than 5 characters and not empty spaces"
+INVALID_USERNAME = "Invalid username.The username can contain letters, digits and underscore but no special " \
+                   "characters or space"
+INVALID_EMAIL = "Please enter a valid email"
+INVALID_PASSWORD = "Invalid Password.The password must contain at least one lowercase character,one digit," \
+                   "one upper case character and one special character"
+INVALID_EVENT_NAME = "The event name should only contain alphanumeric characters,an underscore and be at least 5 " \
+                     "characters in length without any empty spaces and special characters"
+INVALID_LOCATION = "The event location should only contain alphabetic characters and be at least 3 characters in " \
+                   "length excluding empty spaces"
+INVALID_CATEGORY = "The event category should only contain alphabetic characters and be at least 5 characters in " \
+                   "length excluding empty spaces"
+TOO_LONG = "The event {} should be at most {} characters in length"
+INVALID_DATE = "You have entered an incorrect date format, date should be in MM-DD-YYYY or YYYY-MM-DD format"
+PAST_DATE = "The event cannot have a past date as the date it is going to be hosted"
+
+
+def password_field(name):
+    return Field(name, min_length(5, INVALID_PASSWORD), matches(PASSWORD_PATTERN, INVALID_PASSWORD))
+
+
+REGISTRATION_SCHEMA = Schema(
+    Field('username', min_length(5, SHORT_FIELD), matches(NAME_PATTERN, INVALID_USERNAME)),
+    Field('email', min_length(5, SHORT_FIELD), matches(EMAIL_PATTERN, INVALID_EMAIL)),
+    Field('password', min_length(5, SHORT_FIELD), matches(PASSWORD_PATTERN, INVALID_PASSWORD)),
+)
+
+RESET_PASSWORD_SCHEMA = Schema(password_field('password'))
+
+CHANGE_PASSWORD_SCHEMA = Schema(password_field('new_pass'))
+
+
+def event_fields(optional):
+    return (
+        # The maximum lengths are those of the events columns
+        Field('name', matches(EVENT_NAME_PATTERN, INVALID_EVENT_NAME), max_length(64, TOO_LONG.format('name', 64)),
+              optional=optional),
+        Field('location', min_length(3, INVALID_LOCATION), alphabetic(INVALID_LOCATION),
+              max_length(64, TOO_LONG.format('location', 64)), optional=optional),
+        Field('category', min_length(5, INVALID_CATEGORY), alphabetic(INVALID_CATEGORY),
+              max_length(64, TOO_LONG.format('category', 64)), optional=optional),
+        Field('date_hosted', (is_date, INVALID_DATE), (not_past, PAST_DATE), optional=optional, convert=parse_date),
+        Field('description', max_length(180, TOO_LONG.format('description', 180)), optional=True),
+    )
+
+
+EVENT_SCHEMA = Schema(*event_fields(optional=False))
+
+# Fields left empty or out when updating keep their stored value
+EVENT_UPDATE_SCHEMA = Schema(*event_fields(optional=True))
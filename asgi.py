@@ -0,0 +1,10 @@
+"""
+Entry point of the asyncio read endpoints for ASGI servers: uvicorn asgi:app --workers 4
+Writes and everything else are served by wsgi.py, a proxy sends the read only routes of app/aio.py here
+"""
+import os
+
+from app import create_app
+from app.aio import EventsASGI
+
+app = EventsASGI(create_app(os.getenv('APP_SETTINGS', 'production')))
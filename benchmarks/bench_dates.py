@@ -0,0 +1,37 @@
+"""
+Micro-benchmark of parsing the event date on create and update.
+The legacy function is the arrow round trip date_validation used to make: parse with arrow, format as MM-DD-YYYY
+and parse that again with strptime
+
+Run with: python benchmarks/bench_dates.py
+"""
+import os
+import sys
+import timeit
+from datetime import datetime
+
+import arrow
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.validation import _parse_date, parse_date  # noqa: E402
+
+DATES = ('2099-08-08', '2099-08-08T18:30:00Z', '8-8-2099')
+
+
+def legacy_parse(date_hosted):
+    return datetime.strptime(arrow.get(date_hosted).format('MM-DD-YYYY'), '%m-%d-%Y').date()
+
+
+def report(label, func, value, number=20000):
+    seconds = min(timeit.repeat(lambda: func(value), number=number, repeat=3))
+    print('{:<42} {:>8.2f} us/date'.format(label, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    for value in DATES:
+        # arrow does not know the M-D-YYYY format, it reads the year alone
+        if not value.startswith('8-'):
+            report('{}, arrow round trip'.format(value), legacy_parse, value)
+        report('{}, parse_date uncached'.format(value), _parse_date.__wrapped__, value)
+        report('{}, parse_date cached'.format(value), parse_date, value)
@@ -0,0 +1,88 @@
+"""
+Benchmark of the event hot queries on a large events table, with and without the indexes of the migrations.
+Fills a scratch schema with EVENTS rows (1M by default) spread over 10k owners, then times
+ - the four column duplicate lookup create_event used to run before every insert
+ - the insert-or-conflict create_event runs now
+ - a page of one owner's events by date
+The scratch schema is dropped at the end.
+
+Run with: BENCH_DATABASE_URI=postgresql://... python benchmarks/bench_event_indexes.py
+"""
+import os
+import random
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, text
+
+EVENTS = int(os.getenv('EVENTS', 1000000))
+OWNERS = 10000
+LOOKUPS = 200
+SCHEMA = 'bench_event_indexes'
+
+INDEXES = (
+    'CREATE INDEX ix_events_owner_date_hosted_id ON events (owner, date_hosted, id)',
+    'CREATE UNIQUE INDEX uq_events_owner_name_category_date_hosted ON events (owner, name, category, date_hosted)',
+)
+
+DUPLICATE_LOOKUP = text('SELECT id FROM events WHERE name = :name AND category = :category AND owner = :owner '
+                        'AND date_hosted = :date_hosted LIMIT 1')
+INSERT_OR_CONFLICT = text('INSERT INTO events (name, category, location, owner, date_hosted) '
+                          "VALUES (:name, :category, 'Nairobi', :owner, :date_hosted) "
+                          'ON CONFLICT DO NOTHING RETURNING id')
+OWNER_PAGE = text('SELECT id, name FROM events WHERE owner = :owner ORDER BY date_hosted, id LIMIT 10')
+
+
+def populate(connection):
+    connection.execute('DROP SCHEMA IF EXISTS {0} CASCADE; CREATE SCHEMA {0}; SET search_path TO {0}'.format(SCHEMA))
+    connection.execute('CREATE TABLE events (id serial PRIMARY KEY, name varchar(64) NOT NULL, '
+                       'category varchar(64) NOT NULL, location varchar(64) NOT NULL, date_hosted timestamp, '
+                       'description varchar(180), owner integer NOT NULL)')
+    connection.execute(text("INSERT INTO events (name, category, location, owner, date_hosted, description) "
+                            "SELECT 'Event ' || i, (ARRAY['Learning', 'Social', 'Corporate'])[i % 3 + 1], "
+                            "'Nairobi', i % :owners, DATE '2099-01-01' + i % 365, 'Benchmark event' "
+                            "FROM generate_series(1, :events) AS i"), owners=OWNERS, events=EVENTS)
+    connection.execute('ANALYZE events')
+
+
+def existing_events(count):
+    for _ in range(count):
+        i = random.randint(1, EVENTS)
+        yield {'name': 'Event {}'.format(i), 'category': ('Learning', 'Social', 'Corporate')[i % 3],
+               'owner': i % OWNERS, 'date_hosted': date(2099, 1, 1) + timedelta(days=i % 365)}
+
+
+def timed(label, connection, statement, params):
+    transaction = connection.begin()
+    started = time.perf_counter()
+    for values in params:
+        connection.execute(statement, **values).fetchall()
+    elapsed = time.perf_counter() - started
+    # Leave the table as it was for the next round
+    transaction.rollback()
+    print('{:<44} {:>10.3f} ms/query'.format(label, elapsed / len(params) * 1000))
+
+
+def run(connection, heading):
+    print(heading)
+    random.seed(1)
+    lookups = list(existing_events(LOOKUPS))
+    timed('  duplicate lookup (old create_event)', connection, DUPLICATE_LOOKUP, lookups)
+    new_events = [dict(values, name='New ' + values['name']) for values in lookups]
+    timed('  insert or conflict, new events', connection, INSERT_OR_CONFLICT, new_events)
+    timed('  page of one owner by date', connection, OWNER_PAGE,
+          [{'owner': random.randrange(OWNERS)} for _ in range(LOOKUPS)])
+
+
+if __name__ == '__main__':
+    engine = create_engine(os.environ['BENCH_DATABASE_URI'])
+    with engine.connect() as connection:
+        print('Populating {} events'.format(EVENTS))
+        populate(connection)
+        # Without the unique index nothing conflicts so only the time of the insert itself is measured
+        run(connection, 'Without indexes')
+        for index in INDEXES:
+            connection.execute(index)
+        connection.execute('ANALYZE events')
+        run(connection, 'With indexes')
+        connection.execute('DROP SCHEMA {} CASCADE'.format(SCHEMA))
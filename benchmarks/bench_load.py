@@ -0,0 +1,124 @@
+"""
+Load test of the production server, in requests per second for an increasing number of gunicorn workers.
+Starts gunicorn with gunicorn_conf.py against BENCH_DATABASE_URI once per worker count and keeps it busy with CLIENTS
+client processes sending keep-alive GET requests to PATH for DURATION seconds. Throughput should grow with the
+workers until they outnumber the cores.
+SERVER=asgi runs uvicorn with asgi:app instead, the asyncio read endpoints of app/aio.py, to compare the two at the
+same number of worker processes.
+The events table of BENCH_DATABASE_URI is dropped and recreated.
+
+Run with: BENCH_DATABASE_URI=postgresql://... python benchmarks/bench_load.py
+          WORKERS=1,2,4,8 THREADS=4 CLIENTS=16 DURATION=10 PATH_=/api/events python benchmarks/bench_load.py
+          SERVER=asgi CLIENTS=64 BENCH_DATABASE_URI=postgresql://... python benchmarks/bench_load.py
+"""
+import http.client
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import text  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+
+PORT = int(os.getenv('PORT', 8765))
+WORKERS = [int(count) for count in os.getenv('WORKERS', '1,2,{}'.format(multiprocessing.cpu_count() * 2)).split(',')]
+THREADS = os.getenv('THREADS', '4')
+CLIENTS = int(os.getenv('CLIENTS', 16))
+DURATION = float(os.getenv('DURATION', 10))
+PATH = os.getenv('PATH_', '/api/events')
+EVENTS = int(os.getenv('EVENTS', 1000))
+SERVER = os.getenv('SERVER', 'wsgi')
+
+
+def client(deadline, results):
+    connection = http.client.HTTPConnection('127.0.0.1', PORT)
+    done = errors = 0
+    while time.monotonic() < deadline:
+        try:
+            connection.request('GET', PATH)
+            response = connection.getresponse()
+            response.read()
+            if response.status == 200:
+                done += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', PORT)
+    results.put((done, errors))
+
+
+def wait_until_up(timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', PORT, timeout=1)
+            connection.request('GET', PATH)
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('{} server did not start'.format(SERVER))
+
+
+def command(workers):
+    if SERVER == 'asgi':
+        return [sys.executable, '-m', 'uvicorn', '--port', str(PORT), '--workers', str(workers), '--no-access-log',
+                'asgi:app']
+    return [sys.executable, '-c', 'from gunicorn.app.wsgiapp import run; run()', '-c', 'gunicorn_conf.py', 'wsgi:app']
+
+
+def run(workers, database_uri):
+    env = dict(os.environ, APP_SETTINGS='production', DATABASE_URL=database_uri,
+               SECRET_KEY=os.getenv('SECRET_KEY', 'load-test'), PORT=str(PORT), WEB_CONCURRENCY=str(workers),
+               GUNICORN_THREADS=THREADS, PASSWORD_HASH_WORKERS='0')
+    server = subprocess.Popen(command(workers), cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up()
+        results = multiprocessing.Queue()
+        deadline = time.monotonic() + DURATION
+        clients = [multiprocessing.Process(target=client, args=(deadline, results)) for _ in range(CLIENTS)]
+        for process in clients:
+            process.start()
+        totals = [results.get() for _ in clients]
+        for process in clients:
+            process.join()
+    finally:
+        server.terminate()
+        server.wait()
+    done = sum(total[0] for total in totals)
+    errors = sum(total[1] for total in totals)
+    concurrency = 'asyncio' if SERVER == 'asgi' else '{} threads'.format(THREADS)
+    print('{:>3} workers x {} {:>10,.0f} requests/s {:>6} errors'.format(workers, concurrency, done / DURATION, errors))
+
+
+def main():
+    database_uri = os.getenv('BENCH_DATABASE_URI')
+    if not database_uri:
+        sys.exit('Set BENCH_DATABASE_URI to the database to load test, its tables are dropped and recreated')
+    app = create_app(config_name='testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.engine.execute("INSERT INTO users (id, username, email) VALUES (1, 'bench', 'bench@example.com')")
+        db.engine.execute(text("INSERT INTO events (name, category, location, owner, date_hosted, description) "
+                               "SELECT 'Event ' || i, 'Learning', 'Nairobi', 1, DATE '2099-01-01' + i % 365, "
+                               "'Benchmark event' FROM generate_series(1, :events) AS i"), events=EVENTS)
+        db.engine.dispose()
+    print('{} cores, {} clients, GET {} on {}'.format(multiprocessing.cpu_count(), CLIENTS, PATH, SERVER))
+    for count in WORKERS:
+        run(count, database_uri)
+    with app.app_context():
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark of building an event listing response, in rows per second.
+Compares the entity path the views used to take (load Event entities, build each dict by hand, jsonify) with the
+column tuples of app/events/serializers.py encoded by flask's json and by ujson.
+Works on its own events table in BENCH_DATABASE_URI, which it drops and recreates.
+
+Run with: BENCH_DATABASE_URI=postgresql://... python benchmarks/bench_serializers.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['TEST_DATABASE_URI'] = os.environ['BENCH_DATABASE_URI']
+
+from flask import jsonify  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.events.serializers import event_rows, json_response, serialize_events  # noqa: E402
+from app.models.event import Event  # noqa: E402
+
+EVENTS = int(os.getenv('EVENTS', 10000))
+REPEAT = 5
+
+
+def entity_listing():
+    output = []
+    for s_event in Event.query.order_by(Event.id).all():
+        output.append({'id': s_event.id, 'name': s_event.name, 'category': s_event.category,
+                       'location': s_event.location, 'date_hosted': s_event.date_hosted,
+                       'description': s_event.description, 'rsvp_count': s_event.rsvp_count,
+                       'capacity': s_event.capacity})
+    response = jsonify({'events': output})
+    # Entities stay in the identity map until the request ends
+    db.session.remove()
+    return response
+
+
+def row_listing():
+    response = json_response({'events': serialize_events(event_rows(Event.query).order_by(Event.id))})
+    db.session.remove()
+    return response
+
+
+def report(label, app, listing, fast_json):
+    app.config['FAST_JSON'] = fast_json
+    best = None
+    for _ in range(REPEAT):
+        with app.test_request_context('/api/events'):
+            started = time.perf_counter()
+            listing()
+            elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print('{:<36} {:>12,.0f} rows/s'.format(label, EVENTS / best))
+
+
+if __name__ == '__main__':
+    app = create_app(config_name='testing')
+    # Measure the compact output production sends
+    app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.engine.execute("INSERT INTO users (id, username, email) VALUES (1, 'bench', 'bench@example.com')")
+        db.engine.execute(text("INSERT INTO events (name, category, location, owner, date_hosted, description) "
+                               "SELECT 'Event ' || i, 'Learning', 'Nairobi', 1, DATE '2099-01-01' + i % 365, "
+                               "'Benchmark event' FROM generate_series(1, :events) AS i"), events=EVENTS)
+        print('{} events'.format(EVENTS))
+        report('entities, jsonify', app, entity_listing, False)
+        report('column tuples, flask json', app, row_listing, False)
+        report('column tuples, ujson', app, row_listing, True)
+        db.drop_all()
@@ -0,0 +1,57 @@
+"""
+Micro-benchmark of the per-request cost of validating the registration and event payloads.
+The legacy functions reproduce the checks the views ran before app/validation.py, one re call per check with the
+pattern given as a string and the field stripped again for every check
+
+Run with: python benchmarks/bench_validation.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.validation import EVENT_SCHEMA, REGISTRATION_SCHEMA  # noqa: E402
+
+REGISTRATION = {'username': 'Felix_Wambiri', 'email': 'felix@gmail.com', 'password': 'FelixWambiri12@3'}
+EVENT = {'name': 'Bootcamp', 'category': 'Learning', 'location': 'Nairobi', 'date_hosted': '8-8-2099',
+         'description': 'This is the best learning experience'}
+
+
+def legacy_registration(data):
+    username = data['username'].strip()
+    email = data['email'].strip()
+    password = data['password'].strip()
+    if len(username) < 5 or len(email) < 5 or len(password) < 5:
+        return 'short'
+    if not re.match("^[a-zA-Z0-9_ ]*$", username):
+        return 'username'
+    if not re.match(r"([\w.-]+)@([\w.-]+)(\.[\w.]+$)", email):
+        return 'email'
+    if not re.search("[a-z]", password) or not re.search("[0-9]", password) or not re.search("[A-Z]", password) \
+            or not re.search("[$#@]", password):
+        return 'password'
+    return data
+
+
+def legacy_event(data):
+    if len(data['name'].strip()) < 5 or not re.match("^[a-zA-Z0-9_ ]*$", data['name'].strip()):
+        return 'name'
+    elif len(data['location'].strip()) < 3 or not data['location'].strip().isalpha():
+        return 'location'
+    elif len(data['category'].strip()) < 5 or not data['category'].strip().isalpha():
+        return 'category'
+    return data
+
+
+def report(label, func, payload, number=200000):
+    seconds = min(timeit.repeat(lambda: func(payload), number=number, repeat=3))
+    print('{:<28} {:>8.2f} us/request'.format(label, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    report('registration, legacy', legacy_registration, REGISTRATION)
+    report('registration, schema', REGISTRATION_SCHEMA.validate, REGISTRATION)
+    report('event, legacy', legacy_event, EVENT)
+    report('event, schema', EVENT_SCHEMA.validate, EVENT)
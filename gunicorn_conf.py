@@ -0,0 +1,41 @@
+"""
+gunicorn settings, every one of them can be overridden from the environment.
+The app is created once in the master and forked into WEB_CONCURRENCY worker processes running GUNICORN_THREADS
+threads each. Each worker keeps its own connection pool, SQLALCHEMY_POOL_SIZE is best left close to the number of
+threads and workers * (SQLALCHEMY_POOL_SIZE + SQLALCHEMY_MAX_OVERFLOW) below the connections Postgres allows.
+
+`kill -HUP` on the master replaces the workers gracefully, the old ones finish their requests first. The preloaded code
+is not imported again though, deploy new code with `kill -USR2` (a new master) followed by `kill -TERM` on the old
+master, or set GUNICORN_PRELOAD=0 to have HUP reload it
+"""
+import multiprocessing
+import os
+
+bind = '0.0.0.0:{}'.format(os.getenv('PORT', 8000))
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# More than one thread selects the gthread worker, a thread waiting on the database lets the others serve
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+# Import create_app and everything it loads once, forked workers share those pages
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+# Keep idle client connections open this many seconds, longer than the load balancer's own idle timeout otherwise
+# it may send a request down a connection gunicorn is closing
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 75))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+# Recycle workers now and then so that a slow leak cannot grow forever, the jitter keeps them from restarting at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 500))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')
+errorlog = '-'
+
+
+def pre_fork(server, worker):
+    # Anything create_app connected in the master is closed before it can be inherited
+    from wsgi import dispose_engines
+    dispose_engines()
+
+
+def post_fork(server, worker):
+    # and each worker starts from empty pools of its own
+    from wsgi import dispose_engines
+    dispose_engines()
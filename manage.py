@@ -1,13 +1,18 @@
 """
 To write command-line tasks belonging outside the web app itself
 """
+import sys
 import unittest
 
 from flask_migrate import Migrate, MigrateCommand
 from flask_script import Manager
 
 # Getting the flask instance
-from app import create_app, db
+from app import create_app, db, mail_queue
+from app.events.exports import EXPORT_FORMATS, EXPORT_KINDS, export_chunks, parse_after
+from app.models.event import Event
+from app.models.user import User
+from app.search import search_index
 
 app = create_app(config_name='development')
 
@@ -29,5 +34,51 @@ def test():
     return 1
 
 
+@manager.command
+def reindex():
+    """Rebuilds the event search index from the events table"""
+    search_index.rebuild(Event.query.order_by(Event.id).yield_per(1000))
+
+
+@manager.command
+def flush_mail_spool():
+    """Resends the mail that could not be delivered"""
+    print('{} spooled messages sent'.format(mail_queue.flush_spool()))
+
+
+@manager.command
+def make_admin(email):
+    """Lets the user export the events of every user, running servers notice within TOKEN_CACHE_TTL seconds"""
+    user = User.query.filter_by(email=email).first()
+    if user is None:
+        print('There is no user with the email {}'.format(email), file=sys.stderr)
+        return 1
+    user.is_admin = True
+    db.session.commit()
+
+
+@manager.option('-k', '--kind', dest='kind', default='events', choices=EXPORT_KINDS)
+@manager.option('-f', '--format', dest='export_format', default='ndjson', choices=EXPORT_FORMATS)
+@manager.option('-u', '--user', dest='email', default=None, help='export the data of this user only')
+@manager.option('-a', '--after', dest='after', default=None, help='resume after this id or event_id:user_id')
+@manager.option('-o', '--output', dest='output', default=None, help='file to write, standard output by default')
+def export(kind, export_format, email, after, output):
+    """Writes a gzip compressed export of the events or reservations of every user or of one"""
+    user_id = None
+    if email:
+        user = User.query.filter_by(email=email).first()
+        if user is None:
+            print('There is no user with the email {}'.format(email), file=sys.stderr)
+            return 1
+        user_id = user.id
+    target = open(output, 'wb') if output else sys.stdout.buffer
+    try:
+        for chunk in export_chunks(kind, export_format, user_id, parse_after(kind, after)):
+            target.write(chunk)
+    finally:
+        if output:
+            target.close()
+
+
 if __name__ == '__main__':
     manager.run()
@@ -0,0 +1,41 @@
+"""spread change versions over slots
+
+Revision ID: 0a6d3e9f4b71
+Revises: f3c8a1d6b92e
+Create Date: 2026-10-18 21:12:37.904415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a6d3e9f4b71'
+down_revision = 'f3c8a1d6b92e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('change_versions', sa.Column('slot', sa.Integer(), nullable=False, server_default='0'))
+    op.drop_constraint('change_versions_pkey', 'change_versions', type_='primary')
+    op.create_primary_key('change_versions_pkey', 'change_versions', ['scope', 'slot'])
+
+
+def downgrade():
+    # Fold the slots back into one row per scope, the versions only ever grow
+    op.execute('''
+        UPDATE change_versions SET version = totals.version, changed_at = totals.changed_at
+        FROM (SELECT scope, sum(version) AS version, max(changed_at) AS changed_at
+              FROM change_versions GROUP BY scope) AS totals
+        WHERE change_versions.scope = totals.scope AND change_versions.slot = 0
+    ''')
+    op.execute('''
+        INSERT INTO change_versions (scope, slot, version, changed_at)
+        SELECT scope, 0, sum(version), max(changed_at) FROM change_versions GROUP BY scope
+        HAVING bool_and(slot <> 0)
+    ''')
+    op.execute('DELETE FROM change_versions WHERE slot <> 0')
+    op.drop_constraint('change_versions_pkey', 'change_versions', type_='primary')
+    op.create_primary_key('change_versions_pkey', 'change_versions', ['scope'])
+    op.drop_column('change_versions', 'slot')
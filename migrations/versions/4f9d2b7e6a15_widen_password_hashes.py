@@ -0,0 +1,25 @@
+"""widen password hashes
+
+Revision ID: 4f9d2b7e6a15
+Revises: c27a9e5b1d38
+Create Date: 2026-10-18 14:05:31.208114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f9d2b7e6a15'
+down_revision = 'c27a9e5b1d38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Room for longer salts and methods than werkzeug's defaults
+    op.alter_column('users', 'pw_hash', existing_type=sa.String(length=100), type_=sa.String(length=255))
+
+
+def downgrade():
+    op.alter_column('users', 'pw_hash', existing_type=sa.String(length=255), type_=sa.String(length=100))
@@ -0,0 +1,26 @@
+"""add event keyset pagination indexes
+
+Revision ID: 5d1f0a2c9e43
+Revises: 940830c07bea
+Create Date: 2026-10-18 09:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1f0a2c9e43'
+down_revision = '940830c07bea'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_events_date_hosted_id', 'events', ['date_hosted', 'id'], unique=False)
+    op.create_index('ix_events_owner_date_hosted_id', 'events', ['owner', 'date_hosted', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_events_owner_date_hosted_id', table_name='events')
+    op.drop_index('ix_events_date_hosted_id', table_name='events')
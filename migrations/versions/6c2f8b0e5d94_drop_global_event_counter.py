@@ -0,0 +1,25 @@
+"""drop the global event counter
+
+Revision ID: 6c2f8b0e5d94
+Revises: 0a6d3e9f4b71
+Create Date: 2026-10-18 21:40:18.227605
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c2f8b0e5d94'
+down_revision = '0a6d3e9f4b71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The overall total is summed from the owners' counters instead
+    op.execute("DELETE FROM event_counters WHERE scope = 'global'")
+
+
+def downgrade():
+    op.execute("INSERT INTO event_counters (scope, total) SELECT 'global', count(*) FROM events")
@@ -0,0 +1,32 @@
+"""add event counters
+
+Revision ID: 8b4e6c1d7f20
+Revises: 5d1f0a2c9e43
+Create Date: 2026-10-18 10:03:52.118406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b4e6c1d7f20'
+down_revision = '5d1f0a2c9e43'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('event_counters',
+    sa.Column('scope', sa.String(length=32), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('scope')
+    )
+    # Seed the counters from the events that already exist
+    op.execute("INSERT INTO event_counters (scope, total) SELECT 'global', count(*) FROM events")
+    op.execute("INSERT INTO event_counters (scope, total) "
+               "SELECT 'owner:' || owner, count(*) FROM events GROUP BY owner")
+
+
+def downgrade():
+    op.drop_table('event_counters')
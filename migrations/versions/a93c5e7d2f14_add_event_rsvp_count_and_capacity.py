@@ -0,0 +1,32 @@
+"""add event rsvp count and capacity
+
+Revision ID: a93c5e7d2f14
+Revises: e61b3f08a7c2
+Create Date: 2026-10-18 15:32:44.610927
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a93c5e7d2f14'
+down_revision = 'e61b3f08a7c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('events', sa.Column('rsvp_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('events', sa.Column('capacity', sa.Integer(), nullable=True))
+    op.execute('UPDATE events SET rsvp_count = counted.total '
+               'FROM (SELECT event_id, count(*) AS total FROM rsvps GROUP BY event_id) AS counted '
+               'WHERE events.id = counted.event_id')
+    op.create_check_constraint('ck_events_rsvp_count_within_capacity', 'events',
+                               'capacity IS NULL OR rsvp_count <= capacity')
+
+
+def downgrade():
+    op.drop_constraint('ck_events_rsvp_count_within_capacity', 'events', type_='check')
+    op.drop_column('events', 'capacity')
+    op.drop_column('events', 'rsvp_count')
@@ -0,0 +1,24 @@
+"""add rsvps event index
+
+Revision ID: b58e0d4c3a61
+Revises: a93c5e7d2f14
+Create Date: 2026-10-18 16:10:05.871332
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b58e0d4c3a61'
+down_revision = 'a93c5e7d2f14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_rsvps_event_id_user_id', 'rsvps', ['event_id', 'user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_rsvps_event_id_user_id', table_name='rsvps')
@@ -0,0 +1,47 @@
+"""store blacklisted token digests
+
+Revision ID: c27a9e5b1d38
+Revises: 8b4e6c1d7f20
+Create Date: 2026-10-18 11:40:07.551290
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c27a9e5b1d38'
+down_revision = '8b4e6c1d7f20'
+branch_labels = None
+depends_on = None
+
+blacklist_tokens = sa.table('blacklist_tokens',
+                            sa.column('id', sa.Integer),
+                            sa.column('token', sa.String),
+                            sa.column('token_hash', sa.String))
+
+
+def upgrade():
+    op.add_column('blacklist_tokens', sa.Column('token_hash', sa.String(length=64), nullable=True))
+    connection = op.get_bind()
+    for row_id, token in connection.execute(sa.select([blacklist_tokens.c.id, blacklist_tokens.c.token])).fetchall():
+        connection.execute(blacklist_tokens.update().where(blacklist_tokens.c.id == row_id).values(
+            token_hash=hashlib.sha256(token.encode()).hexdigest()))
+    op.alter_column('blacklist_tokens', 'token_hash', nullable=False)
+    op.create_unique_constraint('blacklist_tokens_token_hash_key', 'blacklist_tokens', ['token_hash'])
+    op.create_index(op.f('ix_blacklist_tokens_blacklisted_on'), 'blacklist_tokens', ['blacklisted_on'], unique=False)
+    op.drop_column('blacklist_tokens', 'token')
+
+
+def downgrade():
+    # The raw tokens cannot be recovered from their digests so tokens revoked before a rollback are no longer
+    # recognised as revoked afterwards
+    op.add_column('blacklist_tokens', sa.Column('token', sa.String(length=500), nullable=True))
+    op.execute('UPDATE blacklist_tokens SET token = token_hash')
+    op.alter_column('blacklist_tokens', 'token', nullable=False)
+    op.create_unique_constraint('blacklist_tokens_token_key', 'blacklist_tokens', ['token'])
+    op.drop_index(op.f('ix_blacklist_tokens_blacklisted_on'), table_name='blacklist_tokens')
+    op.drop_constraint('blacklist_tokens_token_hash_key', 'blacklist_tokens', type_='unique')
+    op.drop_column('blacklist_tokens', 'token_hash')
@@ -0,0 +1,32 @@
+"""add event updated_at and change versions
+
+Revision ID: d7a2f5c81e39
+Revises: b58e0d4c3a61
+Create Date: 2026-10-18 17:02:41.310276
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a2f5c81e39'
+down_revision = 'b58e0d4c3a61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('events', sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                      server_default=sa.text("timezone('utc', now())")))
+    op.create_table('change_versions',
+                    sa.Column('scope', sa.String(length=32), nullable=False),
+                    sa.Column('version', sa.BigInteger(), nullable=False),
+                    sa.Column('changed_at', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('scope')
+                    )
+
+
+def downgrade():
+    op.drop_table('change_versions')
+    op.drop_column('events', 'updated_at')
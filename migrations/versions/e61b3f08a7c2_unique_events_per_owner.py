@@ -0,0 +1,34 @@
+"""unique events per owner
+
+Revision ID: e61b3f08a7c2
+Revises: 4f9d2b7e6a15
+Create Date: 2026-10-18 14:48:12.907355
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e61b3f08a7c2'
+down_revision = '4f9d2b7e6a15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Events created twice before the index existed keep their reservations, every copy but the first gets its id
+    # appended to its name. Rows without a date never clash, the index treats NULLs as distinct
+    op.execute('''
+        UPDATE events SET name = left(events.name, 64 - length(' (' || events.id || ')')) || ' (' || events.id || ')'
+        FROM (SELECT id, row_number() OVER (PARTITION BY owner, name, category, date_hosted ORDER BY id) AS copy
+              FROM events WHERE date_hosted IS NOT NULL) AS copies
+        WHERE events.id = copies.id AND copies.copy > 1
+    ''')
+    # Owner first so the index also serves lookups of one user's events by name
+    op.create_index('uq_events_owner_name_category_date_hosted', 'events',
+                    ['owner', 'name', 'category', 'date_hosted'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_events_owner_name_category_date_hosted', table_name='events')
@@ -0,0 +1,24 @@
+"""add users is_admin
+
+Revision ID: f3c8a1d6b92e
+Revises: d7a2f5c81e39
+Create Date: 2026-10-18 19:24:05.581932
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8a1d6b92e'
+down_revision = 'd7a2f5c81e39'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('is_admin', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade():
+    op.drop_column('users', 'is_admin')
@@ -1,9 +1,40 @@
+import asyncore
+import os
+import shutil
+import smtpd
+import socket
+import tempfile
+import threading
 import unittest
 import json
 from base64 import b64encode
+from datetime import datetime, timedelta
 
-from app import create_app, db
-from app.models.user import User
+from sqlalchemy import event
+
+from app import create_app, db, mail_queue
+from app.auth.revocation import revocation_set
+from app.models.user import User, BlacklistToken, token_digest
+from app.passwords import password_hasher
+
+
+class StandInSMTPServer(smtpd.SMTPServer):
+    """ Local SMTP server that records the messages it receives """
+
+    def __init__(self):
+        smtpd.SMTPServer.__init__(self, ('127.0.0.1', 0), None)
+        self.port = self.socket.getsockname()[1]
+        self.messages = []
+        self.thread = threading.Thread(target=asyncore.loop, kwargs={'timeout': 0.05}, daemon=True)
+        self.thread.start()
+
+    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+        self.messages.append((mailfrom, rcpttos, data))
+
+    def stop(self):
+        # Also drops the connection the mail worker keeps open so the loop ends straight away
+        asyncore.close_all()
+        self.thread.join()
 
 
 class AuthTestCase(unittest.TestCase):
@@ -71,6 +102,38 @@ class AuthTestCase(unittest.TestCase):
         user2 = User('Felix', 'felixwambiri@gmail.com', 'FelixWambiri12@3')
         self.assertTrue(user.pw_hash != user2.pw_hash)
 
+    def test_passwords_are_rehashed_at_login_when_the_hashing_parameters_change(self):
+        """ Test that a hash made with old parameters still logs in and is then replaced by a current one """
+        self.client.post('/api/auth/register', data=self.user_data, content_type='application/json')
+        user = User.query.filter_by(email='felo@gmail.com').first()
+        self.assertTrue(user.pw_hash.startswith('pbkdf2:sha256:1000$'))
+
+        self.app.config.update(PASSWORD_HASH_METHOD='pbkdf2:sha256:2000', PASSWORD_SALT_LENGTH=12)
+        result = self.client.post("/api/auth/login", data=self.user_data, content_type='application/json')
+        self.assertEqual(result.status_code, 200)
+        db.session.expire_all()
+        method, salt, _ = User.query.filter_by(email='felo@gmail.com').first().pw_hash.split('$')
+        self.assertEqual((method, len(salt)), ('pbkdf2:sha256:2000', 12))
+
+    def test_password_hashing_runs_in_a_bounded_process_pool(self):
+        """ Test that hashing can run in worker processes and that requests beyond the pool's bound get a 503 """
+        self.app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=0, PASSWORD_HASH_TIMEOUT=0.1)
+        password_hasher.init_app(self.app)
+        self.client.post('/api/auth/register', data=self.user_data, content_type='application/json')
+        result = self.client.post("/api/auth/login", data=self.user_data, content_type='application/json')
+        self.assertEqual(result.status_code, 200)
+
+        # Hold the only slot as a login in progress would
+        slots = self.app.extensions['password_hasher']['slots']
+        slots.acquire()
+        try:
+            result = self.client.post("/api/auth/login", data=self.user_data, content_type='application/json')
+        finally:
+            slots.release()
+        self.assertEqual(result.status_code, 503)
+        self.assertEqual(result.headers['Retry-After'], '1')
+        self.app.extensions['password_hasher']['executor'].shutdown()
+
     def test_successful_user_registration(self):
         """ Test whether user registration method works correctly. """
         res = self.client.post('/api/auth/register', data=self.user_data, content_type='application/json')
@@ -123,6 +186,19 @@ class AuthTestCase(unittest.TestCase):
         self.assertEqual(
             result['message'], 'Please enter a valid email')
 
+    def test_every_invalid_registration_field_is_reported_at_once(self):
+        res = self.client.post("/api/auth/register",
+                               data=json.dumps({"username": "Felix Wambiri!",
+                                                "email": "felogmailcom",
+                                                "password": "felixwambiri",
+                                                }),
+                               content_type='application/json')
+        self.assertEqual(res.status_code, 400)
+        result = json.loads(res.data.decode())
+        self.assertEqual(sorted(result['errors']), ['email', 'password', 'username'])
+        # The first error is still given under the key clients already read
+        self.assertEqual(result['message'], result['errors']['username'])
+
     def test_successful_user_login(self):
         res = self.client.post('/api/auth/register', data=self.user_data, content_type='application/json')
         res_1 = self.client.post("/api/auth/login", data=self.user_data, content_type='application/json')
@@ -162,6 +238,115 @@ class AuthTestCase(unittest.TestCase):
         self.assertIn("Successfully logged out", str(data))
         self.assertEqual(res.status_code, 200)
 
+    def test_verified_token_is_cached_until_logout(self):
+        """ Test that a verified token skips the user and blacklist lookups until the user logs out """
+        self.client.post('/api/auth/register', data=self.user_data, content_type='application/json')
+        result = self.client.post("/api/auth/login", data=self.user_data, content_type='application/json')
+        access_token = json.loads(result.data.decode())['token']
+        header = {'Authorization': 'Bearer ' + access_token}
+
+        # The first request verifies the token against the database
+        self.client.get('/api/my_events', headers=header)
+
+        # The second request is served from the token cache
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            res = self.client.get('/api/my_events', headers=header)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse([s for s in statements if 'blacklist_tokens' in s or 'FROM users' in s])
+
+        # Logging out drops the cached token straight away
+        self.client.post("/api/auth/logout", headers=header, content_type='application/json')
+        res = self.client.get('/api/my_events', headers=header)
+        self.assertEqual(res.status_code, 401)
+        self.assertIn(b'You are logged out', res.data)
+
+    def test_revocation_reaches_other_processes_and_expired_rows_are_pruned(self):
+        """ Test that a logout is picked up by another process and that expired blacklist rows are deleted """
+        self.client.post('/api/auth/register', data=self.user_data, content_type='application/json')
+        result = self.client.post("/api/auth/login", data=self.user_data, content_type='application/json')
+        access_token = json.loads(result.data.decode())['token']
+        header = {'Authorization': 'Bearer ' + access_token}
+
+        # A second app stands in for another worker process that has already verified the token
+        other_app = create_app(config_name='testing')
+        other_app.config['REVOCATION_REFRESH_INTERVAL'] = 0
+        other_client = other_app.test_client()
+        self.assertEqual(other_client.get('/api/my_events', headers=header).status_code, 200)
+
+        # The logout is stored as a digest and seen by the other process on its next refresh
+        self.client.post("/api/auth/logout", headers=header, content_type='application/json')
+        self.assertIsNone(BlacklistToken.query.filter_by(token_hash=access_token).first())
+        self.assertTrue(BlacklistToken.check_blacklist(access_token))
+        res = other_client.get('/api/my_events', headers=header)
+        self.assertEqual(res.status_code, 401)
+
+        # Rows older than the token lifetime are pruned
+        old = BlacklistToken('expired-token')
+        old.blacklisted_on = datetime.utcnow() - timedelta(hours=self.app.config['JWT_LIFETIME_HOURS'] + 1)
+        db.session.add(old)
+        db.session.commit()
+        state = self.app.extensions['revocation_set']
+        seen_during_reload = []
+
+        def record(conn, cursor, statement, *args):
+            if statement.lstrip().startswith('SELECT') and 'blacklist_tokens' in statement:
+                seen_during_reload.append(token_digest(access_token) in state['digests'])
+        event.listen(db.engine, 'before_cursor_execute', record)
+        self.app.config['REVOCATION_PRUNE_INTERVAL'] = 0
+        try:
+            revocation_set.refresh()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertFalse(BlacklistToken.check_blacklist('expired-token'))
+        self.assertTrue(BlacklistToken.check_blacklist(access_token))
+
+        # Readers that skip the lock keep seeing the revoked token while the set is reloaded after the prune
+        self.assertEqual(seen_during_reload, [True])
+        self.assertIn(token_digest(access_token), state['digests'])
+        self.assertNotIn(token_digest('expired-token'), state['digests'])
+
+    def test_confirmation_mail_is_queued_retried_and_spooled(self):
+        """ Test that mail is sent off the request thread, spooled when the server is down and resent later """
+        self.client.post('/api/auth/register', data=self.user_data, content_type='application/json')
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir)
+        self.app.config.update(MAIL_SPOOL_DIR=spool_dir, MAIL_SEND_RETRIES=1, MAIL_RETRY_BACKOFF=0)
+        mail_state = self.app.extensions['mail']
+        mail_state.server, mail_state.use_ssl, mail_state.use_tls, mail_state.suppress = '127.0.0.1', False, False, False
+        mail_state.username = None
+
+        # Nothing listens on the port so the message ends up in the spool after its retries
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        mail_state.port = closed.getsockname()[1]
+        closed.close()
+        res = self.client.post('/api/auth/acquire_token', data=json.dumps({'email': 'felo@gmail.com'}),
+                               content_type='application/json')
+        self.assertEqual(res.status_code, 200)
+        mail_queue.join()
+        self.assertEqual(1, len(os.listdir(spool_dir)))
+
+        # Once a server is up the spool is flushed to it
+        server = StandInSMTPServer()
+        self.addCleanup(server.stop)
+        mail_state.port = server.port
+        self.assertEqual(1, mail_queue.flush_spool())
+        self.assertEqual([], os.listdir(spool_dir))
+
+        # New mail reaches the server exactly once
+        self.client.post('/api/auth/acquire_token', data=json.dumps({'email': 'felo@gmail.com'}),
+                         content_type='application/json')
+        mail_queue.join()
+        self.assertEqual(2, len(server.messages))
+        self.assertEqual(['felo@gmail.com'], server.messages[-1][1])
+
     def tearDown(self):
         db.session.remove()
         db.drop_all()
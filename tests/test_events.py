@@ -1,9 +1,46 @@
+import asyncio
+import csv
+import gzip
+import io
+import threading
+import time
 import unittest
 from base64 import b64encode
+from datetime import date, timedelta
 
 from flask import json
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine.url import make_url
+from whoosh.filedb.filestore import RamStorage
 
 from app import create_app, db
+from app.aio import EventsASGI
+from app.auth.token_cache import token_cache
+from app.models.event import RESERVE_SQL, Event
+from app.models.user_accounts import UserAccounts
+from app.replicas import replica_router
+from app.response_cache import MemoryBackend, RedisBackend, response_cache
+from app.search import EventIndex
+
+
+class RedisStandIn(object):
+    """ The few redis commands RedisBackend uses, without expiry """
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, name):
+        return self.values.get(name)
+
+    def mget(self, names):
+        return [self.values.get(name) for name in names]
+
+    def set(self, name, value, px=None):
+        self.values[name] = value
+
+    def incr(self, name):
+        self.values[name] = str(int(self.values.get(name, 0)) + 1).encode()
+        return int(self.values[name])
 
 
 class EventTestCase(unittest.TestCase):
@@ -20,7 +57,7 @@ class EventTestCase(unittest.TestCase):
                 'name': 'Bootcamp',
                 'category': 'Learning',
                 'location': 'Nairobi',
-                'date_hosted': '8-8-2019',
+                'date_hosted': '8-8-2099',
                 'description': 'This is the best learning experience'
             }
         )
@@ -29,7 +66,7 @@ class EventTestCase(unittest.TestCase):
                 'name': 'Bootcamp_21',
                 'category': 'Learning',
                 'location': 'Uganda',
-                'date_hosted': '8-8-2019',
+                'date_hosted': '8-8-2099',
                 'description': 'This is the best learning experience'
             }
         )
@@ -38,7 +75,7 @@ class EventTestCase(unittest.TestCase):
                 'name': 'Sepetuka',
                 'category': 'social',
                 'location': 'mombasa',
-                'date_hosted': '8-8-2019',
+                'date_hosted': '8-8-2099',
                 'description': 'This is the best social experience'
             }
         )
@@ -47,7 +84,7 @@ class EventTestCase(unittest.TestCase):
                 'name': 'Blaze',
                 'category': 'Cooporate',
                 'location': 'Nakuru',
-                'date_hosted': '8-8-2019',
+                'date_hosted': '8-8-2099',
                 'description': 'This is the best corporate experience'
             }
         )
@@ -205,6 +242,32 @@ class EventTestCase(unittest.TestCase):
                                   content_type='application/json')
         self.assertIn(b'The event already exists', result.data)
 
+    def test_unsuccessful_update_of_an_event_into_a_duplicate(self):
+        """
+        Test that an event cannot be updated to the name, category and date of another event of the same user
+        while another user may have an event with those details
+        """
+        self.register_user1()
+        result = self.login_user1()
+        headers3 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.client.post('/api/events', headers=headers3, data=self.event1_data, content_type='application/json')
+        self.client.post('/api/events', headers=headers3, data=self.event2_data, content_type='application/json')
+
+        update = json.loads(self.event1_data)
+        update.update(location='', description='')
+        result = self.client.put('/api/events/2', headers=headers3, data=json.dumps(update),
+                                 content_type='application/json')
+        self.assertIn(b'You cannot update an event to duplicate an existing event', result.data)
+        self.assertEqual(json.loads(self.client.get('/api/event/2', headers=headers3).data.decode())[
+                             'event']['name'], 'Bootcamp_21')
+
+        self.register_user2()
+        result = self.login_user2()
+        headers4 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        result = self.client.post('/api/events', headers=headers4, data=self.event1_data,
+                                  content_type='application/json')
+        self.assertEqual(result.status_code, 201)
+
     def test_unsuccessful_creation_of_events_when_invalid_details_used(self):
         """
         Test that for you to create an event successfully you have to pass in valid data details
@@ -255,6 +318,49 @@ class EventTestCase(unittest.TestCase):
         ), content_type='application/json')
         self.assertIn(b'The event category should only contain alphabetic characters', res.data)
 
+    def test_event_dates_are_accepted_in_iso_and_legacy_formats(self):
+        """
+        Test that the same day given as YYYY-MM-DD or as M-D-YYYY is stored as the same date while malformed and
+        past dates are refused
+        :return:
+        """
+        self.register_user1()
+        result = self.login_user1()
+        access_token1 = json.loads(result.data.decode())['token']
+        headers3 = {'Authorization': 'Bearer ' + access_token1}
+        hosted_on = date.today() + timedelta(days=30)
+        event = json.loads(self.event1_data)
+
+        event['date_hosted'] = hosted_on.isoformat()
+        res = self.client.post('/api/events', headers=headers3, data=json.dumps(event),
+                               content_type='application/json')
+        self.assertEqual(res.status_code, 201)
+
+        # The legacy format of the same day makes it a duplicate of the first event
+        event['date_hosted'] = '{d.month}-{d.day}-{d.year}'.format(d=hosted_on)
+        res = self.client.post('/api/events', headers=headers3, data=json.dumps(event),
+                               content_type='application/json')
+        self.assertIn(b'The event already exists', res.data)
+
+        for date_hosted in ('8/8/2099', '2-30-2099', date.today() - timedelta(days=1)):
+            event['date_hosted'] = str(date_hosted)
+            res = self.client.post('/api/events', headers=headers3, data=json.dumps(event),
+                                   content_type='application/json')
+            self.assertEqual(res.status_code, 400)
+
+        # A missing date is reported together with the errors of the other fields
+        res = self.client.post('/api/events', headers=headers3, content_type='application/json',
+                               data=json.dumps(dict(event, date_hosted=None, location='N')))
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(sorted(json.loads(res.data.decode())['errors']), ['date_hosted', 'location'])
+
+        # Updates may leave the date out and keep the stored one
+        res = self.client.put('/api/events/1', headers=headers3, content_type='application/json',
+                              data=json.dumps({'name': 'Bootcamp_two', 'category': '', 'location': '',
+                                               'description': ''}))
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(hosted_on.strftime('%d %b %Y'), json.loads(res.data.decode())['event']['date_hosted'])
+
     def test_successful_event_update(self):
         """
         Test that a user can update an event successfully provided that it is the user who created the event
@@ -277,7 +383,7 @@ class EventTestCase(unittest.TestCase):
                 'name': 'BootCamp Uganda',
                 'category': 'Learning',
                 'location': 'Uganda',
-                'date_hosted': '8-8-2019',
+                'date_hosted': '8-8-2099',
                 'description': 'This is the best learning experience'
             }
         ), content_type='application/json')
@@ -306,7 +412,7 @@ class EventTestCase(unittest.TestCase):
                 'name': 'Self Learning clinic',
                 'category': '',
                 'location': 'Nairobi',
-                'date_hosted': '8-8-2019',
+                'date_hosted': '8-8-2099',
                 'description': ''
             }
         ), content_type='application/json')
@@ -349,7 +455,7 @@ class EventTestCase(unittest.TestCase):
                 'name': 'BootCamp Uganda',
                 'category': 'Learning',
                 'location': 'Uganda',
-                'date_hosted': '8-8-2019',
+                'date_hosted': '8-8-2099',
                 'description': 'This is the best learning experience'
             }
         ), content_type='application/json')
@@ -375,7 +481,7 @@ class EventTestCase(unittest.TestCase):
                 'name': 'BootCamp Uganda',
                 'category': 'Learning',
                 'location': 'Uganda',
-                'date_hosted': '8-8-2019',
+                'date_hosted': '8-8-2099',
                 'description': 'This is the best learning experience'
             }
         ), content_type='application/json')
@@ -623,6 +729,528 @@ class EventTestCase(unittest.TestCase):
         events = json.loads(result.data.decode())['events']
         self.assertEqual(4, len(events))
 
+    def test_event_listings_match_the_entity_representation(self):
+        """
+        Test that listings built from column tuples give the same events as jsonify of the entities, whichever
+        JSON encoder is used
+        :return:
+        """
+        self.register_user1()
+        result = self.login_user1()
+        headers3 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.client.post('/api/events', headers=headers3, data=self.event1_data, content_type='application/json')
+        self.client.post('/api/events', headers=headers3, data=self.event3_data, content_type='application/json')
+        expected = [json.loads(json.dumps({
+            'id': s_event.id, 'name': s_event.name, 'category': s_event.category, 'location': s_event.location,
+            'date_hosted': s_event.date_hosted, 'description': s_event.description,
+            'rsvp_count': s_event.rsvp_count, 'capacity': s_event.capacity}))
+            for s_event in Event.query.order_by(Event.id)]
+
+        for fast_json in (True, False):
+            self.app.config['FAST_JSON'] = fast_json
+            result = self.client.get('/api/events')
+            self.assertEqual(json.loads(result.data.decode())['events'], expected)
+            result = self.client.get('/api/event/2', headers=headers3)
+            self.assertEqual(json.loads(result.data.decode())['event'], expected[1])
+
+    def test_public_listings_are_cached_until_their_events_change(self):
+        """
+        Test that listing and search responses are served from the response cache, with either backend, until a
+        change to an event they show invalidates them
+        :return:
+        """
+        self.register_user1()
+        result = self.login_user1()
+        headers3 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.register_user2()
+        result = self.login_user2()
+        headers4 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.client.post('/api/events', headers=headers3, data=self.event1_data, content_type='application/json')
+        self.client.post('/api/events', headers=headers3, data=self.event3_data, content_type='application/json')
+
+        def names(url):
+            result = self.client.post(url) if url.startswith('/api/search') else self.client.get(url)
+            return [s_event['name'] for s_event in json.loads(result.data.decode())['events']]
+
+        for backend in (MemoryBackend(), RedisBackend(RedisStandIn())):
+            self.app.extensions['response_cache'] = backend
+            self.assertEqual(names('/api/events'), ['Bootcamp', 'Sepetuka'])
+            self.assertEqual(names('/api/search?q=Bootcamp'), ['Bootcamp'])
+            # Changes made behind the application's back are not seen while the responses are cached
+            db.session.execute("UPDATE events SET name = 'Hidden'")
+            db.session.commit()
+            self.assertEqual(names('/api/events'), ['Bootcamp', 'Sepetuka'])
+            self.assertEqual(names('/api/search?q=Bootcamp'), ['Bootcamp'])
+
+            # A reservation to the second event invalidates the listing showing it but not the search
+            self.client.post('/api/event/2/rsvp', headers=headers4)
+            self.assertEqual(names('/api/events'), ['Hidden', 'Hidden'])
+            self.assertEqual(names('/api/search?q=Bootcamp'), ['Bootcamp'])
+            # An update invalidates every search
+            self.client.put('/api/events/1', headers=headers3, data=json.dumps(
+                {'name': 'Bootcamp Again', 'category': '', 'location': '', 'date_hosted': '', 'description': ''}),
+                content_type='application/json')
+            self.assertEqual(names('/api/search?q=Bootcamp'), ['Bootcamp Again'])
+            self.assertEqual(names('/api/events'), ['Bootcamp Again', 'Hidden'])
+
+            db.session.execute("UPDATE events SET name = CASE id WHEN 1 THEN 'Bootcamp' ELSE 'Sepetuka' END")
+            db.session.execute("DELETE FROM rsvps")
+            db.session.execute("UPDATE events SET rsvp_count = 0")
+            db.session.commit()
+
+        # The redis backend is configured by name, redis is one of the requirements
+        self.app.config['RESPONSE_CACHE_BACKEND'] = 'redis'
+        response_cache.init_app(self.app)
+        self.assertIsInstance(self.app.extensions['response_cache'], RedisBackend)
+
+    def test_reads_go_to_replicas_except_right_after_the_clients_own_writes(self):
+        """
+        Test that read only views query a replica while writes and the reads of a client that just wrote go to the
+        primary. A second database stands in for the replica
+        :return:
+        """
+        replica_url = make_url(self.app.config['SQLALCHEMY_DATABASE_URI'])
+        replica_url.database += '_replica'
+        server = create_engine(self.app.config['SQLALCHEMY_DATABASE_URI']).execution_options(
+            isolation_level='AUTOCOMMIT')
+        if not server.scalar(text('SELECT 1 FROM pg_database WHERE datname = :name'), name=replica_url.database):
+            server.execute('CREATE DATABASE "{}"'.format(replica_url.database))
+        server.dispose()
+        self.app.config['SQLALCHEMY_REPLICA_URIS'] = [str(replica_url), str(replica_url)]
+        self.app.extensions['response_cache'] = None
+        replica = replica_router.engines()[0]
+        db.Model.metadata.drop_all(replica)
+        db.Model.metadata.create_all(replica)
+
+        self.register_user1()
+        result = self.login_user1()
+        headers3 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.client.post('/api/events', headers=headers3, data=self.event1_data, content_type='application/json')
+        # The replica lags behind with an older name
+        replica.execute("INSERT INTO users (id, username, email) VALUES (1, 'Felix', 'felix@gmail.com')")
+        replica.execute("INSERT INTO events (id, name, category, location, owner, description) "
+                        "VALUES (1, 'Lagging', 'Learning', 'Nairobi', 1, 'Not replicated yet')")
+
+        def names(url, headers=None):
+            result = self.client.get(url, headers=headers)
+            data = json.loads(result.data.decode())
+            return [s_event['name'] for s_event in data['events']] if 'events' in data else [data['event']['name']]
+
+        self.assertEqual(names('/api/events'), ['Lagging'])
+        # The client that created the event reads it from the primary for a while
+        self.assertEqual(names('/api/events', headers3), ['Bootcamp'])
+        self.assertEqual(names('/api/event/1', headers3), ['Bootcamp'])
+        self.app.extensions['replica_router']['writers'].clear()
+        self.assertEqual(names('/api/event/1', headers3), ['Lagging'])
+
+        first, second = replica_router.engines()
+        with self.app.test_request_context('/api/events'):
+            self.assertEqual({replica_router.choose(), replica_router.choose()}, {first, second})
+            self.app.config['REPLICA_POLICY'] = 'least_loaded'
+            connection = first.connect()
+            self.assertEqual([replica_router.choose(), replica_router.choose()], [second, second])
+            connection.close()
+        first.dispose()
+        second.dispose()
+
+    def test_asgi_read_endpoints_answer_like_the_flask_views(self):
+        """
+        Test that the asyncio variant of the read endpoints gives the same responses as the flask views
+        :return:
+        """
+        self.register_user1()
+        result = self.login_user1()
+        headers3 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.register_user2()
+        result = self.login_user2()
+        headers4 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        for event_data in (self.event1_data, self.event2_data, self.event3_data):
+            self.client.post('/api/events', headers=headers3, data=event_data, content_type='application/json')
+        self.client.post('/api/event/1/rsvp', headers=headers4)
+
+        loop = asyncio.get_event_loop()
+        asgi = EventsASGI(self.app)
+        inbox, outbox = asyncio.Queue(), asyncio.Queue()
+        lifespan = loop.create_task(asgi({'type': 'lifespan'}, inbox.get, outbox.put))
+        inbox.put_nowait({'type': 'lifespan.startup'})
+        self.assertEqual(loop.run_until_complete(outbox.get()), {'type': 'lifespan.startup.complete'})
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        def asgi_request(method, url, headers):
+            path, _, query = url.partition('?')
+            messages = []
+            scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+                     'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()]}
+            loop.run_until_complete(asgi(scope, receive, asyncio.coroutine(messages.append)))
+            return messages[0]['status'], json.loads(messages[1]['body'].decode())
+
+        requests = [('GET', '/api/events', {}), ('GET', '/api/events/page=2&limit=2', {}),
+                    ('GET', '/api/events?cursor=&limit=2', {}), ('GET', '/api/events?cursor=&limit=0', {}),
+                    ('GET', '/api/events?cursor=&limit=-1', {}), ('GET', '/api/events/page=0', {}),
+                    ('GET', '/api/events/page=1&limit=0', {}), ('POST', '/api/search/page=0', {}),
+                    ('POST', '/api/search?q=Bootcamp', {}),
+                    ('POST', '/api/search/page=1&limit=1?q=Bootcamp', {}), ('GET', '/api/event/2', headers3),
+                    ('GET', '/api/event/2', headers4), ('GET', '/api/event/2', {}),
+                    ('GET', '/api/event/1/rsvp', headers3), ('GET', '/api/event/1/rsvp', headers4)]
+        try:
+            for method, url, headers in requests:
+                result = self.client.open(url, method=method, headers=headers)
+                self.assertEqual(asgi_request(method, url, headers),
+                                 (result.status_code, json.loads(result.data.decode())), url)
+        finally:
+            inbox.put_nowait({'type': 'lifespan.shutdown'})
+            loop.run_until_complete(lifespan)
+
+    def test_pooled_connections_killed_by_the_server_are_replaced(self):
+        """
+        Test that a pooled connection closed by the database is replaced when it is checked out and that the pool
+        reports it
+        :return:
+        """
+        db.session.remove()
+        first, second = db.engine.connect(), db.engine.connect()
+        pid = first.scalar('SELECT pg_backend_pid()')
+        first.close()
+        # The first connection dies while idle in the pool, next in line to be checked out
+        second.execute(text('SELECT pg_terminate_backend(:pid)'), pid=pid)
+        second.close()
+        self.assertEqual(db.pool_metrics()['checked_out'], 0)
+
+        self.register_user1()
+        result = self.login_user1()
+        self.assertEqual(result.status_code, 200)
+        metrics = db.pool_metrics()
+        self.assertEqual(metrics['reconnects'], 1)
+        self.assertEqual(metrics['timeouts'], 0)
+        self.assertGreater(metrics['checkouts'], 2)
+
+    def test_event_listings_answer_conditional_requests(self):
+        """
+        Test that listings are not sent again to a client holding their ETag while no event changed and are once one
+        does
+        :return:
+        """
+        self.register_user1()
+        result = self.login_user1()
+        headers3 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.client.post('/api/events', headers=headers3, data=self.event1_data, content_type='application/json')
+
+        result = self.client.get('/api/events')
+        self.assertEqual(result.status_code, 200)
+        etag, last_modified = result.headers['ETag'], result.headers['Last-Modified']
+        result = self.client.get('/api/events', headers={'If-None-Match': etag})
+        self.assertEqual(result.status_code, 304)
+        self.assertEqual(result.data, b'')
+        # If-Modified-Since alone cannot tell changes made within the same second apart, the listing is sent
+        result = self.client.get('/api/events', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(result.status_code, 200)
+
+        # Listings fetched with credentials get their own ETag
+        result = self.client.get('/api/my_events', headers=headers3)
+        self.assertNotEqual(result.headers['ETag'], etag)
+        result = self.client.get('/api/my_events', headers=dict(headers3, **{'If-None-Match': result.headers['ETag']}))
+        self.assertEqual(result.status_code, 304)
+
+        # Creating an event changes the version
+        self.client.post('/api/events', headers=headers3, data=self.event2_data, content_type='application/json')
+        result = self.client.get('/api/events', headers={'If-None-Match': etag})
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(len(json.loads(result.data.decode())['events']), 2)
+        self.assertNotEqual(result.headers['ETag'], etag)
+
+    def test_cursor_pagination_of_all_events(self):
+        """
+        Test that passing a cursor pages through all the events by date without repeating or skipping any
+        :return:
+        """
+        # Register user
+        self.register_user1()
+        # login user
+        result = self.login_user1()
+        # Get the token generated
+        access_token1 = json.loads(result.data.decode())['token']
+        headers3 = {'Authorization': 'Bearer ' + access_token1}
+
+        # User one creates four events
+        for event_data in (self.event1_data, self.event2_data, self.event3_data, self.event4_data):
+            self.client.post('/api/events', headers=headers3, data=event_data, content_type='application/json')
+
+        # The first page is requested with an empty cursor
+        result = self.client.get('/api/events?cursor=&limit=3')
+        page1 = json.loads(result.data.decode())
+        self.assertEqual(3, len(page1['events']))
+        self.assertIsNotNone(page1['next_cursor'])
+
+        # The next cursor returns the remaining event and no further cursor
+        result = self.client.get('/api/events?limit=3&cursor=' + page1['next_cursor'])
+        page2 = json.loads(result.data.decode())
+        self.assertEqual(1, len(page2['events']))
+        self.assertIsNone(page2['next_cursor'])
+        ids = [s_event['id'] for s_event in page1['events'] + page2['events']]
+        self.assertEqual(sorted(ids), [1, 2, 3, 4])
+
+        # The same works for the events of an individual
+        result = self.client.get('/api/my_events?cursor=&limit=2', headers=headers3)
+        page = json.loads(result.data.decode())
+        self.assertEqual(2, len(page['events']))
+        self.assertIsNotNone(page['next_cursor'])
+
+        # Limits below one still return a page of one event
+        for limit in ('0', '-5'):
+            result = self.client.get('/api/events?cursor=&limit=' + limit)
+            self.assertEqual(result.status_code, 200)
+            self.assertEqual(1, len(json.loads(result.data.decode())['events']))
+
+        # Without a cursor pages below one are the first page and limits below one show one event
+        for url in ('/api/events/page=0', '/api/my_events/page=0'):
+            result = self.client.get(url, headers=headers3)
+            self.assertEqual(result.status_code, 200)
+            self.assertEqual(4, len(json.loads(result.data.decode())['events']))
+        result = self.client.get('/api/events/page=1&limit=0')
+        self.assertEqual(1, len(json.loads(result.data.decode())['events']))
+
+        # A tampered cursor is rejected
+        result = self.client.get('/api/events?cursor=not-a-cursor')
+        self.assertEqual(result.status_code, 400)
+
+    def test_event_counters_follow_creation_and_deletion(self):
+        """
+        Test that the per owner and global event counters are kept in step with created and deleted events
+        :return:
+        """
+        # Register user
+        self.register_user1()
+        # login user
+        result = self.login_user1()
+        # Get the token generated
+        access_token1 = json.loads(result.data.decode())['token']
+        headers3 = {'Authorization': 'Bearer ' + access_token1}
+
+        # User one creates two events and deletes one of them
+        self.client.post('/api/events', headers=headers3, data=self.event1_data, content_type='application/json')
+        self.client.post('/api/events', headers=headers3, data=self.event2_data, content_type='application/json')
+        self.client.delete('/api/events/1', headers=headers3)
+
+        user = UserAccounts.get_specific_user('felix@gmail.com')
+        self.assertEqual(1, user.get_number_of_events())
+        self.assertEqual(1, UserAccounts.get_number_of_all_users_events())
+
+    def test_bulk_import_of_events(self):
+        """
+        Test that events are imported from CSV and NDJSON uploads in batches and that every rejected row is reported
+        :return:
+        """
+        self.register_user1()
+        result = self.login_user1()
+        headers3 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.client.post('/api/events', headers=headers3, data=self.event1_data, content_type='application/json')
+        self.app.config['IMPORT_BATCH_SIZE'] = 2
+
+        upload = '\n'.join([
+            'name,category,location,date_hosted,description,capacity',
+            'Bootcamp,Learning,Nairobi,8-8-2099,Already created,',
+            'Hackathon,Learning,Kisumu,2099-01-01,"Two days, one night",50',
+            'Hackathon,Learning,Kisumu,2099-01-01,Repeated in the same batch,',
+            'Bad name!,Learning,Kisumu,2099-01-01,,',
+            'Meetup,Social,Mombasa,1-1-2000,Past,',
+            'Meetup,Social,Mombasa,2099-02-01,,none',
+            'Hackathon,Learning,Kisumu,2099-01-01,Repeated in a later batch,',
+            'Meetup,Social,Mombasa,2099-02-01,,',
+        ]) + '\n'
+        result = self.client.post('/api/events/import', headers=headers3, data=upload, content_type='text/csv')
+        self.assertEqual(result.status_code, 200)
+        report = json.loads(result.data.decode())
+        self.assertEqual((report['created'], report['duplicates'], report['invalid']), (2, 3, 3))
+        self.assertEqual([(error['line'], error['message']) for error in report['errors']], [
+            (2, 'The event already exists'), (4, 'The event already exists'),
+            (5, 'The event name should only contain alphanumeric characters,an underscore and be at least 5 '
+                'characters in length without any empty spaces and special characters'),
+            (6, 'The event cannot have a past date as the date it is going to be hosted'),
+            (7, 'The capacity should be a whole number of at least 1'), (8, 'The event already exists')])
+        self.assertIn('name', report['errors'][2]['errors'])
+
+        # NDJSON, sent as a form file, goes through the same checks
+        upload = '\n'.join([json.dumps({'name': 'Workshop', 'category': 'Learning', 'location': 'Nakuru',
+                                        'date_hosted': '2099-03-01', 'capacity': 10}), '', 'not json', '[1, 2]'])
+        result = self.client.post('/api/events/import', headers=headers3,
+                                  data={'file': (io.BytesIO(upload.encode()), 'events.ndjson')})
+        report = json.loads(result.data.decode())
+        self.assertEqual((report['created'], report['duplicates'], report['invalid']), (1, 0, 2))
+        self.assertEqual([(error['line'], error['message']) for error in report['errors']], [
+            (3, 'The line is not valid JSON'), (4, 'Every line should be a JSON object')])
+
+        result = self.client.get('/api/events?limit=10&cursor=', headers=headers3)
+        events = json.loads(result.data.decode())['events']
+        self.assertEqual(sorted((event['name'], event['capacity']) for event in events),
+                         [('Bootcamp', None), ('Hackathon', 50), ('Meetup', None), ('Workshop', 10)])
+        self.assertEqual(4, UserAccounts.get_specific_user('felix@gmail.com').get_number_of_events())
+        result = self.client.post('/api/search?q=Workshop')
+        self.assertEqual(json.loads(result.data.decode())['total'], 1)
+
+        # Values longer than their columns are reported with their line and do not stop the other rows
+        upload = '\n'.join(['name,category,location,date_hosted,description',
+                            'Conference,Learning,Eldoret,2099-04-01,' + 'd' * 181,
+                            'N' * 70 + ',Learning,Eldoret,2099-04-01,',
+                            'Conference,Learning,Eldoret,2099-04-01,Fits'])
+        result = self.client.post('/api/events/import', headers=headers3, data=upload, content_type='text/csv')
+        self.assertEqual(result.status_code, 200)
+        report = json.loads(result.data.decode())
+        self.assertEqual((report['created'], report['invalid']), (1, 2))
+        self.assertEqual([(error['line'], list(error['errors'])) for error in report['errors']],
+                         [(2, ['description']), (3, ['name'])])
+
+        result = self.client.post('/api/events/import', headers=headers3, data='', content_type='text/csv')
+        self.assertEqual(result.status_code, 400)
+        result = self.client.post('/api/events/import', headers=headers3, data='{}', content_type='application/json')
+        self.assertEqual(result.status_code, 400)
+
+    def test_export_of_events_and_reservations(self):
+        """
+        Test that events and reservations are exported as gzip compressed NDJSON or CSV and that exports resume
+        :return:
+        """
+        self.register_user1()
+        result = self.login_user1()
+        headers3 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.register_user2()
+        result = self.login_user2()
+        headers4 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.client.post('/api/events', headers=headers3, data=self.event1_data, content_type='application/json')
+        self.client.post('/api/events', headers=headers4, data=self.event2_data, content_type='application/json')
+        self.client.post('/api/events', headers=headers3, data=self.event3_data, content_type='application/json')
+        self.client.post('/api/event/1/rsvp', headers=headers4)
+        self.client.post('/api/event/2/rsvp', headers=headers3)
+
+        def export(headers, **args):
+            result = self.client.get('/api/events/export', headers=headers, query_string=args)
+            self.assertEqual(result.status_code, 200)
+            self.assertEqual(result.mimetype, 'application/gzip')
+            return gzip.decompress(result.data).decode()
+
+        events = [json.loads(line) for line in export(headers3).splitlines()]
+        self.assertEqual([(event['id'], event['name'], event['owner']) for event in events],
+                         [(1, 'Bootcamp', 1), (3, 'Sepetuka', 1)])
+        self.assertEqual(events[0]['date_hosted'], '2099-08-08')
+        events = [json.loads(line) for line in export(headers3, after=1).splitlines()]
+        self.assertEqual([event['id'] for event in events], [3])
+
+        # Reservations made by the user and to the user's events
+        rows = list(csv.DictReader(io.StringIO(export(headers3, kind='rsvps', format='csv'))))
+        self.assertEqual([(row['event_id'], row['user_id'], row['username']) for row in rows],
+                         [('1', '2', 'Testcase'), ('2', '1', 'Felix')])
+        self.assertEqual(export(headers3, kind='rsvps', after='1:2').count('\n'), 1)
+
+        # An export is imported again as it is
+        upload = export(headers3, format='csv').replace('Bootcamp', 'Bootcamp_copy').replace('Sepetuka', 'Mkutano')
+        result = self.client.post('/api/events/import', headers=headers4, data=upload, content_type='text/csv')
+        self.assertEqual(json.loads(result.data.decode())['created'], 2)
+
+        result = self.client.get('/api/events/export?scope=all', headers=headers3)
+        self.assertEqual(result.status_code, 403)
+        for query in ('kind=users', 'format=xml', 'kind=rsvps&after=1', 'after=x'):
+            result = self.client.get('/api/events/export?' + query, headers=headers3)
+            self.assertEqual(result.status_code, 400)
+
+        UserAccounts.get_specific_user('felix@gmail.com').is_admin = True
+        db.session.commit()
+        token_cache.invalidate_user(1)
+        self.assertEqual(export(headers3, scope='all').count('\n'), 5)
+
+    def test_bulk_update_and_deletion_of_events(self):
+        """
+        Test that many events are updated and deleted at once with a status for every event
+        :return:
+        """
+        self.register_user1()
+        result = self.login_user1()
+        headers3 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.register_user2()
+        result = self.login_user2()
+        headers4 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.register_user3()
+        result = self.client.post('/api/auth/login', data=self.user3_data, content_type='application/json')
+        headers5 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.client.post('/api/events', headers=headers3, data=self.event1_data, content_type='application/json')
+        self.client.post('/api/events', headers=headers4, data=self.event2_data, content_type='application/json')
+        self.client.post('/api/events', headers=headers3, data=self.event3_data, content_type='application/json')
+        self.client.post('/api/events', headers=headers3, data=self.event4_data, content_type='application/json')
+        self.client.post('/api/event/3/rsvp', headers=headers4)
+        self.client.post('/api/event/3/rsvp', headers=headers5)
+
+        def statuses(result):
+            self.assertEqual(result.status_code, 200)
+            return [(event['id'], event['status']) for event in json.loads(result.data.decode())['events']]
+
+        result = self.client.patch('/api/events', headers=headers3, content_type='application/json',
+                                   data=json.dumps({'ids': [1, 3, 2, 99, 1], 'location': 'Kampala',
+                                                    'date_hosted': '2099-12-01'}))
+        self.assertEqual(json.loads(result.data.decode())['updated'], 2)
+        self.assertEqual(statuses(result), [(1, 'updated'), (3, 'updated'), (2, 'forbidden'), (99, 'event_not_found')])
+        event = json.loads(self.client.get('/api/event/3', headers=headers3).data.decode())['event']
+        self.assertEqual((event['name'], event['location'], event['date_hosted']),
+                         ('Sepetuka', 'Kampala', 'Tue, 01 Dec 2099 00:00:00 GMT'))
+
+        result = self.client.patch('/api/events', headers=headers3, content_type='application/json',
+                                   data=json.dumps({'ids': [1, 3], 'capacity': 1}))
+        self.assertEqual(statuses(result), [(1, 'updated'), (3, 'below_reservations')])
+
+        # Changes that would turn events into duplicates of each other are only applied to the first of them
+        result = self.client.patch('/api/events', headers=headers3, content_type='application/json',
+                                   data=json.dumps({'ids': [1, 3, 4], 'name': 'Season_opener',
+                                                    'category': 'Festival', 'date_hosted': '2099-06-01'}))
+        self.assertEqual(statuses(result), [(1, 'updated'), (3, 'duplicate'), (4, 'duplicate')])
+        result = self.client.post('/api/search?q=Season_opener')
+        self.assertEqual([event['id'] for event in json.loads(result.data.decode())['events']], [1])
+
+        for body in ({'ids': [1]}, {'ids': [], 'name': 'Season_opener'}, {'ids': ['one'], 'name': 'Season_opener'},
+                     {'ids': [1], 'date_hosted': '1-1-2000'}):
+            result = self.client.patch('/api/events', headers=headers3, content_type='application/json',
+                                       data=json.dumps(body))
+            self.assertEqual(result.status_code, 400)
+
+        # Events are deleted together with their reservations
+        result = self.client.delete('/api/events', headers=headers3, content_type='application/json',
+                                    data=json.dumps({'ids': [1, 2, 3, 99]}))
+        self.assertEqual(json.loads(result.data.decode())['deleted'], 2)
+        self.assertEqual(statuses(result), [(1, 'deleted'), (2, 'forbidden'), (3, 'deleted'),
+                                            (99, 'event_not_found')])
+        result = self.client.get('/api/my_events', headers=headers3)
+        self.assertEqual([event['id'] for event in json.loads(result.data.decode())['events']], [4])
+        self.assertEqual(1, UserAccounts.get_specific_user('felix@gmail.com').get_number_of_events())
+        self.assertEqual(2, UserAccounts.get_number_of_all_users_events())
+
+    def test_requests_are_measured_and_served_as_metrics(self):
+        """
+        Test that latency, SQL statements and serialization time are reported per endpoint and per response
+        :return:
+        """
+        self.register_user1()
+        result = self.login_user1()
+        headers3 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.client.post('/api/events', headers=headers3, data=self.event1_data, content_type='application/json')
+        self.app.config['METRICS_SERVER_TIMING'] = True
+
+        result = self.client.get('/api/my_events', headers=headers3)
+        timings = dict(part.strip().split(';', 1) for part in result.headers['Server-Timing'].split(','))
+        self.assertEqual(sorted(timings), ['app', 'db', 'serialize'])
+        # The cached token skips the user lookup, the change version and the page of events are left
+        self.assertIn('desc="2 queries"', timings['db'])
+        result = self.client.get('/api/events')
+        self.assertIn('serialize;dur=', result.headers['Server-Timing'])
+
+        result = self.client.get('/metrics')
+        self.assertEqual(result.status_code, 200)
+        self.assertTrue(result.content_type.startswith('text/plain; version=0.0.4'))
+        lines = result.data.decode().splitlines()
+        labels = 'endpoint="events.get_an_individuals_all_events"'
+        self.assertIn('http_request_duration_seconds_count{%s,method="GET",status="200"} 1' % labels, lines)
+        self.assertIn('db_queries_per_request_bucket{%s,le="2"} 1' % labels, lines)
+        self.assertIn('db_queries_per_request_bucket{%s,le="1"} 0' % labels, lines)
+        self.assertIn('response_serialization_seconds_count{endpoint="events.get_all_events"} 1', lines)
+        self.assertIn('# TYPE db_pool_checkouts counter', lines)
+
     def test_making_reservations_to_an_event_successfully(self):
         """
         Test making a successful reservation to an event
@@ -726,6 +1354,179 @@ class EventTestCase(unittest.TestCase):
         events = json.loads(result.data.decode())['Attendants']
         self.assertEqual(2, len(events))
 
+    def test_bulk_reservations(self):
+        """
+        Test that many reservations are made at once, each with its own outcome, and that nobody can reserve
+        places for other users
+        :return:
+        """
+        self.register_user1()
+        result = self.login_user1()
+        headers3 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.register_user2()
+        result = self.login_user2()
+        headers4 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.client.post('/api/events', headers=headers3, data=self.event1_data, content_type='application/json')
+        self.client.post('/api/events', headers=headers4, data=self.event2_data, content_type='application/json')
+
+        reservations = [{'event_id': 1}, {'event_id': 2}, {'event_id': 1}, {'event_id': 99}]
+        result = self.client.post('/api/events/rsvps', headers=headers4, content_type='application/json',
+                                  data=json.dumps({'reservations': reservations}))
+        self.assertEqual(result.status_code, 200)
+        data = json.loads(result.data.decode())
+        self.assertEqual(data['reserved'], 2)
+        self.assertEqual([(reservation['event_id'], reservation['status']) for reservation in data['reservations']],
+                         [(1, 'reserved'), (2, 'reserved'), (99, 'event_not_found')])
+
+        # Reserving again changes nothing
+        result = self.client.post('/api/events/rsvps', headers=headers4, content_type='application/json',
+                                  data=json.dumps({'reservations': [{'event_id': 1}]}))
+        self.assertEqual(json.loads(result.data.decode())['reservations'][0]['status'], 'already_reserved')
+        result = self.client.get('/api/event/1/rsvp', headers=headers3)
+        self.assertEqual(['Testcase'], [attendant['username']
+                                         for attendant in json.loads(result.data.decode())['Attendants']])
+
+        # Not even the owner of an event can reserve places at it for other users
+        self.register_user3()
+        result = self.client.post('/api/events/rsvps', headers=headers3, content_type='application/json',
+                                  data=json.dumps({'reservations': [{'event_id': 1, 'user_id': 3}]}))
+        self.assertEqual(result.status_code, 400)
+        result = self.client.get('/api/event/1/rsvp', headers=headers3)
+        self.assertEqual(1, len(json.loads(result.data.decode())['Attendants']))
+
+        result = self.client.post('/api/events/rsvps', headers=headers4, content_type='application/json',
+                                  data=json.dumps({'reservations': [{'name': 'Bootcamp'}]}))
+        self.assertEqual(result.status_code, 400)
+
+    def test_reservation_counts_and_capacity(self):
+        """
+        Test that events count their reservations, refuse reservations beyond their capacity and give a place
+        back when a reservation is cancelled
+        :return:
+        """
+        self.register_user1()
+        result = self.login_user1()
+        headers3 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.register_user2()
+        result = self.login_user2()
+        headers4 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.register_user3()
+        result = self.client.post('/api/auth/login', data=self.user3_data, content_type='application/json')
+        headers5 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        event = json.loads(self.event1_data)
+        event['capacity'] = 2
+        self.client.post('/api/events', headers=headers3, data=json.dumps(event), content_type='application/json')
+
+        statuses = []
+        for headers in (headers3, headers4, headers5):
+            result = self.client.post('/api/events/rsvps', headers=headers, content_type='application/json',
+                                      data=json.dumps({'reservations': [{'event_id': 1}]}))
+            statuses.append(json.loads(result.data.decode())['reservations'][0]['status'])
+        self.assertEqual(statuses, ['reserved', 'reserved', 'full'])
+        result = self.client.get('/api/events')
+        self.assertEqual(json.loads(result.data.decode())['events'][0]['rsvp_count'], 2)
+
+        # The capacity cannot drop below the reservations already made
+        update = dict(event, name='', category='', location='', description='', date_hosted='', capacity=1)
+        result = self.client.put('/api/events/1', headers=headers3, data=json.dumps(update),
+                                 content_type='application/json')
+        self.assertIn(b'The capacity cannot be lower than the number of reservations', result.data)
+
+        # User two cancels and the place can be taken again
+        self.assertEqual(self.client.delete('/api/event/1/rsvp', headers=headers4).status_code, 200)
+        self.assertEqual(self.client.delete('/api/event/1/rsvp', headers=headers4).status_code, 404)
+        self.assertEqual(self.client.post('/api/event/1/rsvp', headers=headers4).status_code, 201)
+        result = self.client.get('/api/event/1', headers=headers3)
+        self.assertEqual(json.loads(result.data.decode())['event']['rsvp_count'], 2)
+        result = self.client.post('/api/events/rsvps', headers=headers5, content_type='application/json',
+                                  data=json.dumps({'reservations': [{'event_id': 1}]}))
+        self.assertEqual(json.loads(result.data.decode())['reservations'][0]['status'], 'full')
+
+    def test_reservations_of_the_same_pair(self):
+        """
+        Test that a pair asked for twice takes one place and that a reservation racing one of the same pair is
+        reported as already made rather than as a full event
+        :return:
+        """
+        self.register_user1()
+        result = self.login_user1()
+        headers3 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.register_user2()
+        self.register_user3()
+        event = json.loads(self.event1_data)
+        event['capacity'] = 2
+        self.client.post('/api/events', headers=headers3, data=json.dumps(event), content_type='application/json')
+        self.client.post('/api/events', headers=headers3, data=self.event2_data, content_type='application/json')
+
+        self.assertEqual(Event.reserve([(2, 1), (2, 1), (3, 1)]), {(2, 1): 'reserved', (3, 1): 'reserved'})
+        self.assertEqual(Event.reserve([(1, 1)]), {(1, 1): 'full'})
+        db.session.commit()
+
+        # Another connection reserves user 2 a place at event 2 and holds the event row until it commits. The
+        # reservation made meanwhile does not see it, waits for the lock and then runs into the committed row
+        other = create_engine(self.app.config['SQLALCHEMY_DATABASE_URI'])
+        connection = other.connect()
+        transaction = connection.begin()
+        connection.execute(RESERVE_SQL, user_ids=[2], event_ids=[2])
+        outcome = {}
+
+        def reserve():
+            with self.app.app_context():
+                outcome.update(Event.reserve([(2, 2)]))
+                db.session.commit()
+                db.session.remove()
+
+        racing = threading.Thread(target=reserve)
+        racing.start()
+        try:
+            deadline = time.monotonic() + 10
+            while not other.scalar("SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock'"):
+                self.assertLess(time.monotonic(), deadline, 'The reservation never waited for the event row')
+                time.sleep(0.05)
+        finally:
+            transaction.commit()
+            racing.join()
+            connection.close()
+            other.dispose()
+        self.assertEqual(outcome, {(2, 2): 'already_reserved'})
+        result = self.client.get('/api/event/2', headers=headers3)
+        self.assertEqual(json.loads(result.data.decode())['event']['rsvp_count'], 1)
+
+    def test_attendees_are_paged_and_can_be_streamed(self):
+        """
+        Test that the owner of an event can page through its attendees with a cursor or download them at once
+        :return:
+        """
+        self.register_user1()
+        result = self.login_user1()
+        headers3 = {'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']}
+        self.register_user2()
+        self.register_user3()
+        self.client.post('/api/events', headers=headers3, data=self.event1_data, content_type='application/json')
+        for user_data in (self.user3_data, self.user1_data, self.user2_data):
+            result = self.client.post('/api/auth/login', data=user_data, content_type='application/json')
+            self.client.post('/api/event/1/rsvp',
+                             headers={'Authorization': 'Bearer ' + json.loads(result.data.decode())['token']})
+
+        emails, cursor = [], ''
+        while cursor is not None:
+            result = self.client.get('/api/event/1/rsvp?limit=2&cursor=' + cursor, headers=headers3)
+            data = json.loads(result.data.decode())
+            self.assertEqual(data['rsvp_count'], 3)
+            self.assertLessEqual(len(data['Attendants']), 2)
+            emails += [attendant['email'] for attendant in data['Attendants']]
+            cursor = data['next_cursor']
+        self.assertEqual(emails, ['felix@gmail.com', 'test@gmail.com', 'test1@gmail.com'])
+
+        result = self.client.get('/api/event/1/rsvp?stream=csv', headers=headers3)
+        self.assertEqual(result.mimetype, 'text/csv')
+        self.assertEqual(result.data.decode().splitlines(),
+                         ['username,email', 'Felix,felix@gmail.com', 'Testcase,test@gmail.com',
+                          'Testcase1,test1@gmail.com'])
+        result = self.client.get('/api/event/1/rsvp?stream=ndjson', headers=headers3)
+        self.assertEqual(len(result.data.decode().splitlines()), 3)
+        self.assertEqual(self.client.get('/api/event/1/rsvp?cursor=abc', headers=headers3).status_code, 400)
+
     def test_unsuccessful_access_to_reservations_not_created_by_current_user(self):
         """
         Test that a user cannot see reservations made to an event they did not create
@@ -855,6 +1656,102 @@ class EventTestCase(unittest.TestCase):
                                    content_type='application/json')
         self.assertIn(b'No such event Found', result1.data)
 
+    def test_search_index_follows_event_changes(self):
+        """
+        Test that search matches word prefixes, pages its results and reflects updated and deleted events
+        :return:
+        """
+        # Register user
+        self.register_user1()
+        # login user
+        result = self.login_user1()
+        # Get the token generated
+        access_token1 = json.loads(result.data.decode())['token']
+        headers3 = {'Authorization': 'Bearer ' + access_token1}
+
+        # User one creates three events
+        self.client.post('/api/events', headers=headers3, data=self.event1_data, content_type='application/json')
+        self.client.post('/api/events', headers=headers3, data=self.event2_data, content_type='application/json')
+        self.client.post('/api/events', headers=headers3, data=self.event3_data, content_type='application/json')
+
+        # A prefix of the category matches both learning events and the results are paged
+        result = self.client.post('/api/search/page=1&limit=1?q=learn', content_type='application/json')
+        data = json.loads(result.data.decode())
+        self.assertEqual(1, len(data['events']))
+        self.assertEqual(2, data['total'])
+
+        # The updated location is found and the old one is not
+        self.client.put('/api/events/3', headers=headers3, data=json.dumps(
+            {
+                'name': '',
+                'category': '',
+                'location': 'Kisumu',
+                'date_hosted': '8-8-2099',
+                'description': ''
+            }
+        ), content_type='application/json')
+        result = self.client.post('/api/search?q=kisumu', content_type='application/json')
+        self.assertEqual('Sepetuka', json.loads(result.data.decode())['events'][0]['name'])
+        result = self.client.post('/api/search?q=mombasa', content_type='application/json')
+        self.assertEqual(result.status_code, 404)
+
+        # A deleted event is no longer found
+        self.client.delete('/api/events/3', headers=headers3)
+        result = self.client.post('/api/search?q=kisumu', content_type='application/json')
+        self.assertEqual(result.status_code, 404)
+
+        # Pages and limits below one are refused
+        for url in ('/api/search/page=0&limit=1?q=learn', '/api/search/page=1&limit=0?q=learn'):
+            self.assertEqual(self.client.post(url, content_type='application/json').status_code, 400)
+
+        # A process starting with an empty index fills it from the events table
+        self.app.extensions['event_index'] = RamStorage().create_index(EventIndex.schema)
+        self.app.extensions['event_index_filled'] = False
+        result = self.client.post('/api/search?q=learn', content_type='application/json')
+        self.assertEqual(2, json.loads(result.data.decode())['total'])
+
+    def test_unfiltered_search_is_paginated_and_can_be_streamed(self):
+        """
+        Test that a search without a query honours page and limit and can stream every event instead
+        :return:
+        """
+        # Register user
+        self.register_user1()
+        # login user
+        result = self.login_user1()
+        # Get the token generated
+        access_token1 = json.loads(result.data.decode())['token']
+        headers3 = {'Authorization': 'Bearer ' + access_token1}
+
+        # User one creates three events
+        self.client.post('/api/events', headers=headers3, data=self.event1_data, content_type='application/json')
+        self.client.post('/api/events', headers=headers3, data=self.event2_data, content_type='application/json')
+        self.client.post('/api/events', headers=headers3, data=self.event3_data, content_type='application/json')
+
+        # The second page of two holds the last event
+        result = self.client.post('/api/search/page=2&limit=2', content_type='application/json')
+        events = json.loads(result.data.decode())['events']
+        self.assertEqual(['Sepetuka'], [s_event['name'] for s_event in events])
+
+        # Pages below one are the first page, like the event listings
+        result = self.client.post('/api/search/page=0&limit=2', content_type='application/json')
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(2, len(json.loads(result.data.decode())['events']))
+
+        # Every event is streamed as one JSON line
+        result = self.client.post('/api/search?stream=ndjson', content_type='application/json')
+        self.assertEqual(result.mimetype, 'application/x-ndjson')
+        lines = result.data.decode().splitlines()
+        self.assertEqual(['Bootcamp', 'Bootcamp_21', 'Sepetuka'], [json.loads(line)['name'] for line in lines])
+
+        # Or as a single JSON document
+        result = self.client.post('/api/search?stream=json', content_type='application/json')
+        self.assertEqual(3, len(json.loads(result.data.decode())['events']))
+
+        # An unknown format is rejected
+        result = self.client.post('/api/search?stream=xml', content_type='application/json')
+        self.assertEqual(result.status_code, 400)
+
     def tearDown(self):
         db.session.remove()
         db.drop_all()
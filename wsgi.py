@@ -0,0 +1,22 @@
+"""
+Entry point for production WSGI servers: gunicorn -c gunicorn_conf.py wsgi:app
+run.py starts Flask's single threaded development server instead
+"""
+import os
+
+from app import create_app, db
+from app.replicas import replica_router
+
+app = create_app(os.getenv('APP_SETTINGS', 'production'))
+
+
+def dispose_engines():
+    """
+    Drop the pooled connections of the primary and replica engines. Processes forked from one holding connections
+    would otherwise share their sockets
+    :return:
+    """
+    with app.app_context():
+        db.engine.dispose()
+        for engine in replica_router.engines():
+            engine.dispose()